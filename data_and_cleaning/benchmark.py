@@ -0,0 +1,289 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import first_preprocess
+from colab_preprocess import convert_commentary
+from comment_rules import DEFAULT_RULES, RESULT_PHRASES
+from data_io import ChunkWriter, write_table
+from dedup import Deduplicator
+from extract_user_studies import (iter_commented_positions, parse_studies, parse_studies_parallel, position_columns,
+                                  write_positions_in_chunks)
+from synthetic_corpus import write_pgn
+
+# name -> (kind, function); each function takes a Corpus and returns (callable to time, rows it handles)
+BENCHMARKS = {}
+
+def benchmark(name, kind="micro"):
+    """Registers a benchmark. Micro benchmarks time one function, macro ones a whole pipeline run."""
+    def register(func):
+        BENCHMARKS[name] = (kind, func)
+        return func
+    return register
+
+class Corpus:
+    """The synthetic data every benchmark draws from, built once per run and only as needed."""
+
+    def __init__(self, nodes, seed=0, workdir=None, language_rows=500):
+        self.nodes = nodes
+        self.seed = seed
+        self.workdir = workdir or tempfile.mkdtemp(prefix="natural_chess_bench_")
+        self.language_rows = language_rows
+        self._pgn_path = None
+        self._pgn = None
+        self._positions = None
+        self._training = None
+
+    @property
+    def pgn_path(self):
+        """The synthetic export, streamed to a file in the work directory."""
+        if self._pgn_path is None:
+            self._pgn_path = self.path("corpus.pgn")
+            write_pgn(self._pgn_path, self.nodes, self.seed)
+        return self._pgn_path
+
+    @property
+    def pgn(self):
+        """The export as one string, only for the benchmarks that time parsing text."""
+        if self._pgn is None:
+            with open(self.pgn_path, encoding="utf-8") as file:
+                self._pgn = file.read()
+        return self._pgn
+
+    @property
+    def positions(self):
+        """Extraction-shaped table parsed from the synthetic PGN."""
+        if self._positions is None:
+            with open(self.pgn_path, encoding="utf-8") as file:
+                self._positions = pd.DataFrame(iter_commented_positions(file))
+            self._positions["Username"] = "bench"
+        return self._positions
+
+    @property
+    def commentary(self):
+        return self.positions["Commentary"].tolist()
+
+    @property
+    def training(self):
+        """Input/Output table as the preprocessing passes write it, minus the language filter."""
+        if self._training is None:
+            df = first_preprocess.drop_null_commentary(self.positions)
+            df = first_preprocess.add_san_moves(df)
+            self._training = first_preprocess.build_training_columns(df)
+        return self._training
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+def clear_chess_caches():
+    first_preprocess.parse_board.cache_clear()
+    first_preprocess.convert_to_san.cache_clear()
+
+@benchmark("parse_studies")
+def bench_parse_studies(corpus):
+    pgn = corpus.pgn
+    return lambda: parse_studies(pgn), corpus.nodes
+
+@benchmark("parse_studies_parallel")
+def bench_parse_studies_parallel(corpus):
+    pgn = corpus.pgn
+    return lambda: parse_studies_parallel(pgn, workers=os.cpu_count()), corpus.nodes
+
+@benchmark("clean_eval_comments")
+def bench_clean_eval_comments(corpus):
+    comments = corpus.commentary
+    return lambda: [first_preprocess.clean_eval_comments(c) for c in comments], len(comments)
+
+@benchmark("keep_mask")
+def bench_keep_mask(corpus):
+    commentary = corpus.positions["Commentary"]
+    return lambda: DEFAULT_RULES.keep_mask(commentary), len(commentary)
+
+@benchmark("is_auto_generated")
+def bench_is_auto_generated(corpus):
+    comments = corpus.commentary
+    return lambda: [first_preprocess.is_auto_generated(c, RESULT_PHRASES) for c in comments], len(comments)
+
+@benchmark("auto_generated_mask")
+def bench_auto_generated_mask(corpus):
+    commentary = corpus.positions["Commentary"]
+    return lambda: DEFAULT_RULES.auto_generated_mask(commentary), len(commentary)
+
+@benchmark("convert_to_san")
+def bench_convert_to_san(corpus):
+    pairs = list(zip(corpus.positions["FEN"], corpus.positions["Move"]))
+
+    def run():
+        # Cold caches, so every repeat measures the same work
+        clear_chess_caches()
+        return [first_preprocess.convert_to_san(fen, move) for fen, move in pairs]
+    return run, len(pairs)
+
+@benchmark("convert_to_san_batch")
+def bench_convert_to_san_batch(corpus):
+    fens = corpus.positions["FEN"].tolist()
+    moves = corpus.positions["Move"].tolist()
+
+    def run():
+        clear_chess_caches()
+        return first_preprocess.convert_to_san_batch(fens, moves)
+    return run, len(fens)
+
+@benchmark("batch_process_language")
+def bench_batch_process_language(corpus):
+    # langdetect is by far the slowest step, so it runs on a fixed-size sample
+    texts = corpus.commentary[:corpus.language_rows]
+    return lambda: first_preprocess.batch_process_language(texts, workers=1), len(texts)
+
+@benchmark("deduplicate")
+def bench_deduplicate(corpus):
+    df = corpus.training
+
+    def run():
+        return Deduplicator(['Input', 'Output'], text_column='Output', source_columns=()).drop_duplicates(df)
+    return run, len(df)
+
+@benchmark("write_csv")
+def bench_write_csv(corpus):
+    df = corpus.training
+    return lambda: write_table(df, corpus.path("bench.csv")), len(df)
+
+@benchmark("write_parquet")
+def bench_write_parquet(corpus):
+    df = corpus.training
+    return lambda: write_table(df, corpus.path("bench.parquet")), len(df)
+
+@benchmark("convert_commentary_jsonl")
+def bench_convert_commentary(corpus):
+    table = corpus.path("commentary_input.parquet")
+    write_table(corpus.training, table)
+    return lambda: convert_commentary(table, corpus.path("bench.jsonl")), len(corpus.training)
+
+@benchmark("end_to_end", kind="macro")
+def bench_end_to_end(corpus):
+    """PGN file -> extraction table -> fused preprocessing (language on the prefiltered rows) -> JSONL.
+
+    The export is streamed through the parser into the table in chunks, as `extract --stream` does, so
+    memory stays flat at the 10M-node scale.
+    """
+    from fused_preprocess import preprocess_fused
+
+    def run():
+        # The language cache lives in the working directory; start each repeat without it
+        cwd = os.getcwd()
+        os.chdir(corpus.workdir)
+        try:
+            if os.path.exists(first_preprocess.LANGUAGE_CACHE_FILE):
+                os.remove(first_preprocess.LANGUAGE_CACHE_FILE)
+            write_pgn("e2e.pgn", corpus.nodes, corpus.seed)
+            with open("e2e.pgn", encoding="utf-8") as file, \
+                    ChunkWriter("e2e_studies.parquet", columns=position_columns()) as writer:
+                positions = (dict(position, Username="bench") for position in iter_commented_positions(file))
+                write_positions_in_chunks(positions, writer)
+            preprocess_fused("e2e_studies.parquet", "e2e_commentary.parquet")
+            first_preprocess.close_language_pool()
+            convert_commentary("e2e_commentary.parquet", "e2e_commentary.jsonl")
+        finally:
+            os.chdir(cwd)
+    return run, corpus.nodes
+
+def time_benchmark(func, repeat):
+    """Runs `func` `repeat` times with its output silenced; returns the timings in seconds."""
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+def measure(name, corpus, repeat):
+    """Sets up and times one benchmark; returns its result entry."""
+    kind, setup = BENCHMARKS[name]
+    with contextlib.redirect_stdout(io.StringIO()):
+        func, rows = setup(corpus)
+    timings = time_benchmark(func, repeat)
+    best = min(timings)
+    return {
+        "kind": kind,
+        "rows": rows,
+        "repeat": repeat,
+        "min_seconds": round(best, 6),
+        "median_seconds": round(statistics.median(timings), 6),
+        "rows_per_second": round(rows / best, 1) if best else None,
+    }
+
+def run_benchmarks(names=None, nodes=10_000, seed=0, repeat=3, kinds=("micro", "macro"), language_rows=500):
+    """Runs the selected benchmarks on one synthetic corpus; returns a results document."""
+    names = names or [name for name, (kind, _) in BENCHMARKS.items() if kind in kinds]
+    corpus = Corpus(nodes, seed, language_rows=language_rows)
+    results = {}
+    try:
+        for name in names:
+            result = results[name] = measure(name, corpus, repeat)
+            print(f"{name:<28}{result['kind']:>7}{result['rows']:>10}{result['min_seconds']:>11.4f}s"
+                  f"{result['rows_per_second'] or 0:>14.0f} rows/s")
+    finally:
+        shutil.rmtree(corpus.workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "nodes": nodes,
+            "seed": seed,
+            "language_rows": language_rows,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+def compare(current, baseline, threshold=0.2):
+    """Compares per-row time with a baseline. Returns {name: (ratio, status)}; a ratio above 1 + threshold
+    is a regression, below 1 - threshold an improvement."""
+    if current["meta"]["nodes"] != baseline["meta"]["nodes"]:
+        print(f"Note: baseline used {baseline['meta']['nodes']} nodes, this run {current['meta']['nodes']}; "
+              "comparing time per row")
+    comparison = {}
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or not base["rows"] or not result["rows"]:
+            continue
+        ratio = (result["min_seconds"] / result["rows"]) / (base["min_seconds"] / base["rows"])
+        status = "regression" if ratio > 1 + threshold else "improved" if ratio < 1 - threshold else "ok"
+        comparison[name] = (ratio, status)
+    print(f"\n{'Benchmark':<28}{'vs baseline':>12}  Status")
+    for name, (ratio, status) in comparison.items():
+        print(f"{name:<28}{ratio:>11.2f}x  {status}")
+    return comparison
+
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("benchmark")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark {unknown[0]!r}; choose from {', '.join(BENCHMARKS)}")
+
+    results = run_benchmarks(args.names, nodes=args.nodes, seed=args.seed, repeat=args.repeat,
+                             kinds=("micro",) if args.micro else ("micro", "macro"),
+                             language_rows=args.language_rows)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results saved to {args.save}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        comparison = compare(results, baseline, args.threshold)
+        if any(status == "regression" for _, status in comparison.values()):
+            sys.exit(1)
@@ -0,0 +1,46 @@
+import hashlib
+import json
+import os
+
+def content_hash(text):
+    """Returns the SHA-256 hex digest of a study's PGN text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_manifest(path):
+    """Loads the crawl manifest, or starts an empty one if it does not exist yet."""
+    if not os.path.exists(path):
+        return {"authors": {}}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def save_manifest(manifest, path):
+    """Writes the manifest atomically so a crash never leaves it half-written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def author_entry(manifest, username):
+    """Returns the manifest record for an author, creating it on first use."""
+    return manifest["authors"].setdefault(username, {"completed": False, "shard": None, "studies": {}})
+
+def studies_to_fetch(entry, studies):
+    """Returns the listed studies that are new or whose last-modified time changed since the last crawl."""
+    known = entry["studies"]
+    return [
+        study for study in studies
+        if study["id"] not in known or known[study["id"]].get("updated_at") != study.get("updatedAt")
+    ]
+
+def removed_studies(entry, studies):
+    """Returns IDs of studies recorded in the manifest that the author no longer lists."""
+    listed = {study["id"] for study in studies}
+    return [study_id for study_id in entry["studies"] if study_id not in listed]
+
+def record_study(entry, study_id, updated_at, digest, chapters):
+    """Records a fetched study's last-modified time, content hash and the chapter IDs its rows use."""
+    entry["studies"][study_id] = {
+        "updated_at": updated_at,
+        "sha256": digest,
+        "chapters": sorted(chapters),
+    }
@@ -1,10 +1,10 @@
-import pandas as pd
+import gzip
 import json
 import csv
+import os
 
-# Load the CSV file
-csv_file_path = 'natural_commentary.csv'
-data = pd.read_csv(csv_file_path)
+# pandas, NumPy and the table helpers are imported inside the functions that use them, so the
+# literacy conversion (plain csv/json) and importing this module stay fast
 
 # Define the template for the instruction prefix
 instruction_prefix = (
@@ -14,28 +14,158 @@ instruction_prefix = (
     "and potential plans for each side."
 )
 
-# Prepare the data for JSONL format
-output_data = []
-for _, row in data.iterrows():
-    fen = row['Input']  # Column holding the FEN
-    response = row['Output']  # Column holding the model's response
-    
-    instruction = f"{instruction_prefix} Here is the chess position described by the FEN: {fen}"
-    output_data.append({
-        "instruction": instruction,  # Keep as a separate field
-        "input": fen,                # Keep as a separate field
-        "response": response         # Keep as a separate field
-    })
-
-# Save the output as a JSONL file
-output_file_path = 'natural_commentary.jsonl'
-with open(output_file_path, 'w') as f:
-    for entry in output_data:
-        json.dump(entry, f)
-        f.write('\n')
-
-print(f"Converted dataset saved to {output_file_path}")
+# Rebuilds a record's instruction from the shared prefix and its own input
+instruction_template = "{instruction_prefix} Here is the chess position described by the FEN: {input}"
 
+def build_instruction(fen):
+    """The full per-record instruction, as stored in natural_commentary.jsonl."""
+    return instruction_template.format(instruction_prefix=instruction_prefix, input=fen)
+
+def quality_filter(input_file, min_score=None, scores_file=None):
+    """Batch filter keeping rows scored at least `min_score` by quality.py; a no-op without a threshold."""
+    if min_score is None:
+        return lambda batch: batch
+    from quality import ScoreFilter
+    return ScoreFilter(input_file, min_score, scores_file)
+
+def convert_commentary(input_file, output_file, batch_size=10_000, min_score=None, scores_file=None):
+    """Converts the commentary table to instruction/input/response JSONL, streaming it in chunks.
+
+    With `min_score`, only rows whose quality score (from quality.py) reaches it are converted.
+    """
+    from data_io import iter_batches
+    count = 0
+    keep = quality_filter(input_file, min_score, scores_file)
+    with open(output_file, 'w') as f:
+        for batch in iter_batches(input_file, batch_size=batch_size, columns=['Input', 'Output']):
+            batch = keep(batch)
+            for fen, response in zip(batch['Input'], batch['Output']):
+                # Input holds the FEN, Output holds the model's response
+                entry = {
+                    "instruction": build_instruction(fen),  # Keep as a separate field
+                    "input": fen,                           # Keep as a separate field
+                    "response": response                    # Keep as a separate field
+                }
+                json.dump(entry, f)
+                f.write('\n')
+                count += 1
+    print(f"Converted dataset saved to {output_file} ({count} records)")
+    return count
+
+class ShardWriter:
+    """Writes records to numbered shards of at most `max_shard_bytes` (uncompressed) each.
+
+    Shards are JSONL (optionally gzip-compressed) or Parquet. The list of shards is returned by close().
+    """
+
+    def __init__(self, output_dir, name, fmt="jsonl", compression="gzip", max_shard_bytes=64 * 1024 * 1024):
+        self.output_dir = output_dir
+        self.name = name
+        self.fmt = fmt
+        self.compression = compression
+        self.max_shard_bytes = max_shard_bytes
+        self.shards = []
+        self.handle = None
+        self.shard_bytes = 0
+        self.shard_records = 0
+
+    def shard_path(self):
+        if self.fmt == "parquet":
+            ext = ".parquet"
+        else:
+            ext = ".jsonl.gz" if self.compression == "gzip" else ".jsonl"
+        return os.path.join(self.output_dir, f"{self.name}-{len(self.shards):05d}{ext}")
+
+    def open_shard(self):
+        path = self.shard_path()
+        if self.fmt == "parquet":
+            from data_io import ChunkWriter
+            self.handle = ChunkWriter(path, compression=self.compression or "none")
+        elif self.compression == "gzip":
+            self.handle = gzip.open(path, "wt", encoding="utf-8")
+        else:
+            self.handle = open(path, "w", encoding="utf-8")
+        self.shards.append({"file": os.path.basename(path), "records": 0, "bytes": 0})
+        self.shard_bytes = 0
+        self.shard_records = 0
+
+    def close_shard(self):
+        if self.handle is None:
+            return
+        self.handle.close()
+        self.handle = None
+        self.shards[-1]["records"] = self.shard_records
+        self.shards[-1]["bytes"] = self.shard_bytes
+        path = os.path.join(self.output_dir, self.shards[-1]["file"])
+        self.shards[-1]["file_bytes"] = os.path.getsize(path)
+
+    def write(self, records):
+        """Writes a DataFrame of records, starting new shards as they fill up."""
+        import numpy as np
+        if self.fmt == "parquet":
+            # UTF-8 bytes of the values, so max_shard_bytes means the same as for JSONL
+            sizes = records.astype(str).apply(lambda column: column.str.encode("utf-8").str.len()).sum(axis=1).to_numpy()
+        else:
+            lines = [json.dumps(record, ensure_ascii=False) + "\n" for record in records.to_dict("records")]
+            sizes = np.array([len(line.encode("utf-8")) for line in lines])
+
+        start = 0
+        while start < len(sizes):
+            if self.handle is None:
+                self.open_shard()
+            # Take the rows that still fit; an empty shard always takes at least one
+            cumulative = np.cumsum(sizes[start:])
+            take = int(np.searchsorted(cumulative, self.max_shard_bytes - self.shard_bytes, side="right"))
+            if take == 0 and self.shard_records == 0:
+                take = 1
+            if take:
+                if self.fmt == "parquet":
+                    self.handle.write(records.iloc[start:start + take])
+                else:
+                    self.handle.write("".join(lines[start:start + take]))
+                self.shard_records += take
+                self.shard_bytes += int(cumulative[take - 1])
+                start += take
+            if start < len(sizes):
+                self.close_shard()
+
+    def close(self):
+        self.close_shard()
+        return self.shards
+
+def export_commentary_shards(input_file, output_dir, fmt="jsonl", compression="gzip",
+                             max_shard_bytes=64 * 1024 * 1024, batch_size=10_000, min_score=None, scores_file=None):
+    """Streams the commentary table into size-bounded shards plus an index.json.
+
+    Records only hold `input` and `response`; the instruction prefix is stored once in the index as
+    dataset metadata, and each record's instruction is `instruction_template` filled with its input.
+    `min_score` filters by quality score as in convert_commentary.
+    """
+    import pandas as pd
+    from data_io import iter_batches
+    os.makedirs(output_dir, exist_ok=True)
+    keep = quality_filter(input_file, min_score, scores_file)
+    writer = ShardWriter(output_dir, "natural_commentary", fmt, compression, max_shard_bytes)
+    for batch in iter_batches(input_file, batch_size=batch_size, columns=['Input', 'Output']):
+        batch = keep(batch)
+        writer.write(pd.DataFrame({"input": batch['Input'], "response": batch['Output']}))
+    shards = writer.close()
+
+    index = {
+        "format": fmt,
+        "compression": compression,
+        "fields": ["input", "response"],
+        "instruction_prefix": instruction_prefix,
+        "instruction_template": instruction_template,
+        "records": sum(shard["records"] for shard in shards),
+        "min_score": min_score,
+        "shards": shards,
+    }
+    index_path = os.path.join(output_dir, "index.json")
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    print(f"Exported {index['records']} records in {len(shards)} shards to {output_dir} (index: {index_path})")
+    return index
 
 def csv_to_jsonl_literacy(input_csv, output_jsonl):
     """
@@ -95,6 +225,24 @@ LITERACY_TRAIN_CSV = "train.csv"  # Replace with your train CSV file
 LITERACY_TEST_JSONL = "literacy_test.jsonl"  # Desired test JSONL output file
 LITERACY_TRAIN_JSONL = "literacy_train.jsonl"  # Desired train JSONL output file
 
-# Process both test and train datasets
-csv_to_jsonl_literacy(LITERACY_TEST_CSV, LITERACY_TEST_JSONL)
-csv_to_jsonl_literacy(LITERACY_TRAIN_CSV, LITERACY_TRAIN_JSONL)
+# Guarded so the pipeline runner can import these converters without running them
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("colab_preprocess")
+    args = parser.parse_args()
+
+    # Convert the commentary table (Parquet from second_preprocess.py; a .csv export also works)
+    commentary_file_path = 'natural_commentary.parquet'
+    output_file_path = 'natural_commentary.jsonl'
+    if args.shards:
+        export_commentary_shards(commentary_file_path, args.shards, fmt=args.format,
+                                 compression="gzip" if args.format == "jsonl" else "zstd",
+                                 max_shard_bytes=int(args.max_shard_mb * 1024 * 1024), min_score=args.min_score,
+                                 scores_file=args.scores)
+    else:
+        convert_commentary(commentary_file_path, output_file_path, min_score=args.min_score,
+                           scores_file=args.scores)
+
+    # Process both test and train datasets
+    csv_to_jsonl_literacy(LITERACY_TEST_CSV, LITERACY_TEST_JSONL)
+    csv_to_jsonl_literacy(LITERACY_TRAIN_CSV, LITERACY_TRAIN_JSONL)
@@ -0,0 +1,117 @@
+import re
+
+# pandas is only imported by the masks, which always receive pandas columns; the constants and
+# CommentRules itself stay importable without it (the pipeline runner and CLI read them)
+
+# Auto-generated game result phrases, removed as commentary
+RESULT_PHRASES = [
+    "1-0 Black resigns", "0-1 White resigns",
+    "0-1 Black wins by checkmate", "1-0 White wins by checkmate",
+    "1-0 White wins", "0-1 Black wins",
+    "1/2-1/2 The game is a draw", "Game drawn by repetition",
+    "Game drawn by agreement", "{username} won by resignation",
+    "{username} won on time", "{username} won by checkmate",
+    "White wins", "Black wins", "Game drawn",
+    "Draw by repetition", "Draw by agreement",
+    "1-0", "0-1", "1/2-1/2"
+]
+
+# Problematic substrings that mark non-natural-language commentary
+PROBLEMATIC_NOTATIONS = ['[%csl', '[%cal', '[%eval', '→']
+
+EVAL_TAG = r'\[%eval\s+[+-]?\d+\.?\d*\]'
+
+LOW_VALUE_PATTERNS = [
+    # e.g. "[%eval X] Inaccuracy. Y was best."
+    r'^\[%eval\s+[+-]?\d+\.?\d*\]\s*(Inaccuracy|Blunder|Mistake)\.\s+\w+\d?\s+was\s+best\.*\s*$',
+    # e.g. "Inaccuracy. X was best. [%eval Y]"
+    r'^(Inaccuracy|Blunder|Mistake)\.\s+\w+\d?\s+was\s+best\.\s*\[%eval\s+[+-]?\d+\.?\d*\]\s*$',
+    # e.g. just "[%eval X]"
+    r'^\[%eval\s+[+-]?\d+\.?\d*\]\s*$',
+    # e.g. arrow-only "→ e5"
+    r'^→\s*\w+\s*$',
+    # short arrow variations
+    r'^[^→]{0,10}→[^→]{0,10}$'
+]
+
+PUNCTUATION = r'[.,!?]'
+
+def normalize_phrase(text):
+    """Strip, drop punctuation and lowercase, as is_auto_generated compares phrases."""
+    return re.sub(PUNCTUATION, '', text.strip()).lower()
+
+class CommentRules:
+    """All commentary filters compiled once and applied to a whole column at a time.
+
+    Each mask reproduces the matching row-wise function in first_preprocess.py / second_preprocess.py:
+    auto_generated_mask ~ is_auto_generated, keep_mask ~ clean_eval_comments(...) is not None,
+    problematic_mask ~ the problematic-notation check. Literal operations (strip, substring, length)
+    run on the column as-is, which is fast for Arrow strings and behaves exactly like Python's. Regexes
+    and lowercasing, where Arrow's semantics differ, run in Python and only on the rows a literal
+    prefilter says can match.
+    """
+
+    def __init__(self, result_phrases=RESULT_PHRASES, problematic_notations=PROBLEMATIC_NOTATIONS,
+                 min_length=63, arrow_min=80):
+        self.min_length = min_length
+        self.arrow_min = arrow_min
+        self.problematic_notations = list(problematic_notations)
+        self.result_phrases = frozenset(normalize_phrase(phrase) for phrase in result_phrases)
+        self.max_phrase_length = max((len(phrase) for phrase in self.result_phrases), default=0)
+        self.eval_tag_re = re.compile(EVAL_TAG)
+        # One alternation instead of five separate matches per comment
+        self.low_value_re = re.compile('|'.join(f'(?:{pattern})' for pattern in LOW_VALUE_PATTERNS))
+
+    @staticmethod
+    def contains(commentary, literal):
+        return commentary.str.contains(literal, regex=False).fillna(False).astype(bool)
+
+    def auto_generated_mask(self, commentary):
+        """True where the commentary is only an auto-generated result phrase."""
+        import pandas as pd
+        normalized = commentary.str.strip()
+        for mark in '.,!?':
+            normalized = normalized.str.replace(mark, '', regex=False)
+        # Lowercasing never changes the length of a phrase that can match, so longer rows are out
+        candidates = (normalized.str.len() <= self.max_phrase_length).fillna(False).astype(bool)
+        mask = pd.Series(False, index=commentary.index)
+        if candidates.any():
+            mask[candidates] = normalized[candidates].astype(object).str.lower().isin(self.result_phrases)
+        return mask
+
+    def low_value_mask(self, commentary):
+        """True where the commentary is empty or just an eval/arrow comment."""
+        mask = (commentary.isna() | (commentary == '')).fillna(True).astype(bool)
+        # Every low-value pattern contains an eval tag or an arrow
+        candidates = self.contains(commentary, '[%eval') | self.contains(commentary, '→')
+        if candidates.any():
+            text = commentary[candidates].astype(object).str.strip()
+            mask[candidates] = mask[candidates] | text.str.match(self.low_value_re).fillna(False).astype(bool)
+        return mask
+
+    def keep_mask(self, commentary):
+        """True where clean_eval_comments would keep the commentary."""
+        lengths = commentary.str.strip().str.len().fillna(0)
+        has_arrow = self.contains(commentary, '→')
+        has_eval = self.contains(commentary, '[%eval')
+        if has_eval.any():
+            # Eval tags do not count toward the length
+            cleaned = commentary[has_eval].astype(object).str.replace(self.eval_tag_re, '', regex=True).str.strip()
+            lengths = lengths.astype(int)
+            lengths[has_eval] = cleaned.str.len().astype(int)
+            has_arrow[has_eval] = cleaned.str.contains('→', regex=False).astype(bool)
+        short_arrow = has_arrow & (lengths <= self.arrow_min)
+        # Comments with and without a "valuable" term face the same min_length, so the term check
+        # in clean_eval_comments never changes the outcome and is not repeated here
+        too_short = lengths <= self.min_length
+        return ~(self.low_value_mask(commentary) | short_arrow | too_short)
+
+    def problematic_mask(self, outputs):
+        """True where the text contains any problematic notation."""
+        import pandas as pd
+        mask = pd.Series(False, index=outputs.index)
+        for notation in self.problematic_notations:
+            mask |= self.contains(outputs, notation)
+        return mask
+
+DEFAULT_RULES = CommentRules()
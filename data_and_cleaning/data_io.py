@@ -0,0 +1,132 @@
+import csv
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# Fully quoted, escaped CSV so multiline commentary survives a round trip
+CSV_OPTIONS = {
+    "quoting": csv.QUOTE_ALL,
+    "escapechar": "\\",
+    "lineterminator": "\n",
+    "encoding": "utf-8",
+}
+
+def table_format(path):
+    """Infers the storage format from a file extension: 'parquet', 'arrow' or 'csv'."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    if ext in (".arrow", ".feather", ".ipc"):
+        return "arrow"
+    if ext == ".csv":
+        return "csv"
+    raise ValueError(f"Unsupported table format for {path}; use .parquet, .arrow or .csv")
+
+def temp_path(path):
+    """Returns a sibling temp path that keeps the extension, for atomic writes."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.tmp{ext}"
+
+def read_table(path, columns=None, memory_map=False):
+    """Reads a stage's table into a DataFrame.
+
+    Parquet and Arrow files keep their column types. With `memory_map=True` the file is
+    mapped instead of read into a buffer; uncompressed Arrow files are then read without copying.
+    """
+    fmt = table_format(path)
+    if fmt == "parquet":
+        return pq.read_table(path, columns=columns, memory_map=memory_map).to_pandas()
+    if fmt == "arrow":
+        return feather.read_table(path, columns=columns, memory_map=memory_map).to_pandas()
+    return pd.read_csv(path, usecols=columns)
+
+def iter_batches(path, batch_size=50_000, columns=None, memory_map=False):
+    """Yields a table as DataFrames of at most `batch_size` rows, without loading the whole file."""
+    fmt = table_format(path)
+    if fmt == "parquet":
+        parquet_file = pq.ParquetFile(path, memory_map=memory_map)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+    elif fmt == "arrow":
+        table = feather.read_table(path, columns=columns, memory_map=memory_map)
+        for batch in table.to_batches(max_chunksize=batch_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=batch_size)
+
+def write_table(df, path, compression="zstd"):
+    """Writes a stage's table; the format follows the extension, so a .csv path exports CSV."""
+    fmt = table_format(path)
+    if fmt == "parquet":
+        df.to_parquet(path, index=False, compression=compression)
+    elif fmt == "arrow":
+        # Compressed Arrow cannot be memory-mapped without decoding, so leave it plain by default
+        feather.write_feather(df.reset_index(drop=True), path, compression="uncompressed")
+    else:
+        df.to_csv(path, index=False, **CSV_OPTIONS)
+
+class ChunkWriter:
+    """Appends DataFrame chunks to one output file without holding earlier chunks in memory.
+
+    If no rows were written by the time it is closed, it still writes an empty table, with the
+    `columns` given or else those of the empty chunks it saw, so the next stage finds an empty table
+    rather than a missing file.
+    """
+
+    def __init__(self, path, compression="zstd", columns=None):
+        self.path = path
+        self.fmt = table_format(path)
+        self.compression = compression
+        self.columns = columns
+        self.writer = None
+        self.schema = None
+        self.empty = None
+        self.rows = 0
+        self.closed = False
+
+    def write(self, df):
+        """Appends a chunk; the first non-empty chunk fixes the schema (or CSV header)."""
+        if df.empty:
+            if self.empty is None:
+                self.empty = df.iloc[:0]
+            return
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="a" if self.rows else "w", header=not self.rows, index=False, **CSV_OPTIONS)
+        else:
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            if self.writer is None:
+                self.schema = table.schema
+                if self.fmt == "parquet":
+                    self.writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+                else:
+                    self.writer = pa.ipc.new_file(self.path, self.schema)
+            self.writer.write_table(table)
+        self.rows += len(df)
+
+    def write_empty(self):
+        """Writes a table without rows; columns missing from the empty chunks are written as untyped."""
+        empty = self.empty if self.empty is not None else pd.DataFrame()
+        if self.columns is not None:
+            empty = pd.DataFrame({
+                column: empty[column] if column in empty.columns else pd.Series(dtype=object)
+                for column in self.columns
+            })
+        write_table(empty, self.path, self.compression)
+
+    def close(self, write_empty=True):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        elif write_empty and not self.rows and not self.closed:
+            self.write_empty()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # A run that failed must not look like one that produced an empty table
+        self.close(write_empty=exc_type is None)
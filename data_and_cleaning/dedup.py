@@ -0,0 +1,264 @@
+import zlib
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from data_io import ChunkWriter, iter_batches
+
+# Halfmove/fullmove counters differ between studies reaching the same position, so they are not part of the key
+FEN_COUNTERS = r'\s+\d+\s+\d+\s*$'
+INPUT_COUNTERS = r'\s+\d+\s+\d+(?=\s+\S+\s*$)'
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+def normalize_text(values):
+    """Lowercase and collapse whitespace, so trivially reformatted commentary hashes the same."""
+    return values.fillna('').astype(str).str.lower().str.replace(r'\s+', ' ', regex=True).str.strip()
+
+def normalize_column(df, column):
+    """Normalized form of a key column: positions lose their move counters, text is case/space-folded."""
+    values = df[column].fillna('').astype(str).str.strip()
+    if column == 'FEN':
+        return values.str.replace(FEN_COUNTERS, '', regex=True)
+    if column == 'Input':
+        # "FEN SAN" strings from first_preprocess.py
+        return values.str.replace(INPUT_COUNTERS, '', regex=True)
+    if column in ('SAN_Move', 'Move'):
+        return values
+    return normalize_text(values)
+
+def row_hashes(df, key_columns):
+    """64-bit content hash of each row's normalized key columns."""
+    normalized = pd.DataFrame({column: normalize_column(df, column) for column in key_columns})
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy(dtype=np.uint64)
+
+class HashIndex:
+    """Set of 64-bit keys with an int payload, stored as sorted NumPy runs (about 16 bytes per key).
+
+    New keys are appended as a sorted run, and runs of similar size are merged, so there are only
+    O(log n) runs to binary-search and memory stays proportional to the number of distinct keys.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(keys) for keys, _ in self.runs)
+
+    def lookup(self, keys):
+        """Returns (found mask, payload of the stored key or -1) for an array of keys."""
+        found = np.zeros(len(keys), dtype=bool)
+        values = np.full(len(keys), -1, dtype=np.int64)
+        for run_keys, run_values in self.runs:
+            positions = np.minimum(np.searchsorted(run_keys, keys), len(run_keys) - 1)
+            hit = (run_keys[positions] == keys) & ~found
+            values[hit] = run_values[positions[hit]]
+            found |= hit
+        return found, values
+
+    def add(self, keys, values):
+        """Adds keys that are not in the index yet."""
+        if len(keys) == 0:
+            return
+        order = np.argsort(keys, kind="stable")
+        self.runs.append((keys[order], values[order]))
+        while len(self.runs) > 1 and len(self.runs[-1][0]) >= len(self.runs[-2][0]):
+            newer_keys, newer_values = self.runs.pop()
+            older_keys, older_values = self.runs.pop()
+            keys = np.concatenate([older_keys, newer_keys])
+            values = np.concatenate([older_values, newer_values])
+            order = np.argsort(keys, kind="stable")
+            self.runs.append((keys[order], values[order]))
+
+class MinHasher:
+    """MinHash signatures over word 3-gram shingles, banded for locality-sensitive hashing.
+
+    With `bands` bands of `rows` rows, two texts with Jaccard similarity s share a band with
+    probability 1 - (1 - s**rows)**bands; the defaults (8 x 8) put the threshold near 0.77.
+    """
+
+    def __init__(self, bands=8, rows=8, shingle_size=3, seed=0):
+        self.bands = bands
+        self.rows = rows
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        num_perm = bands * rows
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        # Odd multipliers that fold each band's rows into one key, plus a salt per band
+        self.band_weights = rng.integers(0, 1 << 63, size=rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.band_salts = rng.integers(0, 1 << 63, size=bands, dtype=np.uint64)
+
+    def shingles(self, text):
+        words = text.split()
+        if len(words) < self.shingle_size:
+            return {' '.join(words)}
+        return {' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in self.shingles(text)), dtype=np.uint64)
+        # Universal hashing (a * x + b) mod p, one row per permutation; uint64 arithmetic wraps
+        # the same way for every text, so each row is still a fixed random function of the shingle
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+    def band_hashes(self, text):
+        """One 64-bit key per band; texts sharing any band key are near-duplicate candidates."""
+        signature = self.signature(text).reshape(self.bands, self.rows)
+        folded = (signature * self.band_weights).sum(axis=1) ^ self.band_salts
+        return pd.util.hash_array(folded)
+
+class Deduplicator:
+    """Streaming duplicate filter over normalized (FEN, SAN_Move, Commentary), or any other key columns.
+
+    Exact duplicates are found through a HashIndex of row hashes. With `near_duplicates=True`,
+    commentary that is near-identical (MinHash/LSH over word shingles) to an earlier row at the same
+    position is dropped too. The first occurrence is kept; where `source_columns` are present,
+    every drop is attributed to the author/study pair it duplicated.
+    """
+
+    def __init__(self, key_columns=('FEN', 'SAN_Move', 'Commentary'), near_duplicates=False,
+                 text_column='Commentary', source_columns=('Username', 'Study_ID'), bands=8, rows=8, seed=0):
+        self.key_columns = list(key_columns)
+        self.text_column = text_column
+        self.source_columns = list(source_columns)
+        self.exact_index = HashIndex()
+        self.near_index = HashIndex() if near_duplicates else None
+        self.minhasher = MinHasher(bands, rows, seed=seed) if near_duplicates else None
+        self.source_codes = {}
+        self.sources = []
+        self.rows_seen = 0
+        self.exact_dropped = 0
+        self.near_dropped = 0
+        self.author_pairs = Counter()
+        self.duplicate_studies = Counter()
+
+    def encode_sources(self, df):
+        """Small integer code per (author, study) so provenance costs 8 bytes per indexed key."""
+        if not self.source_columns or not all(column in df.columns for column in self.source_columns):
+            return np.full(len(df), -1, dtype=np.int64)
+        batch_codes, batch_sources = pd.factorize(pd.MultiIndex.from_frame(df[self.source_columns].astype(str)))
+        global_codes = []
+        for source in batch_sources:
+            code = self.source_codes.get(source)
+            if code is None:
+                code = self.source_codes[source] = len(self.sources)
+                self.sources.append(source)
+            global_codes.append(code)
+        return np.asarray(global_codes, dtype=np.int64)[batch_codes]
+
+    def record(self, duplicate_codes, original_codes):
+        """Attributes dropped rows to the (author, study) of the row they duplicated."""
+        pairs = np.column_stack([duplicate_codes, original_codes]).astype(np.int64)
+        pairs = pairs[(pairs >= 0).all(axis=1)]
+        if len(pairs) == 0:
+            return
+        unique_pairs, counts = np.unique(pairs, axis=0, return_counts=True)
+        for (duplicate, original), rows in zip(unique_pairs.tolist(), counts.tolist()):
+            duplicate_source, original_source = self.sources[duplicate], self.sources[original]
+            self.author_pairs[(original_source[0], duplicate_source[0])] += rows
+            self.duplicate_studies[(duplicate_source[-1], original_source[-1])] += rows
+
+    def drop_exact(self, df, codes):
+        hashes = row_hashes(df, self.key_columns)
+        found, original_codes = self.exact_index.lookup(hashes)
+        # Repeats inside the batch point back at their first occurrence in the batch
+        first_in_batch = pd.Series(codes).groupby(hashes).transform('first').to_numpy()
+        repeated = pd.Series(hashes).duplicated().to_numpy() & ~found
+        original_codes[repeated] = first_in_batch[repeated]
+        duplicate = found | repeated
+
+        self.record(codes[duplicate], original_codes[duplicate])
+        self.exact_index.add(hashes[~duplicate], codes[~duplicate])
+        self.exact_dropped += int(duplicate.sum())
+        return ~duplicate
+
+    def drop_near(self, df, codes, keep):
+        positions = normalize_column(df, self.key_columns[0]).to_numpy() if self.key_columns else None
+        texts = normalize_text(df[self.text_column]).to_numpy()
+        batch_bands = {}
+        for i in np.flatnonzero(keep):
+            bands = self.minhasher.band_hashes(texts[i])
+            if positions is not None:
+                # Near-duplicates only count at the same position
+                bands = bands ^ np.uint64(zlib.crc32(positions[i].encode("utf-8")))
+            found, original_codes = self.near_index.lookup(bands)
+            if found.any():
+                original = original_codes[found][0]
+            else:
+                original = next((batch_bands[band] for band in bands.tolist() if band in batch_bands), None)
+            if original is not None:
+                keep[i] = False
+                self.record([codes[i]], [original])
+                self.near_dropped += 1
+                continue
+            for band in bands.tolist():
+                batch_bands[band] = codes[i]
+        new_bands = np.fromiter(batch_bands.keys(), dtype=np.uint64, count=len(batch_bands))
+        new_codes = np.fromiter(batch_bands.values(), dtype=np.int64, count=len(batch_bands))
+        self.near_index.add(new_bands, new_codes)
+        return keep
+
+    def drop_duplicates(self, df):
+        """Returns the rows of a batch that were not seen before, in their original order."""
+        self.rows_seen += len(df)
+        codes = self.encode_sources(df)
+        keep = self.drop_exact(df, codes)
+        if self.near_index is not None:
+            keep = self.drop_near(df, codes, keep)
+        return df[keep]
+
+    def report(self, top=10):
+        return {
+            "rows_seen": self.rows_seen,
+            "exact_duplicates": self.exact_dropped,
+            "near_duplicates": self.near_dropped,
+            "indexed_keys": len(self.exact_index) + (len(self.near_index) if self.near_index else 0),
+            "top_author_pairs": [
+                {"original": original, "duplicate": duplicate, "rows": rows}
+                for (original, duplicate), rows in self.author_pairs.most_common(top)
+            ],
+            "top_duplicate_studies": [
+                {"study": study, "duplicates_of": original, "rows": rows}
+                for (study, original), rows in self.duplicate_studies.most_common(top)
+            ],
+        }
+
+    def print_report(self, top=10):
+        report = self.report(top)
+        print(f"\nDeduplication: {report['exact_duplicates']} exact and {report['near_duplicates']} near duplicates "
+              f"dropped out of {report['rows_seen']} rows")
+        if report["top_author_pairs"]:
+            print("Most duplicated authors (original -> duplicate):")
+            for pair in report["top_author_pairs"]:
+                print(f"  {pair['original']} -> {pair['duplicate']}: {pair['rows']} rows")
+            print("Most duplicated studies (study duplicates original):")
+            for study in report["top_duplicate_studies"]:
+                print(f"  {study['study']} duplicates {study['duplicates_of']}: {study['rows']} rows")
+
+def default_key_columns(columns):
+    """(FEN, SAN_Move/Move, Commentary) for extracted rows, (Input, Output) for preprocessed ones."""
+    if 'FEN' in columns:
+        move = 'SAN_Move' if 'SAN_Move' in columns else 'Move'
+        return ['FEN', move, 'Commentary'], 'Commentary'
+    return ['Input', 'Output'], 'Output'
+
+def deduplicate_table(input_file, output_file, near_duplicates=False, batch_size=100_000):
+    """Streams a table through a Deduplicator and writes the first occurrence of each row."""
+    deduplicator = None
+    with ChunkWriter(output_file) as writer:
+        for batch in iter_batches(input_file, batch_size=batch_size):
+            if deduplicator is None:
+                key_columns, text_column = default_key_columns(batch.columns)
+                deduplicator = Deduplicator(key_columns, near_duplicates=near_duplicates, text_column=text_column)
+            writer.write(deduplicator.drop_duplicates(batch))
+    if deduplicator is not None:
+        deduplicator.print_report()
+        return deduplicator.report()
+    return None
+
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("dedup")
+    args = parser.parse_args()
+    deduplicate_table(args.input_file, args.output_file, near_duplicates=args.near)
@@ -0,0 +1,160 @@
+import random
+import threading
+import time
+import concurrent.futures
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class TokenBucket:
+    """Shared request budget for all workers that follows the server's rate-limit signals.
+
+    Tokens refill at `rate` per second up to `capacity`. A 429 halves the refill rate and
+    pauses every worker until the server's Retry-After has passed; each success nudges the
+    rate back up toward its starting value.
+    """
+
+    def __init__(self, rate=1.0, capacity=4, min_rate=0.05):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.paused_until = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stops all workers for `seconds` and slows the refill rate."""
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.updated = max(now, self.paused_until)
+
+    def record_success(self, headers=None):
+        """Recovers the refill rate after a success and honours any remaining-quota header."""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+            remaining = headers.get("X-RateLimit-Remaining") if headers else None
+            if remaining is not None and remaining.isdigit() and int(remaining) == 0:
+                reset = parse_retry_after(headers.get("X-RateLimit-Reset"))
+                if reset:
+                    self.paused_until = max(self.paused_until, time.monotonic() + reset)
+
+def parse_retry_after(value):
+    """Returns a Retry-After style header value in seconds, or None if absent or unparsable."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+def make_session(pool_size=8):
+    """Creates a requests session whose connection pool fits `pool_size` concurrent workers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def request_with_backoff(session, bucket, url, params=None, headers=None, max_retries=5, backoff_base=2.0,
+                         backoff_max=120.0, default_wait=60.0, stream=False, ok=(200,)):
+    """GETs a URL through the shared token bucket, backing off per request on 429s and errors.
+
+    Returns (status, response). The response is only returned for a status in `ok` and is then
+    the caller's to close. Otherwise it is None: a status of 429 or None means the retries were
+    exhausted, any other status is a client error that retrying would not fix.
+    """
+    status = None
+    for attempt in range(max_retries):
+        bucket.acquire()
+        try:
+            response = session.get(url, params=params, headers=headers, stream=stream)
+        except requests.RequestException as e:
+            print(f"Request to {url} failed: {e}")
+            status = None
+        else:
+            status = response.status_code
+            if status in ok:
+                bucket.record_success(response.headers)
+                return status, response
+            response.close()
+            if status == 429:
+                wait = parse_retry_after(response.headers.get("Retry-After"))
+                bucket.pause(default_wait if wait is None else wait)
+            elif status < 500:
+                # Other client errors will not go away by retrying
+                return status, None
+        # Exponential backoff with full jitter, independent of the other workers
+        time.sleep(random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt)))
+    return status, None
+
+def fetch_with_backoff(session, bucket, url, params=None, headers=None, max_retries=5,
+                       backoff_base=2.0, backoff_max=120.0, default_wait=60.0):
+    """GETs a URL like `request_with_backoff` and returns (status, text); text is None on failure."""
+    status, response = request_with_backoff(session, bucket, url, params, headers, max_retries,
+                                            backoff_base, backoff_max, default_wait)
+    if response is None:
+        return status, None
+    return status, response.text
+
+def download_all(jobs, max_workers=8, rate=1.0, capacity=4, max_retries=5, retry_rounds=2,
+                 backoff_base=2.0, default_wait=60.0, session=None, bucket=None):
+    """Downloads many URLs concurrently over one pooled session and a shared token bucket.
+
+    `jobs` is an iterable of (key, url, params, headers). Yields (key, status, text) as each
+    request finishes. Jobs that exhaust their retries go to a retry queue that is run again
+    after the main pass, up to `retry_rounds` times, before being reported as failed.
+    Pass a `session` and `bucket` to share the connection pool and rate limit across calls.
+    """
+    session = session or make_session(max_workers)
+    bucket = bucket or TokenBucket(rate=rate, capacity=capacity)
+    pending = deque(jobs)
+
+    for round_number in range(retry_rounds + 1):
+        if not pending:
+            break
+        if round_number > 0:
+            print(f"Retrying {len(pending)} exhausted requests (round {round_number}/{retry_rounds})...")
+        retry_queue = deque()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(fetch_with_backoff, session, bucket, url, params, headers,
+                                max_retries, backoff_base, default_wait=default_wait): (key, url, params, headers)
+                for key, url, params, headers in pending
+            }
+            for future in concurrent.futures.as_completed(futures):
+                job = futures[future]
+                status, text = future.result()
+                if text is None and (status is None or status == 429 or status >= 500):
+                    retry_queue.append(job)
+                    continue
+                yield job[0], status, text
+        pending = retry_queue
+
+    for key, _, _, _ in pending:
+        print(f"Giving up on {key} after {retry_rounds + 1} rounds.")
+        yield key, None, None
@@ -3,125 +3,588 @@ import chess.pgn
 import pandas as pd
 import io
 import time
-import csv  # We'll reference csv.QUOTE_ALL, etc.
+import json
+import os
+import concurrent.futures
+import functools
+from downloader import TokenBucket, download_all, fetch_with_backoff, make_session
+from http_fetch import TRANSPORT_ERRORS, AsyncFetcher
+from data_io import ChunkWriter, read_table, temp_path, write_table
+from checkpoint import (author_entry, content_hash, load_manifest, record_study,
+                        removed_studies, save_manifest, studies_to_fetch)
+from position_index import build_position_index, position_hash
+from instrumentation import Profiler
 
-def fetch_user_studies(username, token):
-    """Fetches PGN data for all studies of a specific Lichess user."""
+LICHESS_URL = "https://lichess.org"
+
+EXPORT_PARAMS = {
+    "comments": "true",      # Include analysis and annotator comments
+    "clocks": "false",       # Exclude clock comments
+    "variations": "false",   # Exclude variations
+    "source": "false",       # Exclude source tags
+    "orientation": "false"
+}
+
+def export_params(variations=False):
+    """Export query parameters; with `variations` the sidelines are exported too."""
+    return dict(EXPORT_PARAMS, variations="true" if variations else "false")
+
+def export_url(username, base_url=LICHESS_URL):
+    """Builds the study export URL for a Lichess user."""
+    return f"{base_url}/study/by/{username}/export.pgn"
+
+def study_list_url(username, base_url=LICHESS_URL):
+    """Builds the URL listing a Lichess user's studies with their last-modified times."""
+    return f"{base_url}/api/study/by/{username}"
+
+def study_export_url(study_id, base_url=LICHESS_URL):
+    """Builds the PGN export URL for a single study."""
+    return f"{base_url}/api/study/{study_id}.pgn"
+
+def request_user_studies(username, token, stream=False, base_url=LICHESS_URL, variations=False):
+    """Requests the PGN export for all studies of a specific Lichess user."""
     headers = {"Authorization": f"Bearer {token}"}
-    url = f"https://lichess.org/study/by/{username}/export.pgn"
-    
-    params = {
-        "comments": "true",      # Include analysis and annotator comments
-        "clocks": "false",       # Exclude clock comments
-        "variations": "false",   # Exclude variations
-        "source": "false",       # Exclude source tags
-        "orientation": "false"
-    }
+    url = export_url(username, base_url)
+    params = export_params(variations)
 
     retries = 0
     while retries < 5:  # Retry up to 5 times
-        response = requests.get(url, headers=headers, params=params)
+        response = requests.get(url, headers=headers, params=params, stream=stream)
         if response.status_code == 429:  # Rate limiting
+            response.close()
             print(f"Rate limit exceeded for {username}. Waiting for 60 seconds...")
             time.sleep(60)
             retries += 1
         elif response.status_code == 200:
-            return response.text
+            return response
         else:
+            response.close()
             print(f"Failed to fetch studies for {username}: Status {response.status_code}")
             return None
     print(f"Max retries exceeded for {username}.")
     return None
 
-def parse_studies(pgn_text):
-    """Parses all studies from a PGN text and extracts FENs, moves, and comments."""
-    games = []
-    pgn = io.StringIO(pgn_text)
-    
+def fetch_cached_export(fetcher, username, token, base_url=LICHESS_URL, variations=False, stream=False):
+    """Fetches a user's export through `fetcher`, revalidating any cached copy. Returns a CachedResponse."""
+    headers = {"Authorization": f"Bearer {token}"}
+    response = fetcher.get(export_url(username, base_url), export_params(variations), headers, stream=stream)
+    if not response.ok:
+        print(f"Failed to fetch studies for {username}: Status {response.status}")
+    elif response.from_cache:
+        print(f"Export for {username} is unchanged; using the cached copy")
+    return response
+
+def fetch_user_studies(username, token, base_url=LICHESS_URL, fetcher=None, variations=False):
+    """Fetches PGN data for all studies of a specific Lichess user."""
+    if fetcher is not None:
+        response = fetch_cached_export(fetcher, username, token, base_url, variations)
+        return response.text if response.ok else None
+    response = request_user_studies(username, token, base_url=base_url, variations=variations)
+    if response is None:
+        return None
+    return response.text
+
+def stream_user_studies(username, token, base_url=LICHESS_URL, fetcher=None, variations=False):
+    """Opens the PGN export of a Lichess user as a text stream, decoded as it downloads.
+
+    With a `fetcher`, a changed export is parsed as it downloads while being written to its compressed
+    cache entry, and an unchanged one is read back from the cache, so it is never downloaded twice.
+    """
+    if fetcher is not None:
+        response = fetch_cached_export(fetcher, username, token, base_url, variations, stream=True)
+        return response.open_text() if response.ok else None
+    response = request_user_studies(username, token, stream=True, base_url=base_url, variations=variations)
+    if response is None:
+        return None
+    # Let urllib3 undo any gzip transfer encoding before the bytes reach the PGN reader,
+    # and report EOF instead of closing itself once the body is exhausted
+    response.raw.decode_content = True
+    response.raw.auto_close = False
+    return io.TextIOWrapper(response.raw, encoding="utf-8", errors="replace")
+
+# Columns of an extracted table; variation-aware extraction adds the VARIATION_COLUMNS
+POSITION_COLUMNS = ["Study_ID", "FEN", "Move", "Commentary", "Position_Hash", "Username"]
+VARIATION_COLUMNS = ["Path", "Depth", "Parent_FEN"]
+
+def position_columns(variations=False):
+    if not variations:
+        return POSITION_COLUMNS
+    return POSITION_COLUMNS[:-1] + VARIATION_COLUMNS + POSITION_COLUMNS[-1:]
+
+def mainline_positions(game, study_id):
+    """Yields a row for each commented move of the game's mainline."""
+    board = game.board()
+    for node in game.mainline():
+        fen = board.fen()
+        if node.move is None:
+            # Very rare edge case if node.move is None at root
+            continue
+
+        move = node.move.uci()
+        commentary = node.comment
+
+        # If there's commentary, store it
+        if commentary:
+            yield {
+                "Study_ID": study_id,
+                "FEN": fen,
+                "Move": move,
+                "Commentary": commentary,
+                # Hashed while the board is at hand, so indexing never re-parses FENs
+                "Position_Hash": position_hash(board)
+            }
+
+        board.push(node.move)
+
+def variation_positions(game, study_id, max_depth=None):
+    """Yields a row for each commented move anywhere in the game tree, sidelines included.
+
+    The tree is walked depth-first with an explicit stack and a single board that is pushed on the
+    way down and popped on the way back, so memory grows with the depth of the line being walked,
+    never with the size of the tree, and no board is ever copied. Besides the mainline columns each
+    row has:
+      - Path: the branches taken to reach the move, as "ply:index" pairs joined by "/", where index
+        is the variation chosen at that ply (0 is the main continuation). Mainline rows have "".
+      - Depth: how many sidelines deep the move is (0 on the mainline).
+      - Parent_FEN: the position where the innermost sideline branched off its parent line
+        ("" on the mainline).
+    Sidelines nested deeper than `max_depth` are skipped.
+    """
+    board = game.board()
+    # Each frame is [node, index of its next child to visit, whether reaching it took a branch]
+    stack = [[game, 0, False]]
+    branches = []
+    while stack:
+        frame = stack[-1]
+        node, index, branched = frame
+        if index == len(node.variations):
+            stack.pop()
+            if node is not game:
+                board.pop()
+            if branched:
+                branches.pop()
+            continue
+        frame[1] += 1
+        child = node.variations[index]
+        if index > 0 and max_depth is not None and len(branches) >= max_depth:
+            continue
+        if index > 0:
+            branches.append((len(board.move_stack), index, board.fen()))
+
+        if child.comment:
+            yield {
+                "Study_ID": study_id,
+                "FEN": board.fen(),
+                "Move": child.move.uci(),
+                "Commentary": child.comment,
+                "Position_Hash": position_hash(board),
+                "Path": "/".join(f"{ply}:{choice}" for ply, choice, _ in branches),
+                "Depth": len(branches),
+                "Parent_FEN": branches[-1][2] if branches else "",
+            }
+
+        board.push(child.move)
+        stack.append([child, 0, index > 0])
+
+def iter_commented_positions(pgn, variations=False, max_depth=None):
+    """Yields FEN, move and comment for each commented node, reading games one at a time from a stream.
+
+    With `variations=True` sideline comments are included as well (see `variation_positions`).
+    A connection that fails partway through a download is raised, not taken as the end of the export.
+    """
     while True:
         try:
             game = chess.pgn.read_game(pgn)
-            if game is None:
-                break
+        except TRANSPORT_ERRORS:
+            raise
+        except Exception as e:
+            # A failing reader means the stream itself is broken, so retrying would loop forever
+            print(f"Error reading PGN stream: {e}")
+            break
+        if game is None:
+            break
 
+        try:
             # Extract study metadata if available
             study_id = game.headers.get("Site", "").split("/")[-1]
-            
+
             try:
-                board = game.board()
+                game.board()
             except ValueError as e:
                 print(f"Skipping game due to invalid FEN: {e}")
                 continue
 
-            for node in game.mainline():
-                fen = board.fen()
-                if node.move is None:
-                    # Very rare edge case if node.move is None at root
-                    continue
-
-                move = node.move.uci()
-                commentary = node.comment
-                
-                # If there's commentary, store it
-                if commentary:
-                    games.append({
-                        "Study_ID": study_id,
-                        "FEN": fen,
-                        "Move": move,
-                        "Commentary": commentary
-                    })
-                
-                board.push(node.move)
+            if variations:
+                yield from variation_positions(game, study_id, max_depth)
+            else:
+                yield from mainline_positions(game, study_id)
         except Exception as e:
             print(f"Error parsing game: {e}")
             continue
-    
+
+def parse_studies(pgn_text, variations=False, max_depth=None):
+    """Parses all studies from a PGN text and extracts FENs, moves, and comments."""
+    return list(iter_commented_positions(io.StringIO(pgn_text), variations, max_depth))
+
+def split_pgn(pgn_text, chunk_size=4_000_000):
+    """Splits a PGN export into chunks of roughly `chunk_size` characters, cutting only between games."""
+    boundary = "\n\n[Event \""
+    chunks = []
+    start = 0
+    while start < len(pgn_text):
+        cut = pgn_text.find(boundary, start + chunk_size)
+        if cut == -1:
+            chunks.append(pgn_text[start:])
+            break
+        cut += 2  # Keep the blank line with the previous game
+        chunks.append(pgn_text[start:cut])
+        start = cut
+    return chunks
+
+def parse_studies_parallel(pgn_text, workers=None, chunk_size=4_000_000, variations=False, max_depth=None,
+                           executor=None):
+    """Parses a PGN export across a process pool. Output matches parse_studies, in the same order.
+
+    Pass an `executor` to reuse one pool across many exports; otherwise a pool is started for this call.
+    """
+    chunks = split_pgn(pgn_text, chunk_size)
+    if len(chunks) == 1 or (executor is None and workers == 1):
+        return parse_studies(pgn_text, variations, max_depth)
+    if executor is None:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            return parse_studies_parallel(pgn_text, chunk_size=chunk_size, variations=variations,
+                                          max_depth=max_depth, executor=executor)
+
+    games = []
+    # map() yields results in submission order, so the merge is deterministic
+    parse = functools.partial(parse_studies, variations=variations, max_depth=max_depth)
+    for chunk_games in executor.map(parse, chunks):
+        games.extend(chunk_games)
     return games
 
+def write_positions(df, output_file):
+    """Writes extracted positions as Parquet/Arrow, or as fully quoted CSV for a .csv path."""
+    write_table(df, output_file)
+
+def write_positions_in_chunks(positions, writer, chunk_size=10000):
+    """Writes an iterable of positions through a ChunkWriter in fixed-size chunks, so only one chunk is held in memory."""
+    written = 0
+    chunk = []
+    for position in positions:
+        chunk.append(position)
+        if len(chunk) >= chunk_size:
+            writer.write(pd.DataFrame(chunk))
+            written += len(chunk)
+            chunk = []
+    if chunk:
+        writer.write(pd.DataFrame(chunk))
+        written += len(chunk)
+    return written
+
 def load_usernames(file_path):
     """Loads usernames from a text file."""
     with open(file_path, "r", encoding="utf-8") as file:
         return [line.strip() for line in file if line.strip()]
 
-def main():
-    usernames_file = "study_authors.txt"
-    token = "PLACEHOLDER"  # Replace with your actual API token
-    
+def extract_streaming(usernames, token, output_file, chunk_size=10000, fetcher=None, variations=False,
+                      max_depth=None, base_url=LICHESS_URL):
+    """Streams each author's export through the PGN reader and appends positions to the output in chunks.
+
+    An export cut off partway stops the run instead of passing its rows off as the author's whole
+    export. Its cache entry is discarded, so the next run downloads it again.
+    """
+    total = 0
+    with ChunkWriter(output_file, columns=position_columns(variations)) as writer:
+        for username in usernames:
+            print(f"Streaming studies for user {username}...")
+            pgn = stream_user_studies(username, token, base_url, fetcher=fetcher, variations=variations)
+            if pgn is None:
+                continue
+
+            def tagged_positions():
+                for position in iter_commented_positions(pgn, variations, max_depth):
+                    position['Username'] = username
+                    yield position
+
+            with pgn:
+                try:
+                    count = write_positions_in_chunks(tagged_positions(), writer, chunk_size)
+                except TRANSPORT_ERRORS as e:
+                    print(f"Download of the export for {username} failed partway: {e}")
+                    raise
+            total += count
+            print(f"Found {count} commented positions for {username}")
+    return total
+
+def fetch_each_user_studies(usernames, token, base_url=LICHESS_URL, fetcher=None, variations=False):
+    """Downloads each author's export one at a time, yielding (username, pgn_text)."""
+    for username in usernames:
+        print(f"Fetching studies for user {username}...")
+        yield username, fetch_user_studies(username, token, base_url, fetcher, variations)
+
+def fetch_all_user_studies(usernames, token, max_workers=8, rate=1.0, base_url=LICHESS_URL, fetcher=None,
+                           variations=False):
+    """Downloads every author's export concurrently, yielding (username, pgn_text) as each finishes."""
+    headers = {"Authorization": f"Bearer {token}"}
+    params = export_params(variations)
+    jobs = [(username, export_url(username, base_url), params, headers) for username in usernames]
+    if fetcher is not None:
+        for username, response in fetcher.iter_all(jobs):
+            if not response.ok:
+                print(f"Failed to fetch studies for {username}: Status {response.status}")
+            elif response.from_cache:
+                print(f"Export for {username} is unchanged; using the cached copy")
+            yield username, response.text if response.ok else None
+        return
+    for username, status, pgn_text in download_all(jobs, max_workers=max_workers, rate=rate):
+        if pgn_text is None:
+            print(f"Failed to fetch studies for {username}: Status {status}")
+        yield username, pgn_text
+
+def write_shard(df, shard_path):
+    """Writes an author's shard atomically, so an interrupted crawl never leaves a truncated shard."""
+    tmp_path = temp_path(shard_path)
+    write_positions(df, tmp_path)
+    os.replace(tmp_path, shard_path)
+
+def list_user_studies(session, bucket, username, token, base_url=LICHESS_URL):
+    """Lists a user's studies as dicts with 'id' and 'updatedAt', or None if the listing failed."""
+    headers = {"Authorization": f"Bearer {token}"}
+    status, text = fetch_with_backoff(session, bucket, study_list_url(username, base_url), headers=headers)
+    if text is None:
+        print(f"Failed to list studies for {username}: Status {status}")
+        return None
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def crawl_author(manifest, session, bucket, username, token, shard_dir, workers=4, base_url=LICHESS_URL,
+                 variations=False, max_depth=None):
+    """Fetches an author's new or changed studies and rewrites their shard. Returns True if complete."""
+    entry = author_entry(manifest, username)
+    shard_path = os.path.join(shard_dir, f"{username}.parquet")
+    if not os.path.exists(shard_path):
+        # Without the shard the recorded studies have no rows, so fetch them all again
+        entry["studies"] = {}
+
+    studies = list_user_studies(session, bucket, username, token, base_url)
+    if studies is None:
+        return False
+
+    changed = studies_to_fetch(entry, studies)
+    removed = removed_studies(entry, studies)
+    if not changed and not removed and entry["completed"] and os.path.exists(shard_path):
+        print(f"{username} is up to date ({len(studies)} studies)")
+        return True
+
+    print(f"Fetching {len(changed)} new or changed studies for {username} ({len(removed)} removed)...")
+    updated_at = {study["id"]: study.get("updatedAt") for study in changed}
+    headers = {"Authorization": f"Bearer {token}"}
+    params = export_params(variations)
+    jobs = [(study["id"], study_export_url(study["id"], base_url), params, headers) for study in changed]
+
+    stale_chapters = set()
+    for study_id in removed:
+        stale_chapters.update(entry["studies"].pop(study_id)["chapters"])
+
+    new_rows = []
+    complete = True
+    for study_id, status, pgn_text in download_all(jobs, max_workers=workers, session=session, bucket=bucket):
+        if pgn_text is None:
+            if status == 404:
+                # Deleted or made private since it was listed
+                stale_chapters.update(entry["studies"].pop(study_id, {}).get("chapters", []))
+                continue
+            print(f"Failed to fetch study {study_id} for {username}: Status {status}")
+            complete = False
+            continue
+
+        digest = content_hash(pgn_text)
+        previous = entry["studies"].get(study_id)
+        if previous is not None and previous["sha256"] == digest:
+            # Touched but unchanged, so the shard's rows are still valid
+            record_study(entry, study_id, updated_at[study_id], digest, previous["chapters"])
+            continue
+
+        rows = parse_studies(pgn_text, variations, max_depth)
+        chapters = {row["Study_ID"] for row in rows}
+        if previous is not None:
+            stale_chapters.update(previous["chapters"])
+        stale_chapters.update(chapters)
+        for row in rows:
+            row['Username'] = username
+        new_rows.extend(rows)
+        record_study(entry, study_id, updated_at[study_id], digest, chapters)
+
+    frames = []
+    if os.path.exists(shard_path):
+        existing = read_table(shard_path)
+        frames.append(existing[~existing["Study_ID"].isin(stale_chapters)])
+    if new_rows:
+        frames.append(pd.DataFrame(new_rows))
+    shard = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+        columns=position_columns(variations))
+    write_shard(shard, shard_path)
+
+    entry["shard"] = shard_path
+    entry["completed"] = complete
+    print(f"{username}: {len(shard)} commented positions in {shard_path}")
+    return complete
+
+def crawl_incremental(usernames, token, output_file, manifest_path="crawl_manifest.json",
+                      shard_dir="study_shards", workers=4, rate=1.0, base_url=LICHESS_URL, variations=False,
+                      max_depth=None):
+    """Resumable crawl: only new or changed studies are fetched, each author is checkpointed as it finishes,
+    and the shards are merged into `output_file` at the end."""
+    os.makedirs(shard_dir, exist_ok=True)
+    manifest = load_manifest(manifest_path)
+    if manifest.get("variations", False) != variations:
+        if manifest["authors"]:
+            # Shards written in the other mode have the wrong rows and columns, so refetch everything
+            print("Variation mode changed since the last crawl; fetching every study again")
+            for entry in manifest["authors"].values():
+                entry["studies"] = {}
+                entry["completed"] = False
+                if entry["shard"] and os.path.exists(entry["shard"]):
+                    os.remove(entry["shard"])
+        manifest["variations"] = variations
+    session = make_session(workers)
+    bucket = TokenBucket(rate=rate)
+
+    for username in usernames:
+        crawl_author(manifest, session, bucket, username, token, shard_dir, workers, base_url, variations, max_depth)
+        save_manifest(manifest, manifest_path)
+
+    total = 0
+    with ChunkWriter(output_file, columns=position_columns(variations)) as writer:
+        for username in usernames:
+            shard_path = manifest["authors"].get(username, {}).get("shard")
+            if shard_path and os.path.exists(shard_path):
+                shard = read_table(shard_path)
+                writer.write(shard)
+                total += len(shard)
+    incomplete = [u for u in usernames if not manifest["authors"].get(u, {}).get("completed")]
+    if incomplete:
+        print(f"{len(incomplete)} authors are incomplete and will be retried on the next run: {', '.join(incomplete)}")
+    return total
+
+def extract_studies(usernames_file, output_file, token, stream=False, workers=1, resume=False, parse_workers=1,
+                    index=False, profiler=None, report_file=None, http_cache="http_cache", cache_max_age=None,
+                    variations=False, max_depth=None):
+    """Extracts the commented positions of every author listed in `usernames_file` into `output_file`.
+
+    Downloading, parsing, writing and indexing are measured by `profiler`; pass `report_file` to save
+    the run report as JSON. Exports are cached in `http_cache` and revalidated on reruns (None disables
+    the cache); entries checked less than `cache_max_age` seconds ago are reused without a request.
+    With `variations` the exports include sidelines and their comments are extracted too, down to
+    `max_depth` nested sidelines.
+    """
+    profiler = profiler or Profiler("extract_user_studies")
     usernames = load_usernames(usernames_file)
     if not usernames:
-        print("No usernames found in study_authors.txt")
+        print(f"No usernames found in {usernames_file}")
+        return
+    # The resumable crawl fetches single studies and already skips unchanged ones via its manifest
+    fetcher = None if resume else AsyncFetcher(http_cache, concurrency=workers, max_age=cache_max_age)
+    try:
+        extract_exports(usernames, output_file, token, profiler, fetcher, stream=stream, workers=workers,
+                        resume=resume, parse_workers=parse_workers, index=index, variations=variations,
+                        max_depth=max_depth)
+    finally:
+        if fetcher is not None:
+            fetcher.close()
+    finish_report(profiler, report_file)
+
+def extract_exports(usernames, output_file, token, profiler, fetcher=None, stream=False, workers=1, resume=False,
+                    parse_workers=1, index=False, variations=False, max_depth=None):
+    """Downloads, parses, writes and optionally indexes the positions for `extract_studies`."""
+    if stream or resume:
+        # Each export is parsed as it downloads (or single studies are fetched between parses in the
+        # crawl), so downloading and parsing are measured as one stage
+        with profiler.stage("crawl" if resume else "stream & parse") as stage:
+            if resume:
+                total = crawl_incremental(usernames, token, output_file, workers=workers, variations=variations,
+                                          max_depth=max_depth)
+            else:
+                total = extract_streaming(usernames, token, output_file, fetcher=fetcher, variations=variations,
+                                          max_depth=max_depth)
+            stage.rows_out = total
+        if total:
+            print(f"Saved {total} positions to {output_file}")
+            if index:
+                with profiler.stage("position index", rows_in=total):
+                    build_position_index(output_file)
+        else:
+            print("No commented positions found")
         return
 
+    if workers > 1:
+        downloads = fetch_all_user_studies(usernames, token, max_workers=workers, fetcher=fetcher,
+                                           variations=variations)
+    else:
+        downloads = fetch_each_user_studies(usernames, token, fetcher=fetcher, variations=variations)
+
     all_games = []
+    # One parse pool for every author; starting processes per export would dominate with many small authors
+    parse_pool = concurrent.futures.ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 1 else None
 
-    for username in usernames:
-        print(f"Fetching studies for user {username}...")
-        pgn_data = fetch_user_studies(username, token)
-        if pgn_data:
-            print(f"Parsing studies for {username}...")
-            games = parse_studies(pgn_data)
-            for game in games:
-                game['Username'] = username
-            all_games.extend(games)
-            print(f"Found {len(games)} commented positions for {username}")
+    try:
+        while True:
+            with profiler.stage("download"):
+                username, pgn_data = next(downloads, (None, None))
+            if username is None:
+                break
+            if pgn_data:
+                print(f"Parsing studies for {username}...")
+                with profiler.stage("parse") as stage:
+                    if parse_pool is not None:
+                        games = parse_studies_parallel(pgn_data, variations=variations, max_depth=max_depth,
+                                                       executor=parse_pool)
+                    else:
+                        games = parse_studies(pgn_data, variations, max_depth)
+                    stage.rows_out = len(games)
+                for game in games:
+                    game['Username'] = username
+                all_games.extend(games)
+                print(f"Found {len(games)} commented positions for {username}")
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
 
     if all_games:
-        df = pd.DataFrame(all_games)
-        
-        # Key update: ensure multiline or comma-containing fields are fully quoted
-        # and properly escaped. This prevents malformed CSV if commentary includes line breaks.
-        df.to_csv(
-            "lichess_studies.csv", 
-            index=False,
-            quoting=csv.QUOTE_ALL,        # Always quote all fields
-            escapechar='\\',              # Escape internal quotes if needed
-            lineterminator='\n',         # Ensure standard newline
-            encoding='utf-8'              # In case of non-ASCII text
-        )
-        
-        print(f"Saved {len(df)} positions to lichess_studies.csv")
+        with profiler.stage("write", rows_in=len(all_games)):
+            df = pd.DataFrame(all_games)
+            write_positions(df, output_file)
+        print(f"Saved {len(df)} positions to {output_file}")
+        if index:
+            with profiler.stage("position index", rows_in=len(df)):
+                build_position_index(output_file)
     else:
+        # Still write the (empty) table, so the next stage sees no rows instead of a missing file
+        write_positions(pd.DataFrame(columns=position_columns(variations)), output_file)
         print("No commented positions found")
 
+def finish_report(profiler, report_file=None):
+    print()
+    profiler.print_report()
+    if report_file:
+        profiler.write_report(report_file)
+
+def main(stream=False, workers=1, resume=False, parse_workers=1, index=False, report_file=None, profile=False,
+         http_cache="http_cache", cache_max_age=None, variations=False, max_depth=None):
+    usernames_file = "study_authors.txt"
+    output_file = "lichess_studies.parquet"  # Use a .csv name to export CSV instead
+    token = "PLACEHOLDER"  # Replace with your actual API token
+
+    extract_studies(usernames_file, output_file, token, stream=stream, workers=workers, resume=resume,
+                    parse_workers=parse_workers, index=index,
+                    profiler=Profiler("extract_user_studies", profile=profile), report_file=report_file,
+                    http_cache=http_cache, cache_max_age=cache_max_age, variations=variations,
+                    max_depth=max_depth)
+
 if __name__ == "__main__":
-    main()
+    from stage_options import build_parser
+    parser = build_parser("extract_user_studies")
+    args = parser.parse_args()
+    main(stream=args.stream, workers=args.workers, resume=args.resume, parse_workers=args.parse_workers,
+         index=args.index, report_file=args.report, profile=args.profile,
+         http_cache=None if args.no_http_cache else args.http_cache, cache_max_age=args.cache_max_age,
+         variations=args.variations, max_depth=args.max_depth)
@@ -0,0 +1,65 @@
+from instrumentation import Profiler
+
+class Stage:
+    """A named step of a fused pipeline: takes a batch DataFrame and returns the rows that survive it,
+    possibly with columns added or rewritten."""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.profiler = None
+
+    def __call__(self, batch):
+        if self.profiler is None:
+            return self.func(batch)
+        with self.profiler.stage(self.name, rows_in=len(batch)) as measured:
+            batch = self.func(batch)
+            measured.rows_out = len(batch)
+        return batch
+
+class FusedPipeline:
+    """Runs a list of stages over each batch in turn, so the whole chain is one read and one write.
+
+    Reading, every stage and writing are measured per batch by `profiler` (see instrumentation.py),
+    a fresh Profiler by default; its per-stage totals are the pipeline's report.
+    """
+
+    def __init__(self, stages, profiler=None):
+        self.stages = stages
+        self.profiler = profiler or Profiler("fused_pipeline")
+        for stage in stages:
+            stage.profiler = self.profiler
+
+    def process(self, batch):
+        """Pushes one batch through every stage, stopping early once nothing is left."""
+        for stage in self.stages:
+            if batch.empty:
+                break
+            batch = stage(batch)
+        return batch
+
+    def run(self, batches, writer):
+        """Processes an iterable of batches and writes the survivors; returns (rows read, rows written)."""
+        rows_read = 0
+        rows_written = 0
+        batches = iter(batches)
+        while True:
+            with self.profiler.stage("read") as measured:
+                batch = next(batches, None)
+                measured.rows_out = 0 if batch is None else len(batch)
+            if batch is None:
+                break
+            rows_read += len(batch)
+            batch = self.process(batch)
+            with self.profiler.stage("write", len(batch)):
+                writer.write(batch)
+            rows_written += len(batch)
+        return rows_read, rows_written
+
+    def report(self):
+        """The profiler's totals for each stage that saw rows: rows in/out, drops, time and memory."""
+        return [self.profiler.stages[stage.name].as_dict() for stage in self.stages
+                if stage.name in self.profiler.stages]
+
+    def print_report(self):
+        self.profiler.print_report()
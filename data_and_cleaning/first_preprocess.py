@@ -1,11 +1,27 @@
 import pandas as pd
-import chess
 import re
-from langdetect import detect
+from langdetect import DetectorFactory, detect
 from langdetect.lang_detect_exception import LangDetectException
 import concurrent.futures
+import functools
+import itertools
+import os
 import numpy as np
-import csv  # We import csv so we can use csv.QUOTE_ALL
+from data_io import read_table, write_table
+from language_cache import LanguageCache, text_key
+from comment_rules import DEFAULT_RULES, RESULT_PHRASES
+from instrumentation import Profiler
+from move_service import analyze_pair, parse_board
+
+# langdetect samples randomly; a fixed seed makes its verdicts identical across runs
+LANGDETECT_SEED = 0
+LANGUAGE_CACHE_FILE = "language_cache.sqlite"
+
+# One pool of each kind for the whole run, created on first use
+LANGUAGE_POOL = None
+LANGUAGE_POOL_WORKERS = None
+SAN_POOL = None
+SAN_POOL_WORKERS = None
 
 def is_probably_english(text):
     """Quick preliminary check if text is likely English based on common words."""
@@ -23,59 +39,190 @@ def is_probably_english(text):
     matches = words.intersection(english_markers)
     return len(matches) >= 2
 
-def batch_process_language(texts, batch_size=1000):
-    """Process language detection in batches with preliminary filtering."""
-    results = []
+def seed_langdetect():
+    """Fix langdetect's seed and build its profiles up front (their lazy init is not thread-safe)."""
+    DetectorFactory.seed = LANGDETECT_SEED
+    detect_lang_safe("warm up")
+
+def detect_lang_safe(t):
+    """True if langdetect classifies the text as English."""
+    try:
+        return detect(t) == 'en'
+    except LangDetectException:
+        return False
+
+def get_language_pool(workers=None):
+    """Return the persistent language-detection process pool, sized to the machine by default.
+
+    Asking for a different size replaces the pool.
+    """
+    global LANGUAGE_POOL, LANGUAGE_POOL_WORKERS
+    workers = workers or os.cpu_count()
+    if LANGUAGE_POOL is not None and LANGUAGE_POOL_WORKERS != workers:
+        close_language_pool()
+    if LANGUAGE_POOL is None:
+        LANGUAGE_POOL = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=seed_langdetect)
+        LANGUAGE_POOL_WORKERS = workers
+    return LANGUAGE_POOL
+
+def close_language_pool():
+    """Shut the language-detection pool down; the next detection starts a new one."""
+    global LANGUAGE_POOL, LANGUAGE_POOL_WORKERS
+    if LANGUAGE_POOL is not None:
+        LANGUAGE_POOL.shutdown()
+        LANGUAGE_POOL = None
+        LANGUAGE_POOL_WORKERS = None
+
+def batch_process_language(texts, batch_size=1000, workers=None, cache_path=None):
+    """Process language detection in batches with preliminary filtering.
+
+    Detection runs on a persistent process pool (in-process when workers=1). With `cache_path`, verdicts
+    are read from and saved to an on-disk cache keyed by text hash, so only unseen texts are detected.
+    """
     # Quick filtering
     likely_english_mask = [is_probably_english(text) for text in texts]
     texts_to_check = [text for text, is_likely in zip(texts, likely_english_mask) if is_likely]
     
     print(f"Preliminary filtering: {len(texts_to_check)} out of {len(texts)} need detailed check")
-    
-    def detect_lang_safe(t):
-        try:
-            return detect(t) == 'en'
-        except LangDetectException:
-            return False
 
+    # Texts failing the quick filter stay marked as non-English
     final_results = np.zeros(len(texts), dtype=bool)
+    texts_to_check_indices = [i for i, is_likely in enumerate(likely_english_mask) if is_likely]
 
-    # Mark the ones that fail the quick filter as non-English right away
-    for i, is_likely in enumerate(likely_english_mask):
-        if not is_likely:
-            final_results[i] = False
+    keys = [text_key(text) for text in texts_to_check]
+    cache = LanguageCache(cache_path) if cache_path else None
+    verdicts = cache.get_many(set(keys)) if cache else {}
 
-    texts_to_check_indices = [i for i, is_likely in enumerate(likely_english_mask) if is_likely]
+    # Detect each uncached text once, however often it repeats
+    pending = {}
+    for key, text in zip(keys, texts_to_check):
+        if key not in verdicts:
+            pending.setdefault(key, text)
+    print(f"Language cache: {len(texts_to_check) - sum(key in pending for key in keys)} cached, "
+          f"{len(pending)} unique texts to detect")
+
+    pending_keys = list(pending)
+    pending_texts = [pending[key] for key in pending_keys]
+    if workers == 1:
+        seed_langdetect()
+        results = map(detect_lang_safe, pending_texts)
+    else:
+        # Every text is submitted up front, a few chunks per worker, so no worker idles between batches
+        chunksize = max(1, min(batch_size, len(pending_texts) // (4 * (workers or os.cpu_count()))))
+        results = get_language_pool(workers).map(detect_lang_safe, pending_texts, chunksize=chunksize)
+
+    # Verdicts arrive in order; they are cached a batch at a time, so an interrupted run keeps its progress
+    for i in range(0, len(pending_keys), batch_size):
+        batch_keys = pending_keys[i:i + batch_size]
+        new_verdicts = dict(zip(batch_keys, itertools.islice(results, len(batch_keys))))
+        print(f"Detected batch {i // batch_size + 1}/{(len(pending_keys) - 1) // batch_size + 1}")
+        verdicts.update(new_verdicts)
+        if cache:
+            cache.put_many(new_verdicts)
+
+    if cache:
+        cache.close()
 
-    for i in range(0, len(texts_to_check), batch_size):
-        batch = texts_to_check[i:i + batch_size]
-        print(f"Processing batch {i // batch_size + 1}/{(len(texts_to_check) - 1) // batch_size + 1}")
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            batch_results = list(executor.map(detect_lang_safe, batch))
-            
-        # Update overall results
-        for idx, is_english in zip(texts_to_check_indices[i:i + batch_size], batch_results):
-            final_results[idx] = is_english
+    # Update overall results
+    for idx, key in zip(texts_to_check_indices, keys):
+        final_results[idx] = verdicts[key]
     
     return final_results
 
+SAN_CACHE_SIZE = 500_000
+
+# Columns of the preprocessed tables
+TRAINING_COLUMNS = ['Input', 'Output', 'SAN_Move']
+
+# Totals for batched SAN conversion, reported at the end of a run
+SAN_BATCH_STATS = {"pairs": 0, "unique_pairs": 0, "hits": 0, "misses": 0}
+
 def validate_fen(fen):
     """Check if a FEN string is valid."""
-    try:
-        chess.Board(fen)
-        return True
-    except ValueError:
-        return False
+    return parse_board(fen) is not None
 
+@functools.lru_cache(maxsize=SAN_CACHE_SIZE)
 def convert_to_san(fen, move_uci):
-    """Convert UCI move to SAN notation given a FEN position."""
-    try:
-        board = chess.Board(fen)
-        move = chess.Move.from_uci(move_uci)
-        return board.san(move)
-    except (ValueError, AttributeError):
-        return None
+    """Convert UCI move to SAN notation given a FEN position; None if the FEN is invalid or the move illegal.
+
+    Shares move_service's conversion, so this step and MoveService agree on every pair.
+    """
+    return analyze_pair(fen, move_uci, details=False)[2]
+
+def convert_chunk_to_san(pairs):
+    """Convert a chunk of (FEN, UCI) pairs in a worker; returns the SANs and the worker's cache hits/misses."""
+    before = convert_to_san.cache_info()
+    sans = [convert_to_san(fen, move) for fen, move in pairs]
+    after = convert_to_san.cache_info()
+    return sans, after.hits - before.hits, after.misses - before.misses
+
+def get_san_pool(workers):
+    """Return the persistent SAN process pool, whose workers keep their board/SAN caches between batches.
+
+    Asking for a different size replaces the pool.
+    """
+    global SAN_POOL, SAN_POOL_WORKERS
+    if SAN_POOL is not None and SAN_POOL_WORKERS != workers:
+        close_san_pool()
+    if SAN_POOL is None:
+        SAN_POOL = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        SAN_POOL_WORKERS = workers
+    return SAN_POOL
+
+def close_san_pool():
+    """Shut the SAN pool down; the next parallel conversion starts a new one."""
+    global SAN_POOL, SAN_POOL_WORKERS
+    if SAN_POOL is not None:
+        SAN_POOL.shutdown()
+        SAN_POOL = None
+        SAN_POOL_WORKERS = None
+
+def convert_to_san_batch(fens, moves, workers=1, chunk_size=20_000):
+    """Convert many (FEN, UCI) pairs to SAN, None where the FEN or move is invalid.
+
+    Repeated pairs are converted once; with workers > 1 the unique pairs are split across the
+    persistent SAN pool.
+    """
+    pairs = [
+        (fen, move) if isinstance(fen, str) and isinstance(move, str) else None
+        for fen, move in zip(fens, moves)
+    ]
+    unique_pairs = list(dict.fromkeys(pair for pair in pairs if pair is not None))
+    chunks = [unique_pairs[i:i + chunk_size] for i in range(0, len(unique_pairs), chunk_size)]
+
+    if workers > 1 and len(chunks) > 1:
+        results = list(get_san_pool(workers).map(convert_chunk_to_san, chunks))
+    else:
+        results = [convert_chunk_to_san(chunk) for chunk in chunks]
+
+    san_by_pair = {}
+    for chunk, (sans, hits, misses) in zip(chunks, results):
+        san_by_pair.update(zip(chunk, sans))
+        SAN_BATCH_STATS["hits"] += hits
+        SAN_BATCH_STATS["misses"] += misses
+    SAN_BATCH_STATS["pairs"] += len(pairs)
+    SAN_BATCH_STATS["unique_pairs"] += len(unique_pairs)
+
+    return [san_by_pair[pair] if pair is not None else None for pair in pairs]
+
+def print_cache_stats():
+    """Print hit rates of the board/SAN caches and of pair deduplication."""
+    def rate(hits, misses):
+        total = hits + misses
+        return f"{hits}/{total} hits ({hits / total:.1%})" if total else "unused"
+
+    boards = parse_board.cache_info()
+    sans = convert_to_san.cache_info()
+    batch = SAN_BATCH_STATS
+    print("\nCache statistics:")
+    print(f"  Board cache: {rate(boards.hits, boards.misses)}, {boards.currsize} boards held")
+    if batch["pairs"]:
+        duplicates = batch["pairs"] - batch["unique_pairs"]
+        print(f"  SAN pairs: {batch['pairs']} rows, {batch['unique_pairs']} unique "
+              f"({duplicates / batch['pairs']:.1%} deduplicated)")
+        print(f"  SAN cache (all workers): {rate(batch['hits'], batch['misses'])}")
+    else:
+        print(f"  SAN cache: {rate(sans.hits, sans.misses)}")
 
 def is_auto_generated(commentary, result_phrases):
     """Check if commentary matches auto-generated game result phrases."""
@@ -135,82 +282,98 @@ def clean_eval_comments(commentary, min_length=63, arrow_min=80):
     
     return commentary
 
-def preprocess_data(input_file, output_file):
-    """Preprocess the dataset and save the cleaned data to CSV, fully quoted."""
-    df = pd.read_csv(input_file)
+def drop_null_commentary(df):
+    """Remove rows with missing commentary."""
+    return df[df['Commentary'].notna()]
+
+def keep_english(df, workers=None, cache_path=LANGUAGE_CACHE_FILE):
+    """Keep rows whose commentary is detected as English."""
+    english_mask = batch_process_language(df['Commentary'].values, workers=workers, cache_path=cache_path)
+    return df[english_mask]
+
+def drop_dvd(df):
+    """Quick removal of lines containing "DVD"."""
+    return df[~df['Commentary'].str.contains("DVD", na=False)]
+
+def add_san_moves(df, workers=1):
+    """Validate FEN, convert moves to SAN and drop rows where either fails."""
+    san_moves = convert_to_san_batch(df['FEN'].tolist(), df['Move'].tolist(), workers=workers)
+    valid_mask = [san is not None for san in san_moves]
+
+    df = df[valid_mask].copy()
+    df['SAN_Move'] = [san for san in san_moves if san is not None]
+    return df
+
+def drop_auto_generated(df, rules=DEFAULT_RULES):
+    """Filter out auto-generated game results."""
+    return df[~rules.auto_generated_mask(df['Commentary'])]
+
+def drop_low_value_comments(df, rules=DEFAULT_RULES):
+    """Drop low-value [%eval]/arrow comments and commentary that is too short (see clean_eval_comments)."""
+    return df[rules.keep_mask(df['Commentary'])]
+
+def build_training_columns(df):
+    """Trim commentary and build the Input/Output columns used for training."""
+    df = df.copy()
+    # Trim whitespace
+    df['Commentary'] = df['Commentary'].str.strip()
+
+    # Create Input/Output columns for training
+    df['Input'] = df['FEN'] + " " + df['SAN_Move']
+    df['Output'] = df['Commentary']
+
+    # Drop unneeded columns
+    return df[TRAINING_COLUMNS]
+
+def preprocess_data(input_file, output_file, memory_map=False, san_workers=1, rules=DEFAULT_RULES,
+                    profiler=None, report_file=None):
+    """Preprocess the dataset and save the cleaned data as Parquet (or fully quoted CSV for a .csv path).
+
+    Every step is measured by `profiler` (a fresh Profiler by default); pass `report_file` to save the
+    run report as JSON.
+    """
+    profiler = profiler or Profiler("first_preprocess")
+    with profiler.stage("read") as stage:
+        df = read_table(input_file, memory_map=memory_map)
+        stage.rows_out = len(df)
     print(f"Initial row count: {len(df)}")
 
     # Remove rows with missing commentary
-    df = df[df['Commentary'].notna()]
+    df = profiler.wrap("null commentary", drop_null_commentary)(df)
     print(f"After removing null commentary: {len(df)} rows")
 
     # Language filtering
     print("Performing language filtering...")
-    english_mask = batch_process_language(df['Commentary'].values)
-    df = df[english_mask]
+    df = profiler.wrap("language filter", keep_english)(df)
     print(f"After language filtering: {len(df)} rows")
 
-    # Quick removal of lines containing "DVD"
-    df = df[~df['Commentary'].str.contains("DVD", na=False)]
+    df = profiler.wrap("DVD filter", drop_dvd)(df)
     print(f"After DVD filter: {len(df)} rows")
 
     # Validate FEN & convert moves to SAN
     print("Converting moves to SAN notation...")
-    valid_indices = []
-    san_moves = []
-
-    for idx, row in df.iterrows():
-        if validate_fen(row['FEN']) and pd.notna(row['Move']):
-            san_move = convert_to_san(row['FEN'], row['Move'])
-            if san_move is not None:
-                valid_indices.append(idx)
-                san_moves.append(san_move)
-    
-    df = df.loc[valid_indices].copy()
-    df['SAN_Move'] = san_moves
+    df = profiler.wrap("FEN validation & SAN", add_san_moves)(df, workers=san_workers)
     print(f"After FEN validation & move conversion: {len(df)} rows")
 
-    # Filter out auto-generated game results
-    result_phrases = [
-        "1-0 Black resigns", "0-1 White resigns",
-        "0-1 Black wins by checkmate", "1-0 White wins by checkmate",
-        "1-0 White wins", "0-1 Black wins",
-        "1/2-1/2 The game is a draw", "Game drawn by repetition",
-        "Game drawn by agreement", "{username} won by resignation",
-        "{username} won on time", "{username} won by checkmate",
-        "White wins", "Black wins", "Game drawn",
-        "Draw by repetition", "Draw by agreement",
-        "1-0", "0-1", "1/2-1/2"
-    ]
-    auto_gen_mask = df['Commentary'].apply(lambda x: is_auto_generated(x, result_phrases))
-    df = df[~auto_gen_mask]
+    df = profiler.wrap("auto-generated results", drop_auto_generated)(df, rules)
     print(f"After removing auto-generated: {len(df)} rows")
 
-    # Clean up low-value [%eval] comments
-    df['Commentary'] = df['Commentary'].apply(clean_eval_comments)
-    df = df[df['Commentary'].notna()]
+    df = profiler.wrap("low-value eval comments", drop_low_value_comments)(df, rules)
     print(f"After cleaning eval comments: {len(df)} rows")
 
-    # Trim whitespace
-    df['Commentary'] = df['Commentary'].str.strip()
-
-    # Create Input/Output columns for training
-    df['Input'] = df.apply(lambda row: f"{row['FEN']} {row['SAN_Move']}", axis=1)
-    df['Output'] = df['Commentary']
+    df = profiler.wrap("training columns", build_training_columns)(df)
 
-    # Drop unneeded columns
-    df = df[['Input', 'Output', 'SAN_Move']]
-
-    # **Key fix**: write preprocessed CSV with full quoting so commentary remains intact
-    df.to_csv(
-        output_file,
-        index=False,
-        quoting=csv.QUOTE_ALL,
-        escapechar='\\',
-        lineterminator='\n'
-    )
+    # Typed columnar output; CSV exports keep full quoting so commentary remains intact
+    with profiler.stage("write", rows_in=len(df)):
+        write_table(df, output_file)
     print(f"\nPreprocessed data saved to {output_file}")
     print(f"Final row count: {len(df)}")
+    print_cache_stats()
+
+    print()
+    profiler.print_report()
+    if report_file:
+        profiler.write_report(report_file)
 
     # Display sample rows
     print("\nSample of final processed data:")
@@ -221,6 +384,11 @@ def preprocess_data(input_file, output_file):
         print(f"Output: {row['Output'][:100]}...")
 
 if __name__ == "__main__":
-    INPUT_FILE = "lichess_studies.csv"
-    OUTPUT_FILE = "preprocessed_lichess_data.csv"
-    preprocess_data(INPUT_FILE, OUTPUT_FILE)
\ No newline at end of file
+    from stage_options import build_parser
+    parser = build_parser("first_preprocess")
+    args = parser.parse_args()
+
+    INPUT_FILE = "lichess_studies.parquet"
+    OUTPUT_FILE = "preprocessed_lichess_data.parquet"  # Use a .csv name to export CSV instead
+    preprocess_data(INPUT_FILE, OUTPUT_FILE, san_workers=args.san_workers,
+                    profiler=Profiler("first_preprocess", profile=args.profile), report_file=args.report)
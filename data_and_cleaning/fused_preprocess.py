@@ -0,0 +1,63 @@
+from comment_rules import DEFAULT_RULES
+from data_io import ChunkWriter, iter_batches
+from dedup import Deduplicator
+from filter_engine import FusedPipeline, Stage
+from instrumentation import Profiler
+from first_preprocess import (TRAINING_COLUMNS, add_san_moves, build_training_columns, drop_auto_generated, drop_dvd,
+                              drop_low_value_comments, drop_null_commentary, keep_english, print_cache_stats)
+
+def build_cleaning_pipeline(san_workers=1, deduplicator=None, profiler=None, rules=DEFAULT_RULES):
+    """The first and second preprocessing passes as one fused pipeline.
+
+    Every stage applies `rules` as the standalone scripts do. Since each filter judges a row on its own,
+    the order only changes cost, so cheap string checks run first and language detection runs last,
+    on the fewest rows. With a `deduplicator`, repeated (FEN, SAN_Move, Commentary) rows are dropped
+    once SAN moves are known, before language detection.
+    """
+    stages = [
+        Stage("null commentary", drop_null_commentary),
+        Stage("DVD filter", drop_dvd),
+        Stage("auto-generated results", lambda df: drop_auto_generated(df, rules)),
+        Stage("low-value eval comments", lambda df: drop_low_value_comments(df, rules)),
+        # Checked on Commentary rather than Output: the two only differ by surrounding whitespace
+        Stage("problematic notation", lambda df: df[~rules.problematic_mask(df['Commentary'])]),
+        Stage("FEN validation & SAN", lambda df: add_san_moves(df, workers=san_workers)),
+        Stage("language filter", keep_english),
+        Stage("training columns", build_training_columns),
+    ]
+    if deduplicator is not None:
+        stages.insert(-2, Stage("deduplicate", deduplicator.drop_duplicates))
+    return FusedPipeline(stages, profiler)
+
+def preprocess_fused(input_file, output_file, batch_size=50_000, memory_map=False, san_workers=1,
+                     dedup=True, near_duplicates=False, profiler=None, report_file=None, rules=DEFAULT_RULES):
+    """Runs the whole cleaning step in one streaming pass: one read of the extracted studies,
+    one write of the natural commentary table. `rules` holds the commentary filters' settings (see
+    comment_rules.py). Pass `report_file` to save the run report as JSON."""
+    deduplicator = Deduplicator(near_duplicates=near_duplicates) if dedup else None
+    profiler = profiler or Profiler("fused_preprocess")
+    pipeline = build_cleaning_pipeline(san_workers, deduplicator, profiler, rules)
+    batches = iter_batches(input_file, batch_size=batch_size, memory_map=memory_map)
+    # Batches emptied early skip the last stages and keep the input columns, so declare the output's
+    with ChunkWriter(output_file, columns=TRAINING_COLUMNS) as writer:
+        rows_read, rows_written = pipeline.run(batches, writer)
+
+    print(f"\nRead {rows_read} rows, wrote {rows_written} rows to {output_file}")
+    profiler.print_report()
+    if report_file:
+        profiler.write_report(report_file)
+    print_cache_stats()
+    if deduplicator is not None:
+        deduplicator.print_report()
+    return pipeline.report()
+
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("fused_preprocess")
+    args = parser.parse_args()
+
+    INPUT_FILE = "lichess_studies.parquet"
+    OUTPUT_FILE = "natural_commentary.parquet"  # Use a .csv name to export CSV instead
+    preprocess_fused(INPUT_FILE, OUTPUT_FILE, san_workers=args.san_workers, dedup=not args.no_dedup,
+                     near_duplicates=args.near, profiler=Profiler("fused_preprocess", profile=args.profile),
+                     report_file=args.report)
@@ -0,0 +1,321 @@
+import asyncio
+import concurrent.futures
+import gzip
+import hashlib
+import http.client
+import io
+import json
+import os
+import time
+
+import requests
+import urllib3
+
+from downloader import TokenBucket, make_session, request_with_backoff
+
+CHUNK_SIZE = 1 << 16
+
+# What reading a response body raises when the connection fails partway; not a problem with the body itself
+TRANSPORT_ERRORS = (requests.RequestException, urllib3.exceptions.HTTPError, http.client.HTTPException, OSError)
+
+class StreamedBody(io.RawIOBase):
+    """A 200 response body read straight off the connection, decompressed as it arrives.
+
+    With a cache, every byte read is also gzip-written to a temporary file, which becomes the cache
+    entry once the body has been read to the end. Closing it earlier discards the file, so a partial
+    download never replaces a complete entry.
+    """
+
+    def __init__(self, response, cache=None, key=None, url=None):
+        self.response = response
+        # Let urllib3 undo any gzip transfer encoding, and report EOF instead of closing itself
+        response.raw.decode_content = True
+        response.raw.auto_close = False
+        self.cache = cache
+        self.key = key
+        self.url = url
+        self.file = self.compressed = None
+        if cache is not None:
+            self.tmp_path = f"{cache.paths(key)[1]}.tmp"
+            self.file = open(self.tmp_path, "wb")
+            self.compressed = gzip.GzipFile(fileobj=self.file, mode="wb", compresslevel=6)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.response.raw.readinto(buffer)
+        if self.compressed is not None:
+            if count:
+                self.compressed.write(memoryview(buffer)[:count])
+            elif len(buffer):
+                self.finish()
+        return count
+
+    def finish(self):
+        """Completes the cache entry: the whole body has been read."""
+        self.compressed.close()
+        self.file.close()
+        self.compressed = self.file = None
+        body_path = self.cache.paths(self.key)[1]
+        os.replace(self.tmp_path, body_path)
+        self.cache.write_meta(self.key, self.cache.describe(self.url, self.response, body_path))
+
+    def close(self):
+        if not self.closed:
+            if self.compressed is not None:
+                self.compressed.close()
+                self.file.close()
+                self.compressed = self.file = None
+                os.remove(self.tmp_path)
+            self.response.close()
+        super().close()
+
+class CachedResponse:
+    """A fetched body: a cache entry (gzip on disk), bytes held in memory when caching is off, or a
+    StreamedBody still being downloaded, which can only be opened once.
+
+    `status` is 200 whenever a body is available, including after a 304 revalidation;
+    `from_cache` tells whether the body came from disk.
+    """
+
+    def __init__(self, status, meta=None, path=None, content=None, from_cache=False, body=None):
+        self.status = status
+        self.meta = meta or {}
+        self.path = path
+        self._content = content
+        self.from_cache = from_cache
+        self.body = body
+
+    @property
+    def ok(self):
+        return self.path is not None or self._content is not None or self.body is not None
+
+    @property
+    def encoding(self):
+        return self.meta.get("encoding") or "utf-8"
+
+    def open(self):
+        """The decompressed body as a binary stream."""
+        if self.path is not None:
+            return gzip.open(self.path, "rb")
+        if self.body is not None:
+            return io.BufferedReader(self.body, CHUNK_SIZE)
+        return io.BytesIO(self._content)
+
+    def open_text(self):
+        """The body as a text stream, decompressed and decoded as it is read."""
+        return io.TextIOWrapper(self.open(), encoding=self.encoding, errors="replace")
+
+    @property
+    def content(self):
+        with self.open() as file:
+            return file.read()
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+class HTTPCache:
+    """On-disk response cache. Each entry is the body, gzip-compressed, plus a JSON file with its
+    ETag/Last-Modified validators, so a later request can be revalidated with a 304."""
+
+    def __init__(self, cache_dir="http_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(url, params=None, headers=None):
+        """Cache key of a request. The Authorization header is part of it, so tokens never share entries."""
+        authorization = (headers or {}).get("Authorization", "")
+        parts = [url, json.dumps(sorted((params or {}).items())), authorization]
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def paths(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json"), os.path.join(self.cache_dir, f"{key}.gz")
+
+    def get(self, key):
+        """The entry's metadata, or None if there is no complete entry."""
+        meta_path, body_path = self.paths(key)
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def response(self, key, meta):
+        return CachedResponse(200, meta, self.paths(key)[1], from_cache=True)
+
+    @staticmethod
+    def validators(meta):
+        """Conditional request headers for an entry."""
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def write_meta(self, key, meta):
+        meta_path = self.paths(key)[0]
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(meta, file, indent=2)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def store(self, key, url, response):
+        """Streams a 200 response into the entry and returns its metadata.
+
+        A gzip-encoded body is written as the server sent it; anything else is compressed on the way
+        to disk. The body is replaced before the metadata, so metadata always describes a whole body.
+        """
+        body_path = self.paths(key)[1]
+        with open(f"{body_path}.tmp", "wb") as file:
+            if response.headers.get("Content-Encoding", "").lower() == "gzip":
+                for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+                    file.write(chunk)
+            else:
+                with gzip.GzipFile(fileobj=file, mode="wb", compresslevel=6) as compressed:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        compressed.write(chunk)
+        os.replace(f"{body_path}.tmp", body_path)
+        meta = self.describe(url, response, body_path)
+        self.write_meta(key, meta)
+        return meta
+
+    @staticmethod
+    def describe(url, response, body_path):
+        """Metadata of an entry whose body was just written to `body_path`."""
+        now = time.time()
+        return {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type"),
+            "encoding": response.encoding,
+            "size": os.path.getsize(body_path),
+            "fetched_at": now,
+            "checked_at": now,
+        }
+
+    def revalidated(self, key, meta, headers):
+        """Records a 304 for an entry, taking any validators the server sent along with it."""
+        meta = dict(meta, checked_at=time.time())
+        meta["etag"] = headers.get("ETag") or meta.get("etag")
+        meta["last_modified"] = headers.get("Last-Modified") or meta.get("last_modified")
+        self.write_meta(key, meta)
+        return meta
+
+class AsyncFetcher:
+    """asyncio fetch layer shared by the scrapers: one pooled session, one rate-limit bucket, one cache.
+
+    Requests go out with the cached entry's validators and `Accept-Encoding: gzip`. A 304 serves the
+    cached body, and a 200 is streamed into the cache. When a request fails, a cached copy is served
+    instead. With `max_age` (seconds), entries checked more recently than that are served without a
+    request at all. Blocking I/O runs on a thread pool the size of the connection pool, so `fetch`
+    can be awaited from any event loop. `cache_dir=None` disables the cache and keeps bodies in memory.
+
+    With `stream=True` a 200 is not downloaded up front: the response holds a StreamedBody that the
+    caller reads as it arrives, filling the cache entry on the way.
+    """
+
+    def __init__(self, cache_dir="http_cache", concurrency=8, rate=1.0, max_age=None, max_retries=5,
+                 session=None, bucket=None):
+        self.cache = HTTPCache(cache_dir) if cache_dir else None
+        self.max_age = max_age
+        self.max_retries = max_retries
+        self.session = session or make_session(concurrency)
+        self.bucket = bucket or TokenBucket(rate=rate)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        self.loop = None
+
+    def fetch_blocking(self, url, params=None, headers=None, stream=False):
+        """Fetches one URL on the calling thread; returns a CachedResponse."""
+        key = meta = None
+        request_headers = {"Accept-Encoding": "gzip", **(headers or {})}
+        if self.cache is not None:
+            key = self.cache.key(url, params, headers)
+            meta = self.cache.get(key)
+            if meta is not None:
+                if self.max_age is not None and time.time() - meta["checked_at"] < self.max_age:
+                    return self.cache.response(key, meta)
+                request_headers.update(self.cache.validators(meta))
+
+        status, response = request_with_backoff(self.session, self.bucket, url, params, request_headers,
+                                                self.max_retries, stream=True, ok=(200, 304))
+        if response is None:
+            if meta is not None:
+                print(f"Request to {url} failed (status {status}); using the cached copy")
+                return self.cache.response(key, meta)
+            return CachedResponse(status)
+
+        if status == 200 and stream:
+            # The caller reads (and closes) the body, so the response stays open
+            return CachedResponse(status, {"url": url, "encoding": response.encoding},
+                                  body=StreamedBody(response, self.cache, key, url))
+        with response:
+            try:
+                if status == 304:
+                    if meta is None:
+                        # Only possible if the server ignores the request's (absent) validators
+                        print(f"Unexpected 304 for {url} without a cached copy")
+                        return CachedResponse(status)
+                    return self.cache.response(key, self.cache.revalidated(key, meta, response.headers))
+                if self.cache is None:
+                    return CachedResponse(status, {"url": url, "encoding": response.encoding},
+                                          content=response.content)
+                return CachedResponse(status, self.cache.store(key, url, response), self.cache.paths(key)[1])
+            except requests.RequestException as e:
+                print(f"Download of {url} failed: {e}")
+                if meta is not None:
+                    return self.cache.response(key, meta)
+                return CachedResponse(None)
+
+    async def fetch(self, url, params=None, headers=None, stream=False):
+        """Fetches one URL without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.fetch_blocking, url, params, headers, stream)
+
+    async def fetch_keyed(self, key, url, params=None, headers=None):
+        return key, await self.fetch(url, params, headers)
+
+    async def fetch_all(self, jobs):
+        """Fetches (key, url, params, headers) jobs concurrently, yielding (key, response) as each finishes."""
+        tasks = [asyncio.ensure_future(self.fetch_keyed(*job)) for job in jobs]
+        for task in asyncio.as_completed(tasks):
+            yield await task
+
+    def run(self, coroutine):
+        """Runs a coroutine on the fetcher's own event loop, for synchronous callers."""
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coroutine)
+
+    def get(self, url, params=None, headers=None, stream=False):
+        """Synchronous `fetch`."""
+        return self.run(self.fetch(url, params, headers, stream))
+
+    def iter_all(self, jobs):
+        """Synchronous `fetch_all`: a plain generator of (key, response) in completion order."""
+        results = self.fetch_all(jobs)
+        while True:
+            try:
+                yield self.run(results.__anext__())
+            except StopAsyncIteration:
+                return
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def fetch_url(url, params=None, headers=None, cache_dir="http_cache", **options):
+    """Fetches a single URL through a throwaway fetcher; returns a CachedResponse."""
+    with AsyncFetcher(cache_dir, concurrency=1, **options) as fetcher:
+        return fetcher.get(url, params, headers)
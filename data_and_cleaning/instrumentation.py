@@ -0,0 +1,208 @@
+import contextlib
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import re
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module; peak RSS is then not reported
+    resource = None
+
+def peak_rss_mb():
+    """High-water resident set size of this process in MB, or None where it cannot be read.
+
+    The mark never goes down, so it only says how much the process has needed so far.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def current_rss_mb():
+    """Resident set size of this process right now in MB, or None where it cannot be read (Linux only)."""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class StageMetrics:
+    """Totals for one named stage; entering the same stage again (e.g. once per batch) adds to them."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rss_delta_mb = None
+        self.process_peak_rss_mb = None
+        self.profile = None
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "calls": self.calls,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            # Source stages (reading, parsing) only produce rows, so nothing counts as dropped there
+            "dropped": max(self.rows_in - self.rows_out, 0),
+            "wall_seconds": round(self.wall_seconds, 4),
+            "cpu_seconds": round(self.cpu_seconds, 4),
+            "rows_per_second": round(max(self.rows_in, self.rows_out) / self.wall_seconds, 1)
+                               if self.wall_seconds else None,
+            # The stage's own effect: current RSS after minus before, summed over its calls
+            "rss_delta_mb": None if self.rss_delta_mb is None else round(self.rss_delta_mb, 1),
+            # The process-wide high-water mark when the stage last finished, which includes earlier stages
+            "process_peak_rss_mb": None if self.process_peak_rss_mb is None else round(self.process_peak_rss_mb, 1),
+            "profile": self.profile,
+        }
+
+class Profiler:
+    """Records wall time, CPU time, memory and rows in/out for each stage of a run.
+
+    CPU time is this process's own; work done in worker pools shows up as wall time only. Memory is
+    reported twice: the change in current RSS across the stage, which belongs to the stage alone,
+    and the process's peak RSS so far, which never decreases and so also reflects earlier stages.
+    With `profile=True` (or a set of stage names) each of those stages also runs under cProfile; the
+    stats are dumped to `profile_dir/<stage>.prof` and the top functions go into the report. `hook`
+    plugs in any other profiler: a callable taking the stage name and returning a context manager.
+    """
+
+    def __init__(self, name="run", profile=False, profile_dir="profiles", hook=None, top=15):
+        self.name = name
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.hook = hook
+        self.top = top
+        self.stages = {}
+        self.started = time.time()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.profiles = {}
+
+    def profiling(self, name):
+        return self.profile is True or (bool(self.profile) and name in self.profile)
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=0):
+        """Measures the enclosed block as stage `name`. Set `rows_out` on the yielded handle;
+        it defaults to `rows_in`."""
+        metrics = self.stages.setdefault(name, StageMetrics(name))
+        metrics.calls += 1
+        metrics.rows_in += rows_in
+        rows_before = metrics.rows_out
+        metrics.rows_out += rows_in
+        rss_before = current_rss_mb()
+        profile = None
+        if self.profiling(name):
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+        hook = self.hook(name) if self.hook else contextlib.nullcontext()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            with hook:
+                if profile is not None:
+                    profile.enable()
+                try:
+                    yield StageHandle(metrics, rows_before)
+                finally:
+                    if profile is not None:
+                        profile.disable()
+        finally:
+            metrics.wall_seconds += time.perf_counter() - wall
+            metrics.cpu_seconds += time.process_time() - cpu
+            rss_after = current_rss_mb()
+            if rss_before is not None and rss_after is not None:
+                metrics.rss_delta_mb = (metrics.rss_delta_mb or 0.0) + rss_after - rss_before
+            metrics.process_peak_rss_mb = peak_rss_mb()
+
+    def wrap(self, name, func):
+        """Wraps a DataFrame -> DataFrame function so each call is measured as stage `name`."""
+        def measured(df, *args, **kwargs):
+            with self.stage(name, rows_in=len(df)) as handle:
+                result = func(df, *args, **kwargs)
+                handle.rows_out = len(result)
+            return result
+        return measured
+
+    def summarize_profiles(self):
+        """Dumps each stage's cProfile stats and keeps its top functions by cumulative time."""
+        if not self.profiles:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        for name, profile in self.profiles.items():
+            path = os.path.join(self.profile_dir, f"{self.name}.{re.sub(r'[^A-Za-z0-9.-]+', '_', name)}.prof")
+            profile.dump_stats(path)
+            stream = io.StringIO()
+            stats = pstats.Stats(profile, stream=stream)
+            top = []
+            for (filename, line, function), (_, calls, _, cumulative, _) in sorted(
+                    stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]:
+                top.append({"function": f"{os.path.basename(filename)}:{line}({function})",
+                            "calls": calls, "cumulative_seconds": round(cumulative, 4)})
+            self.stages[name].profile = {"file": path, "top": top}
+
+    def report(self):
+        """Machine-readable run report: run metadata, totals and one entry per stage in run order."""
+        self.summarize_profiles()
+        return {
+            "run": self.name,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "argv": sys.argv,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "wall_seconds": round(time.perf_counter() - self.start_wall, 4),
+            "cpu_seconds": round(time.process_time() - self.start_cpu, 4),
+            "process_peak_rss_mb": None if peak_rss_mb() is None else round(peak_rss_mb(), 1),
+            "stages": [metrics.as_dict() for metrics in self.stages.values()],
+        }
+
+    def write_report(self, path):
+        """Writes the report as JSON and returns it."""
+        report = self.report()
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Run report saved to {path}")
+        return report
+
+    def print_report(self):
+        print(f"{'Stage':<28}{'Calls':>7}{'In':>10}{'Out':>10}{'Dropped':>10}{'Wall s':>9}{'CPU s':>9}"
+              f"{'Rows/s':>11}{'RSS +MB':>9}{'Peak so far':>12}")
+        for metrics in self.stages.values():
+            row = metrics.as_dict()
+            rate = f"{row['rows_per_second']:.0f}" if row["rows_per_second"] is not None else "-"
+            delta = f"{row['rss_delta_mb']:+.0f}" if row["rss_delta_mb"] is not None else "-"
+            peak = f"{row['process_peak_rss_mb']:.0f}" if row["process_peak_rss_mb"] is not None else "-"
+            print(f"{row['stage']:<28}{row['calls']:>7}{row['rows_in']:>10}{row['rows_out']:>10}{row['dropped']:>10}"
+                  f"{row['wall_seconds']:>9.2f}{row['cpu_seconds']:>9.2f}{rate:>11}{delta:>9}{peak:>12}")
+
+class StageHandle:
+    """What `Profiler.stage` yields: lets the block report how many rows it produced."""
+
+    def __init__(self, metrics, rows_before):
+        self.metrics = metrics
+        self.rows_before = rows_before
+
+    @property
+    def rows_out(self):
+        return self.metrics.rows_out - self.rows_before
+
+    @rows_out.setter
+    def rows_out(self, rows):
+        self.metrics.rows_out = self.rows_before + rows
+
+    def add_rows(self, rows_in, rows_out=None):
+        """Counts rows for blocks that only learn their sizes as they go (e.g. streamed downloads)."""
+        self.metrics.rows_in += rows_in
+        self.rows_out += rows_in if rows_out is None else rows_out
@@ -0,0 +1,46 @@
+import hashlib
+import sqlite3
+
+def text_key(text):
+    """Hash used as the cache key, so the cache never stores commentary itself."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class LanguageCache:
+    """On-disk map of text hash -> is-English verdict, kept across runs in a SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS language (key TEXT PRIMARY KEY, is_english INTEGER NOT NULL)"
+        )
+
+    def get_many(self, keys, query_size=500):
+        """Returns {key: is_english} for the keys already classified."""
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), query_size):
+            chunk = keys[i:i + query_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT key, is_english FROM language WHERE key IN ({placeholders})", chunk
+            )
+            found.update((key, bool(is_english)) for key, is_english in rows)
+        return found
+
+    def put_many(self, verdicts):
+        """Stores {key: is_english} verdicts."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO language (key, is_english) VALUES (?, ?)",
+                ((key, int(is_english)) for key, is_english in verdicts.items()),
+            )
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
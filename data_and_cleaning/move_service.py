@@ -0,0 +1,160 @@
+import asyncio
+import concurrent.futures
+import functools
+import os
+
+import chess
+import numpy as np
+import pandas as pd
+
+from data_io import ChunkWriter, iter_batches
+
+# Study positions repeat heavily (openings, chapters exported twice), so parse each FEN once
+FEN_CACHE_SIZE = 200_000
+
+# Columns returned for each (FEN, UCI) pair
+RESULT_COLUMNS = ["fen_valid", "move_legal", "san", "piece", "capture", "check", "castling", "promotion",
+                  "legal_moves"]
+
+@functools.lru_cache(maxsize=FEN_CACHE_SIZE)
+def parse_board(fen):
+    """Parse a FEN into a board, cached per FEN. Returns None if invalid. Callers must not mutate the board."""
+    try:
+        return chess.Board(fen)
+    except ValueError:
+        return None
+
+def analyze_pair(fen, uci, details=True):
+    """Validity, SAN and move metadata for one pair, as a tuple in RESULT_COLUMNS order."""
+    board = parse_board(fen) if isinstance(fen, str) else None
+    if board is None:
+        return (False, False, None, None, False, False, False, None, -1)
+    legal_moves = board.legal_moves.count() if details else -1
+    try:
+        move = chess.Move.from_uci(uci)
+    except (ValueError, TypeError):
+        return (True, False, None, None, False, False, False, None, legal_moves)
+    if move == chess.Move.null():
+        # A null move ("0000") is a pass in study analysis; kept with python-chess's SAN for it
+        return (True, True, "--", None, False, False, False, None, legal_moves)
+    if not board.is_legal(move):
+        return (True, False, None, None, False, False, False, None, legal_moves)
+    san = board.san(move)
+    if not details:
+        return (True, True, san, None, False, False, False, None, legal_moves)
+    promotion = chess.piece_symbol(move.promotion) if move.promotion else None
+    return (True, True, san, board.piece_at(move.from_square).symbol(), board.is_capture(move),
+            board.gives_check(move), board.is_castling(move), promotion, legal_moves)
+
+def analyze_chunk(pairs, details=True):
+    """Worker entry point: analyzes a chunk of (FEN, UCI) pairs."""
+    return [analyze_pair(fen, uci, details) for fen, uci in pairs]
+
+def as_list(values):
+    """Accepts lists, NumPy arrays, pandas Series and Arrow arrays or chunked arrays."""
+    if hasattr(values, "to_pylist"):
+        return values.to_pylist()
+    if hasattr(values, "tolist"):
+        return values.tolist()
+    return list(values)
+
+class MoveService:
+    """Bulk FEN/move validation and SAN conversion for any consumer, not just the preprocessing scripts.
+
+    Pairs are deduplicated, split into chunks and analyzed on a persistent process pool (in-process with
+    workers=1). `analyze` returns one row per input pair with the RESULT_COLUMNS; `analyze_async` does
+    the same without blocking an asyncio event loop.
+    """
+
+    def __init__(self, workers=None, chunk_size=20_000, details=True):
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.details = details
+        self.executor = None
+        if self.workers > 1:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+
+    def plan(self, fens, moves):
+        """Unique pairs split into chunks, plus each input row's index into the unique pairs."""
+        fens, moves = as_list(fens), as_list(moves)
+        if len(fens) != len(moves):
+            raise ValueError(f"Got {len(fens)} FENs but {len(moves)} moves")
+        slots = {}
+        inverse = np.fromiter((slots.setdefault(pair, len(slots)) for pair in zip(fens, moves)),
+                              dtype=np.int64, count=len(fens))
+        unique = list(slots)
+        chunk_size = self.chunk_size
+        if self.executor is not None and unique:
+            # At least a few chunks per worker so the pool stays balanced
+            chunk_size = max(1, min(chunk_size, -(-len(unique) // (4 * self.workers))))
+        chunks = [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+        return chunks, inverse
+
+    @staticmethod
+    def assemble(results, inverse):
+        """Maps the unique pairs' results back onto the input rows as a DataFrame."""
+        rows = [row for chunk in results for row in chunk]
+        table = pd.DataFrame.from_records(rows, columns=RESULT_COLUMNS) if rows else \
+            pd.DataFrame({column: [] for column in RESULT_COLUMNS})
+        return table.iloc[inverse].reset_index(drop=True).astype({
+            "fen_valid": bool, "move_legal": bool, "capture": bool, "check": bool, "castling": bool,
+            "legal_moves": np.int32,
+        })
+
+    def analyze(self, fens, moves):
+        """One row per (FEN, UCI) pair: validity masks, SAN (None if illegal) and move metadata."""
+        chunks, inverse = self.plan(fens, moves)
+        worker = functools.partial(analyze_chunk, details=self.details)
+        if self.executor is None or len(chunks) < 2:
+            results = [worker(chunk) for chunk in chunks]
+        else:
+            results = list(self.executor.map(worker, chunks))
+        return self.assemble(results, inverse)
+
+    async def analyze_async(self, fens, moves):
+        """Like `analyze`, awaiting the pool so an asyncio server keeps serving meanwhile."""
+        loop = asyncio.get_running_loop()
+        chunks, inverse = self.plan(fens, moves)
+        worker = functools.partial(analyze_chunk, details=self.details)
+        results = await asyncio.gather(*(loop.run_in_executor(self.executor, worker, chunk) for chunk in chunks))
+        return self.assemble(results, inverse)
+
+    def validate_fens(self, fens):
+        """Boolean mask of the FENs that parse."""
+        fens = as_list(fens)
+        unique = list(dict.fromkeys(fens))
+        valid = dict(zip(unique, (isinstance(fen, str) and parse_board(fen) is not None for fen in unique)))
+        return np.fromiter((valid[fen] for fen in fens), dtype=bool, count=len(fens))
+
+    def to_san(self, fens, moves):
+        """SAN for each pair, None where the FEN is invalid or the move is illegal."""
+        san = self.analyze(fens, moves)["san"]
+        return san.astype(object).where(san.notna(), None).tolist()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def annotate_table(input_file, output_file, workers=None, batch_size=1_000_000):
+    """Adds the RESULT_COLUMNS for each row's FEN/Move to a table, streaming it in batches."""
+    rows = 0
+    with MoveService(workers) as service, ChunkWriter(output_file) as writer:
+        for batch in iter_batches(input_file, batch_size=batch_size):
+            analysis = service.analyze(batch["FEN"], batch["Move"])
+            writer.write(pd.concat([batch.reset_index(drop=True), analysis], axis=1))
+            rows += len(batch)
+    print(f"Annotated {rows} rows to {output_file}")
+    return rows
+
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("move_service")
+    args = parser.parse_args()
+    annotate_table(args.input, args.output, workers=args.workers)
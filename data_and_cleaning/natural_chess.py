@@ -0,0 +1,75 @@
+import argparse
+import importlib.util
+import os
+import sys
+
+# The stages import each other as sibling modules, so they load from this directory wherever the CLI runs
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Subcommand -> (module whose command line it runs, summary). Nothing here imports the modules: a stage's
+# arguments are parsed with its stage_options parser first, so `--help` and argument errors cost no more
+# than argparse, and the stage and its dependencies load only when it runs.
+COMMANDS = {
+    "scrape": ("scrape_usernames", "collect the study authors from the blog post"),
+    "extract": ("extract_user_studies", "download and parse every author's studies"),
+    "preprocess": ("first_preprocess", "first pass: language, validation, SAN and quality filters"),
+    "filter": ("second_preprocess", "second pass: drop rows with problematic notation"),
+    "fused": ("fused_preprocess", "both preprocessing passes in one streaming pass"),
+    "dedup": ("dedup", "remove duplicate positions and commentary"),
+    "quality": ("quality", "score commentary quality for threshold-based export"),
+    "convert": ("colab_preprocess", "convert the commentary and literacy data to training JSONL"),
+    "tokenize": ("token_dataset", "pre-tokenize a JSONL dataset into memory-mapped arrays"),
+    "moves": ("move_service", "validate FEN/move pairs and add SAN and move metadata"),
+    "encode": ("position_encoding", "encode a table's positions into a compact binary array"),
+    "index": ("position_index", "build a Zobrist-hash position index for a table"),
+    "pipeline": ("pipeline", "run the whole pipeline, skipping up-to-date stages"),
+    "synthetic": ("synthetic_corpus", "write a deterministic synthetic study export"),
+    "benchmark": ("benchmark", "benchmark the pipeline on a synthetic corpus"),
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="natural-chess",
+        description="Data pipeline for natural-language chess commentary. "
+                    "Run `natural-chess COMMAND --help` for a command's options.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    for name, (_, summary) in COMMANDS.items():
+        # The stage's own parser handles its arguments, including --help
+        subparsers.add_parser(name, help=summary, add_help=False)
+    return parser
+
+def run_command(command, args=()):
+    """Runs a stage's command line as if it had been started directly, with `args` as its arguments."""
+    module, _ = COMMANDS[command]
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    from stage_options import build_parser
+    spec = importlib.util.find_spec(module)
+    if spec is None:
+        raise SystemExit(f"natural-chess: cannot find the {module} module for `{command}` in {SCRIPT_DIR}")
+    stage = importlib.util.module_from_spec(spec)
+    stage.__name__ = "__main__"
+    # Installed as __main__ so worker processes can unpickle functions the stage defines
+    saved = sys.argv, sys.modules["__main__"]
+    sys.argv = [f"natural-chess {command}", *args]
+    try:
+        # Exits here for --help or bad arguments, before the stage is imported
+        build_parser(module).parse_args(args)
+        sys.modules["__main__"] = stage
+        exec(spec.loader.get_code(module), stage.__dict__)
+    finally:
+        sys.argv, sys.modules["__main__"] = saved
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] not in COMMANDS:
+        parser = build_parser()
+        parser.parse_args(argv)
+        parser.print_help()
+        return 1
+    run_command(argv[0], argv[1:])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+import ast
+import concurrent.futures
+import functools
+import hashlib
+import json
+import os
+
+from comment_rules import PROBLEMATIC_NOTATIONS, RESULT_PHRASES, CommentRules
+
+STATE_FILE = ".pipeline_state.json"
+
+# The stage scripts live next to this file
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def file_digest(path, known=None):
+    """SHA-256 of a file. `known` maps path -> {size, mtime_ns, sha256}; a file whose size and mtime are
+    unchanged is not re-read."""
+    stat = os.stat(path)
+    entry = (known or {}).get(path)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    if known is not None:
+        known[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    return digest.hexdigest()
+
+def load_state(path):
+    """Loads the runner's record of past stage runs, or an empty one."""
+    if not os.path.exists(path):
+        return {"stages": {}, "files": {}}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def save_state(state, path):
+    """Writes the state atomically, as the crawl manifest is."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def module_path(module):
+    """Source file of one of the stage scripts, by module name."""
+    return os.path.join(SCRIPT_DIR, f"{module}.py")
+
+@functools.lru_cache(maxsize=None)
+def local_imports(module):
+    """The stage scripts a module imports anywhere in its source, including inside functions."""
+    with open(module_path(module), "r", encoding="utf-8") as file:
+        tree = ast.parse(file.read(), module_path(module))
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    return frozenset(name for name in names if os.path.exists(module_path(name)))
+
+def module_closure(modules):
+    """`modules` plus every stage script they import, directly or through each other, sorted by name."""
+    seen = set()
+    pending = list(modules)
+    while pending:
+        module = pending.pop()
+        if module not in seen:
+            seen.add(module)
+            pending.extend(local_imports(module))
+    return sorted(seen)
+
+class PipelineStage:
+    """One script step with declared files: called as func(*inputs, *outputs, **params).
+
+    The stage's cache key covers its function, the source of the `code` modules it runs and of every
+    stage script they import, the content of its inputs and its tracked params, so it reruns when any
+    of them change. `untracked` params are
+    passed but not hashed: an API token, or a worker count that does not change the outputs.
+    A `fetch` stage downloads external data: its outputs are reused whenever they exist, and only
+    --force fetches them again.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), params=None, untracked=None, fetch=False, code=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.untracked = untracked or {}
+        self.fetch = fetch
+        self.code = module_closure(code)
+
+    def cache_key(self, files):
+        """Hash of everything the stage's outputs depend on."""
+        digest = hashlib.sha256()
+        digest.update(f"{self.func.__module__}.{self.func.__qualname__}".encode("utf-8"))
+        for module in self.code:
+            # Editing a script or its rules (comment_rules.py, ...) reruns the stages that use it
+            digest.update(f"{module}={file_digest(module_path(module), files)}".encode("utf-8"))
+        for path in self.inputs:
+            digest.update(f"{path}={file_digest(path, files)}".encode("utf-8"))
+        digest.update(json.dumps(self.params, sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    def run(self):
+        return self.func(*self.inputs, *self.outputs, **self.params, **self.untracked)
+
+def run_stage(stage):
+    """Process-pool entry point."""
+    stage.run()
+    return stage.name
+
+class PipelineRunner:
+    """Runs stages in dependency order, skipping those whose cached outputs are still valid.
+
+    Dependencies come from the files: a stage depends on whichever stage writes one of its inputs.
+    Stages whose dependencies are done run side by side on up to `workers` processes. A stage whose
+    inputs, params and outputs all match its last run is skipped; when a rerun produces byte-identical
+    outputs, the stages downstream of it stay cached too.
+    """
+
+    def __init__(self, stages, state_path=STATE_FILE, workers=1):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = state_path
+        self.workers = workers
+        self.producers = {path: stage.name for stage in stages for path in stage.outputs}
+
+    def dependencies(self, stage):
+        return {self.producers[path] for path in stage.inputs if path in self.producers}
+
+    def plan(self, targets=None, force=()):
+        """Stage names needed for `targets` (stage names or output files; by default every final output), in order.
+
+        Fetched data that already exists is treated as a source, so the stages upstream of it are left out.
+        """
+        if targets:
+            wanted = {self.producers.get(target, target) for target in targets}
+        else:
+            consumed = {path for stage in self.stages.values() for path in stage.inputs}
+            wanted = {name for name, stage in self.stages.items() if not set(stage.outputs) <= consumed}
+        unknown = wanted - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stages or outputs: {', '.join(sorted(unknown))}")
+        order = []
+
+        def visit(name):
+            if name in order:
+                return
+            stage = self.stages[name]
+            fetched = stage.fetch and name not in force and all(os.path.exists(path) for path in stage.outputs)
+            if not fetched:
+                for dependency in sorted(self.dependencies(stage)):
+                    visit(dependency)
+            order.append(name)
+
+        for name in sorted(wanted):
+            visit(name)
+        return order
+
+    def is_cached(self, stage, state, force):
+        """True if the stage's last recorded run still holds. Returns (cached, reason)."""
+        if stage.name in force:
+            return False, "forced"
+        missing = [path for path in stage.outputs if not os.path.exists(path)]
+        if missing:
+            return False, f"missing {', '.join(missing)}"
+        if stage.fetch:
+            return True, "fetched"
+        record = state["stages"].get(stage.name)
+        if record is None:
+            return False, "never run"
+        if record["key"] != stage.cache_key(state["files"]):
+            return False, "inputs or params changed"
+        for path in stage.outputs:
+            if record["outputs"].get(path) != file_digest(path, state["files"]):
+                return False, f"{path} changed"
+        return True, "up to date"
+
+    def record(self, stage, state):
+        state["stages"][stage.name] = {
+            "key": stage.cache_key(state["files"]),
+            "outputs": {path: file_digest(path, state["files"]) for path in stage.outputs},
+        }
+
+    def run(self, targets=None, force=(), dry_run=False):
+        """Runs the planned stages; returns {stage: 'cached' | 'ran' | 'failed' | 'blocked'}."""
+        state = load_state(self.state_path)
+        force = set(force)
+        order = self.plan(targets, force)
+        status = {}
+        pending = list(order)
+        running = {}
+
+        def ready(name):
+            return all(status.get(dependency) in ("cached", "ran")
+                       for dependency in self.dependencies(self.stages[name]) if dependency in order)
+
+        def blocked(name):
+            return any(status.get(dependency) in ("failed", "blocked")
+                       for dependency in self.dependencies(self.stages[name]) if dependency in order)
+
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            while pending or running:
+                for name in list(pending):
+                    stage = self.stages[name]
+                    if blocked(name):
+                        status[name] = "blocked"
+                        pending.remove(name)
+                        print(f"[{name}] skipped: an upstream stage failed")
+                        continue
+                    if not ready(name):
+                        continue
+                    pending.remove(name)
+                    if dry_run and any(status.get(dependency) == "ran" for dependency in self.dependencies(stage)):
+                        status[name] = "ran"
+                        print(f"[{name}] would run (upstream stage reruns)")
+                        continue
+                    missing = [path for path in stage.inputs if not os.path.exists(path)]
+                    if missing and not (stage.fetch and self.is_cached(stage, state, force)[0]):
+                        status[name] = "failed"
+                        print(f"[{name}] cannot run: missing input {', '.join(missing)}")
+                        continue
+                    cached, reason = self.is_cached(stage, state, force)
+                    if cached:
+                        status[name] = "cached"
+                        print(f"[{name}] cached ({reason})")
+                        continue
+                    print(f"[{name}] {'would run' if dry_run else 'running'} ({reason})")
+                    if dry_run:
+                        status[name] = "ran"
+                    elif executor is None:
+                        status[name] = self.finish(stage, state, run_stage, stage)
+                    else:
+                        running[executor.submit(run_stage, stage)] = name
+
+                if running:
+                    done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        status[name] = self.finish(self.stages[name], state, future.result)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if not dry_run:
+                save_state(state, self.state_path)
+        return status
+
+    def finish(self, stage, state, func, *args):
+        """Collects a stage's result and records it if it produced all of its outputs."""
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"[{stage.name}] failed: {e}")
+            return "failed"
+        missing = [path for path in stage.outputs if not os.path.exists(path)]
+        if missing:
+            print(f"[{stage.name}] failed: did not write {', '.join(missing)}")
+            return "failed"
+        self.record(stage, state)
+        save_state(state, self.state_path)
+        print(f"[{stage.name}] done")
+        return "ran"
+
+def scrape_authors(output_file, url):
+    from scrape_usernames import scrape_usernames
+    scrape_usernames(url, output_file)
+
+def extract(usernames_file, output_file, token, **options):
+    from extract_user_studies import extract_studies
+    extract_studies(usernames_file, output_file, token, **options)
+
+def first_pass(input_file, output_file, min_length=63, arrow_min=80, result_phrases=RESULT_PHRASES, san_workers=1):
+    from first_preprocess import close_language_pool, close_san_pool, preprocess_data
+    rules = CommentRules(result_phrases=result_phrases, min_length=min_length, arrow_min=arrow_min)
+    try:
+        preprocess_data(input_file, output_file, san_workers=san_workers, rules=rules)
+    finally:
+        # A runner worker cannot exit while the pools it started are still alive
+        close_language_pool()
+        close_san_pool()
+
+def second_pass(input_file, output_file, problematic_notations=PROBLEMATIC_NOTATIONS):
+    from second_preprocess import remove_problematic_rows
+    remove_problematic_rows(input_file, output_file, problematic_notations=problematic_notations)
+
+def fused_pass(input_file, output_file, min_length=63, arrow_min=80, result_phrases=RESULT_PHRASES,
+               problematic_notations=PROBLEMATIC_NOTATIONS, dedup=True, near_duplicates=False, san_workers=1):
+    from first_preprocess import close_language_pool, close_san_pool
+    from fused_preprocess import preprocess_fused
+    rules = CommentRules(result_phrases=result_phrases, problematic_notations=problematic_notations,
+                         min_length=min_length, arrow_min=arrow_min)
+    try:
+        preprocess_fused(input_file, output_file, san_workers=san_workers, dedup=dedup,
+                         near_duplicates=near_duplicates, rules=rules)
+    finally:
+        close_language_pool()
+        close_san_pool()
+
+def quality_scores(input_file, output_file, cache_file="quality_features.parquet"):
+    from quality import score_table
+    score_table(input_file, output_file, cache_file=cache_file)
+
+def commentary_jsonl(input_file, output_file):
+    from colab_preprocess import convert_commentary
+    convert_commentary(input_file, output_file)
+
+def scored_commentary_jsonl(input_file, scores_file, output_file, min_score=0.5):
+    from colab_preprocess import convert_commentary
+    convert_commentary(input_file, output_file, min_score=min_score, scores_file=scores_file)
+
+def literacy_jsonl(input_csv, output_jsonl):
+    from colab_preprocess import csv_to_jsonl_literacy
+    csv_to_jsonl_literacy(input_csv, output_jsonl)
+
+def default_stages(token="PLACEHOLDER", fused=False, min_length=63, arrow_min=80,
+                   problematic_notations=PROBLEMATIC_NOTATIONS, san_workers=1, extract_workers=1, min_score=None):
+    """The README's Getting Started steps as stages, with the same file names."""
+    blog_url = "https://lichess.org/@/CyberShredder/blog/cool-lichess-studies-list/UOPFWocV"
+    stages = [
+        PipelineStage("scrape", scrape_authors, outputs=["study_authors.txt"], params={"url": blog_url}, fetch=True),
+        PipelineStage("extract", extract, inputs=["study_authors.txt"], outputs=["lichess_studies.parquet"],
+                      params={"workers": extract_workers}, untracked={"token": token}, fetch=True),
+    ]
+    # The worker count changes how fast SAN conversion runs, never its result
+    san = {"san_workers": san_workers}
+    if fused:
+        stages.append(PipelineStage("preprocess", fused_pass, inputs=["lichess_studies.parquet"],
+                                    outputs=["natural_commentary.parquet"],
+                                    params={"min_length": min_length, "arrow_min": arrow_min,
+                                            "problematic_notations": list(problematic_notations)},
+                                    untracked=san,
+                                    code=["fused_preprocess"]))
+    else:
+        stages += [
+            PipelineStage("first_preprocess", first_pass, inputs=["lichess_studies.parquet"],
+                          outputs=["preprocessed_lichess_data.parquet"],
+                          params={"min_length": min_length, "arrow_min": arrow_min}, untracked=san,
+                          code=["first_preprocess"]),
+            PipelineStage("second_preprocess", second_pass, inputs=["preprocessed_lichess_data.parquet"],
+                          outputs=["natural_commentary.parquet"],
+                          params={"problematic_notations": list(problematic_notations)},
+                          code=["second_preprocess"]),
+        ]
+    if min_score is not None:
+        # Features are cached across runs, so changing the threshold only reruns the conversion
+        stages += [
+            PipelineStage("quality", quality_scores, inputs=["natural_commentary.parquet"],
+                          outputs=["natural_commentary.quality.parquet"], code=["quality"]),
+            PipelineStage("commentary_jsonl", scored_commentary_jsonl,
+                          inputs=["natural_commentary.parquet", "natural_commentary.quality.parquet"],
+                          outputs=["natural_commentary.jsonl"], params={"min_score": min_score},
+                          code=["colab_preprocess"]),
+        ]
+    else:
+        stages.append(PipelineStage("commentary_jsonl", commentary_jsonl, inputs=["natural_commentary.parquet"],
+                                    outputs=["natural_commentary.jsonl"], code=["colab_preprocess"]))
+    stages += [
+        # The literacy conversions only depend on the downloaded CSVs, so they run alongside the commentary path
+        PipelineStage("literacy_test", literacy_jsonl, inputs=["test.csv"], outputs=["literacy_test.jsonl"],
+                      code=["colab_preprocess"]),
+        PipelineStage("literacy_train", literacy_jsonl, inputs=["train.csv"], outputs=["literacy_train.jsonl"],
+                      code=["colab_preprocess"]),
+    ]
+    return stages
+
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("pipeline")
+    args = parser.parse_args()
+
+    stages = default_stages(token=args.token, fused=args.fused, min_length=args.min_length,
+                            san_workers=args.san_workers, min_score=args.min_score)
+    status = PipelineRunner(stages, workers=args.workers).run(args.targets, force=args.force, dry_run=args.dry_run)
+    print(", ".join(f"{name}: {result}" for name, result in status.items()))
@@ -0,0 +1,191 @@
+import os
+
+import chess
+import numpy as np
+from numpy.lib import recfunctions
+
+from data_io import read_table
+
+# One fixed-size record per (position, move), 74 bytes packed.
+# Bitboards follow python-chess: occupied_co is indexed by color (BLACK=0, WHITE=1) and
+# pieces by piece type - 1 (pawns, knights, bishops, rooks, queens, kings).
+POSITION_DTYPE = np.dtype([
+    ("occupied_co", "<u8", (2,)),
+    ("pieces", "<u8", (6,)),
+    ("turn", "u1"),
+    ("castling", "u1"),          # bit flags, see CASTLING_CORNERS
+    ("ep_square", "i1"),         # -1 when there is none
+    ("halfmove_clock", "<u2"),
+    ("fullmove_number", "<u2"),
+    ("move_from", "i1"),         # -1 when there is no move
+    ("move_to", "i1"),
+    ("promotion", "u1"),         # piece type, 0 for none
+])
+
+# The fields that describe the position itself; move counters are left out so that the same
+# position reached at a different move number gets the same key
+KEY_FIELDS = ["occupied_co", "pieces", "turn", "castling", "ep_square"]
+
+# Standard chess only allows castling with the corner rooks, so the rights fit in four bits.
+# Chess960 rights (other rook files, a king off the e-file) do not, and are rejected by encode_board.
+CASTLING_CORNERS = [chess.BB_H1, chess.BB_A1, chess.BB_H8, chess.BB_A8]
+
+PIECE_VALUES = np.array([1, 3, 3, 5, 9, 0])
+
+def positions_path(table_path):
+    """Sidecar path the encoded positions of a table are stored at."""
+    root, _ = os.path.splitext(table_path)
+    return f"{root}.positions.npy"
+
+def split_input(text):
+    """Splits a training `Input` ("<FEN> <SAN>") back into its FEN and SAN move."""
+    fen, _, san = text.rstrip().rpartition(" ")
+    return fen, san
+
+def encode_board(board, move=None, out=None):
+    """Encodes a board (and optionally the move played from it) into one POSITION_DTYPE record.
+
+    Raises ValueError for what the record cannot hold: castling rights other than standard ones
+    (Chess960, or rights the position does not support) and piece drops. A null move is stored as
+    a1a1, which no real move can be, and decodes back to chess.Move.null().
+    """
+    rights = board.clean_castling_rights()
+    if board.castling_rights & ~rights or board.has_chess960_castling_rights():
+        raise ValueError(f"Castling rights of {board.fen()} cannot be encoded losslessly")
+    if move is not None and move.drop:
+        raise ValueError(f"Drop move {move.uci()} cannot be encoded")
+    record = np.zeros((), dtype=POSITION_DTYPE) if out is None else out
+    record["occupied_co"] = board.occupied_co
+    record["pieces"] = [board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings]
+    record["turn"] = board.turn
+    record["castling"] = sum(1 << i for i, corner in enumerate(CASTLING_CORNERS) if rights & corner)
+    record["ep_square"] = -1 if board.ep_square is None else board.ep_square
+    record["halfmove_clock"] = board.halfmove_clock
+    record["fullmove_number"] = board.fullmove_number
+    record["move_from"] = -1 if move is None else move.from_square
+    record["move_to"] = -1 if move is None else move.to_square
+    record["promotion"] = 0 if move is None or move.promotion is None else move.promotion
+    return record
+
+def decode_board(record):
+    """Rebuilds the board a record was encoded from."""
+    board = chess.Board(None)
+    board.occupied_co[chess.BLACK], board.occupied_co[chess.WHITE] = (int(bb) for bb in record["occupied_co"])
+    (board.pawns, board.knights, board.bishops,
+     board.rooks, board.queens, board.kings) = (int(bb) for bb in record["pieces"])
+    board.occupied = board.occupied_co[chess.WHITE] | board.occupied_co[chess.BLACK]
+    board.turn = bool(record["turn"])
+    castling = int(record["castling"])
+    board.castling_rights = sum(corner for i, corner in enumerate(CASTLING_CORNERS) if castling >> i & 1)
+    board.ep_square = None if record["ep_square"] < 0 else int(record["ep_square"])
+    board.halfmove_clock = int(record["halfmove_clock"])
+    board.fullmove_number = int(record["fullmove_number"])
+    return board
+
+def decode_fen(record, en_passant="legal"):
+    """The record's position as FEN. The default matches board.fen(), which produced the dataset's FENs;
+    pass en_passant="fen" to get back an en-passant square the source FEN listed even when no capture is legal."""
+    return decode_board(record).fen(en_passant=en_passant)
+
+def decode_move(record):
+    """The record's move as a chess.Move, or None if it was encoded without one."""
+    if record["move_from"] < 0:
+        return None
+    if record["move_from"] == record["move_to"]:
+        return chess.Move.null()
+    promotion = int(record["promotion"]) or None
+    return chess.Move(int(record["move_from"]), int(record["move_to"]), promotion=promotion)
+
+def encode_positions(fens, moves=None, sans=None):
+    """Encodes FENs with their UCI `moves` or SAN `sans` into a POSITION_DTYPE array.
+
+    Each distinct FEN is parsed once. Returns the array and a boolean mask of the rows that
+    encoded; invalid FENs or moves, and positions encode_board rejects, leave a zeroed record and
+    a False in the mask.
+    """
+    fens = list(fens)
+    positions = np.zeros(len(fens), dtype=POSITION_DTYPE)
+    valid = np.zeros(len(fens), dtype=bool)
+    boards = {}
+    for i, fen in enumerate(fens):
+        if fen not in boards:
+            try:
+                boards[fen] = chess.Board(fen) if isinstance(fen, str) else None
+            except ValueError:
+                boards[fen] = None
+        board = boards[fen]
+        if board is None:
+            continue
+        try:
+            if moves is not None:
+                move = chess.Move.from_uci(moves[i])
+            elif sans is not None:
+                move = board.parse_san(sans[i])
+            else:
+                move = None
+            encode_board(board, move, out=positions[i])
+        except (ValueError, TypeError, AttributeError):
+            continue
+        valid[i] = True
+    return positions, valid
+
+def decode_fens(positions, en_passant="legal"):
+    """FENs for a whole array of records."""
+    return [decode_fen(record, en_passant) for record in positions]
+
+def popcount(bitboards):
+    """Number of set bits in each uint64."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bitboards).astype(np.int64)
+    as_bytes = np.ascontiguousarray(bitboards).view(np.uint8).reshape(*np.shape(bitboards), 8)
+    return np.unpackbits(as_bytes, axis=-1).sum(axis=-1)
+
+def piece_counts(positions):
+    """(n, 2, 6) piece counts per color (BLACK, WHITE) and piece type, without building any boards."""
+    pieces = positions["pieces"][:, None, :]
+    colors = positions["occupied_co"][:, :, None]
+    return popcount(pieces & colors)
+
+def material_balance(positions):
+    """White material minus black material in pawns, vectorized over the array."""
+    counts = piece_counts(positions)
+    # Index with ints: chess.WHITE is True, which NumPy would read as a boolean mask
+    return (counts[:, int(chess.WHITE)] - counts[:, int(chess.BLACK)]) @ PIECE_VALUES
+
+def position_keys(positions, include_move=False):
+    """Fixed-width byte keys for hashing, dedup and np.unique; counters are excluded."""
+    fields = KEY_FIELDS + (["move_from", "move_to", "promotion"] if include_move else [])
+    packed = recfunctions.repack_fields(positions[fields])
+    return packed.view(np.dtype((np.void, packed.dtype.itemsize)))
+
+def save_positions(positions, path):
+    np.save(path, positions)
+
+def load_positions(path, mmap=True):
+    """Loads encoded positions; memory-mapped by default, so large arrays are paged in on demand."""
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+def encode_table(table_path, output_path=None, memory_map=False):
+    """Encodes a table's positions into a sidecar .positions.npy, row-aligned with the table.
+
+    Raw extraction tables are read from their FEN/Move columns, preprocessed ones from `Input`.
+    """
+    output_path = output_path or positions_path(table_path)
+    df = read_table(table_path, memory_map=memory_map)
+    if "FEN" in df.columns and "Move" in df.columns:
+        positions, valid = encode_positions(df["FEN"].tolist(), moves=df["Move"].tolist())
+    else:
+        fens, sans = zip(*(split_input(text) for text in df["Input"].tolist())) if len(df) else ((), ())
+        positions, valid = encode_positions(fens, sans=sans)
+    save_positions(positions, output_path)
+    size = positions.nbytes / 1e6
+    print(f"Encoded {valid.sum()}/{len(positions)} positions ({size:.1f} MB) to {output_path}")
+    if not valid.all():
+        print(f"{(~valid).sum()} rows could not be encoded and are left zeroed")
+    return positions, valid
+
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("position_encoding")
+    args = parser.parse_args()
+    encode_table(args.table, args.output)
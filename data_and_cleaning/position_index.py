@@ -0,0 +1,211 @@
+import json
+import os
+
+import chess
+import chess.polyglot
+import numpy as np
+import pandas as pd
+
+from data_io import read_table
+from position_encoding import split_input
+
+HASH_COLUMN = "Position_Hash"
+
+# Directory buckets are addressed by the top bits of a hash; capped so the directory stays small
+MAX_DIRECTORY_BITS = 24
+
+def position_hash(board):
+    """Polyglot Zobrist hash of a board as a signed 64-bit int, so it fits an int64 column.
+
+    The hash covers pieces, side to move, castling and legal en passant but not the move counters,
+    so a position reached through different move orders (a transposition) gets one hash.
+    """
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+def hash_fens(fens):
+    """Hashes a sequence of FENs, each distinct FEN once. Returns int64 hashes and a validity mask."""
+    fens = list(fens)
+    hashes = np.zeros(len(fens), dtype=np.int64)
+    valid = np.zeros(len(fens), dtype=bool)
+    known = {}
+    for i, fen in enumerate(fens):
+        if fen not in known:
+            try:
+                known[fen] = position_hash(chess.Board(fen)) if isinstance(fen, str) else None
+            except ValueError:
+                known[fen] = None
+        if known[fen] is not None:
+            hashes[i] = known[fen]
+            valid[i] = True
+    return hashes, valid
+
+def as_key(position):
+    """Index key (uint64) for a hash, a chess.Board or a FEN string."""
+    if isinstance(position, chess.Board):
+        position = position_hash(position)
+    elif isinstance(position, str):
+        position = position_hash(chess.Board(position))
+    return np.int64(position).view(np.uint64)
+
+def index_path(table_path):
+    """Directory the position index of a table is stored in."""
+    root, _ = os.path.splitext(table_path)
+    return f"{root}.position_index"
+
+class PositionIndex:
+    """Maps Zobrist hashes to the table rows holding that position.
+
+    Stored CSR-style: sorted distinct `keys`, `starts` into the grouped `rows`, plus a directory over the
+    top bits of the hash. Zobrist hashes are uniform, so each directory bucket holds about one key and a
+    single lookup is O(1); batch lookups run as one vectorized search.
+    """
+
+    def __init__(self, keys, starts, rows, directory_bits=None):
+        self.keys = keys
+        self.starts = starts
+        self.rows = rows
+        if directory_bits is None:
+            directory_bits = min(MAX_DIRECTORY_BITS, max(1, int(np.ceil(np.log2(max(len(keys), 1))))))
+        self.directory_bits = directory_bits
+        self.shift = np.uint64(64 - directory_bits)
+        bucket_starts = np.arange(1 << directory_bits, dtype=np.uint64) << self.shift
+        self.directory = np.append(np.searchsorted(keys, bucket_starts), len(keys))
+
+    @classmethod
+    def from_hashes(cls, hashes, rows=None):
+        """Builds an index from one hash per row; `rows` defaults to the row offsets 0..n-1."""
+        hashes = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+        rows = np.arange(len(hashes), dtype=np.int64) if rows is None else np.asarray(rows, dtype=np.int64)
+        order = np.argsort(hashes, kind="stable")
+        keys, first = np.unique(hashes[order], return_index=True)
+        starts = np.append(first, len(hashes)).astype(np.int64)
+        return cls(keys, starts, rows[order])
+
+    def __len__(self):
+        """Number of distinct positions."""
+        return len(self.keys)
+
+    def find(self, position):
+        """Slot of a position in `keys`, or -1."""
+        key = as_key(position)
+        bucket = int(key >> self.shift)
+        for slot in range(self.directory[bucket], self.directory[bucket + 1]):
+            if self.keys[slot] == key:
+                return slot
+        return -1
+
+    def __contains__(self, position):
+        return self.find(position) >= 0
+
+    def lookup(self, position):
+        """Row offsets of every occurrence of a position (a hash, board or FEN); empty if unseen."""
+        slot = self.find(position)
+        if slot < 0:
+            return self.rows[:0]
+        return self.rows[self.starts[slot]:self.starts[slot + 1]]
+
+    def find_many(self, hashes):
+        """Slots for many hashes at once, -1 where a position is not indexed."""
+        keys = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+        slots = np.searchsorted(self.keys, keys)
+        slots[slots == len(self.keys)] = 0
+        found = (self.keys[slots] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        return np.where(found, slots, -1)
+
+    def lookup_many(self, hashes):
+        """Batch lookup: returns (query, rows), pairing each matched row offset with the query it belongs to."""
+        slots = self.find_many(hashes)
+        queries = np.flatnonzero(slots >= 0)
+        starts = self.starts[slots[queries]]
+        counts = self.starts[slots[queries] + 1] - starts
+        query = np.repeat(queries, counts)
+        # Offsets into each query's run of rows
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return query, self.rows[np.repeat(starts, counts) + within]
+
+    def counts(self):
+        """Occurrences of each indexed position, aligned with `keys`."""
+        return np.diff(self.starts)
+
+    def flat(self):
+        """(hashes, rows) for every indexed row."""
+        return np.repeat(self.keys, self.counts()).view(np.int64), self.rows
+
+    def merge(self, other, row_offset=0):
+        """Combines two indexes, e.g. of tables written one after another; `other`'s rows are shifted by
+        `row_offset`. Positions present in both end up under one key."""
+        hashes, rows = self.flat()
+        other_hashes, other_rows = other.flat()
+        return PositionIndex.from_hashes(np.concatenate([hashes, other_hashes]),
+                                         np.concatenate([rows, other_rows + row_offset]))
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "keys.npy"), self.keys)
+        np.save(os.path.join(path, "starts.npy"), self.starts)
+        np.save(os.path.join(path, "rows.npy"), self.rows)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump({"positions": len(self.keys), "rows": len(self.rows),
+                       "directory_bits": self.directory_bits}, file, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads a saved index; the arrays are memory-mapped by default."""
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        return cls(np.load(os.path.join(path, "keys.npy"), mmap_mode=mode),
+                   np.load(os.path.join(path, "starts.npy"), mmap_mode=mode),
+                   np.load(os.path.join(path, "rows.npy"), mmap_mode=mode),
+                   directory_bits=meta["directory_bits"])
+
+def table_hashes(df):
+    """Position hashes for a table: the extracted Position_Hash column, else hashed from FEN or Input."""
+    if HASH_COLUMN in df.columns and df[HASH_COLUMN].notna().all():
+        return df[HASH_COLUMN].to_numpy(dtype=np.int64), np.ones(len(df), dtype=bool)
+    if "FEN" in df.columns:
+        return hash_fens(df["FEN"].tolist())
+    return hash_fens(split_input(text)[0] for text in df["Input"].tolist())
+
+def build_position_index(table_path, output_path=None, memory_map=False):
+    """Indexes every row of a table by position and saves the index next to it."""
+    output_path = output_path or index_path(table_path)
+    df = read_table(table_path, memory_map=memory_map)
+    hashes, valid = table_hashes(df)
+    rows = np.flatnonzero(valid)
+    index = PositionIndex.from_hashes(hashes[rows], rows)
+    index.save(output_path)
+    print(f"Indexed {len(rows)} rows, {len(index)} distinct positions, to {output_path}")
+    if not valid.all():
+        print(f"{(~valid).sum()} rows with invalid FENs were not indexed")
+    return index
+
+def aggregate_commentary(index, df, positions):
+    """Gathers the commentary for each queried position across all authors and studies.
+
+    `positions` are hashes, boards or FENs. Returns one row per found position with its occurrence and
+    author counts, the distinct FENs merged into it (transpositions and move-counter variants), and
+    the commentary itself.
+    """
+    hashes = np.array([as_key(position) for position in positions], dtype=np.uint64).view(np.int64)
+    query, rows = index.lookup_many(hashes)
+    if not len(rows):
+        return pd.DataFrame(columns=["Position_Hash", "Occurrences", "Authors", "Studies", "FENs", "Commentary"])
+    matched = df.iloc[rows].assign(**{HASH_COLUMN: hashes[query]})
+    fen_column = "FEN" if "FEN" in matched.columns else "Input"
+    text_column = "Commentary" if "Commentary" in matched.columns else "Output"
+    groups = matched.groupby(HASH_COLUMN, sort=False)
+    return pd.DataFrame({
+        "Occurrences": groups.size(),
+        "Authors": groups["Username"].nunique() if "Username" in matched.columns else np.nan,
+        "Studies": groups["Study_ID"].nunique() if "Study_ID" in matched.columns else np.nan,
+        "FENs": groups[fen_column].agg(lambda fens: sorted(set(fens))),
+        "Commentary": groups[text_column].agg(list),
+    }).reset_index()
+
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("position_index")
+    args = parser.parse_args()
+    build_position_index(args.table, args.output)
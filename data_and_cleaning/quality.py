@@ -0,0 +1,266 @@
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_io import iter_batches, temp_path, write_table
+from dedup import normalize_text
+from move_service import parse_board
+from position_encoding import split_input
+
+# Vocabulary whose density marks commentary that actually talks about chess
+CHESS_TERMS = [
+    "pawn", "knight", "bishop", "rook", "queen", "king", "piece", "exchange", "castle", "castling",
+    "attack", "defend", "defence", "defense", "threat", "centre", "center", "file", "diagonal", "rank",
+    "square", "tempo", "initiative", "endgame", "opening", "middlegame", "sacrifice", "pin", "fork",
+    "skewer", "check", "mate", "checkmate", "weakness", "structure", "outpost", "passed", "isolated",
+    "doubled", "backward", "majority", "kingside", "queenside", "fianchetto", "development", "space",
+    "advantage", "tactical", "positional", "plan", "counterplay", "zugzwang", "promotion", "trade",
+]
+TERMS_RE = r"\b(?:" + "|".join(CHESS_TERMS) + r")(?:s|es|ed|ing)?\b"
+
+# SAN-looking tokens in prose: piece moves, pawn moves and captures, promotions, castling
+MOVE_RE = r"\b(?:[KQRBN][a-h]?[1-8]?x?[a-h][1-8]|[a-h]x[a-h][1-8](?:=[QRBN])?|[a-h][1-8](?:=[QRBN])?)[+#]?|\bO-O(?:-O)?[+#]?"
+
+# Per-row features, cached by row hash; `text_hash` feeds the table-wide duplicate count
+FEATURE_DTYPES = {
+    "length": np.int32,
+    "words": np.int32,
+    "term_density": np.float32,
+    "move_refs": np.int32,
+    "grounded_refs": np.int32,
+    "fragment": bool,
+    "text_hash": np.uint64,
+}
+FEATURE_COLUMNS = list(FEATURE_DTYPES)
+
+# Relative weight of each component of the score; every component is in [0, 1]
+QUALITY_WEIGHTS = {
+    "length": 0.3,      # longer commentary, saturating around 400 characters
+    "terms": 0.25,      # chess vocabulary per word, saturating at 15%
+    "grounding": 0.15,  # share of move references that are legal around the position
+    "complete": 0.15,   # reads as complete sentences rather than a fragment
+    "unique": 0.15,     # 1 / number of rows with the same text
+}
+
+def row_keys(batch):
+    """Cache key of each row: a 64-bit hash of its exact Input and Output."""
+    return pd.util.hash_pandas_object(batch[["Input", "Output"]], index=False).to_numpy(dtype=np.uint64)
+
+def strip_check(san):
+    return san.rstrip("+#")
+
+@functools.lru_cache(maxsize=100_000)
+def legal_sans(fen):
+    """SAN of every legal move in a position, without check marks; empty for invalid FENs."""
+    board = parse_board(fen)
+    if board is None:
+        return frozenset()
+    return frozenset(strip_check(board.san(move)) for move in board.legal_moves)
+
+@functools.lru_cache(maxsize=100_000)
+def position_after(fen, san):
+    """FEN after playing `san`, or None if it cannot be played."""
+    board = parse_board(fen)
+    if board is None:
+        return None
+    board = board.copy(stack=False)
+    try:
+        board.push_san(san)
+    except ValueError:
+        return None
+    return board.fen()
+
+def grounded_count(input_value, references):
+    """How many referenced moves are the played move or legal just before or after it."""
+    fen, san = split_input(input_value)
+    playable = {strip_check(san)} | legal_sans(fen)
+    after = position_after(fen, san)
+    if after is not None:
+        playable |= legal_sans(after)
+    return sum(strip_check(reference) in playable for reference in references)
+
+def compute_features(batch):
+    """FEATURE_COLUMNS for a batch with Input ("FEN SAN") and Output (commentary) columns.
+
+    Everything but move grounding runs on whole columns; the board checks only visit rows that
+    mention a move, with legal-move sets cached per position.
+    """
+    text = batch["Output"].fillna("").astype(object).str.strip()
+    words = text.str.split().str.len().fillna(0).astype(np.int32)
+    terms = text.str.lower().str.count(TERMS_RE).astype(np.int32)
+    move_refs = text.str.count(MOVE_RE).astype(np.int32)
+
+    grounded = np.zeros(len(batch), dtype=np.int32)
+    mentions = np.flatnonzero(move_refs.to_numpy() > 0)
+    if len(mentions):
+        inputs = batch["Input"].iloc[mentions].fillna("").astype(str)
+        references = text.iloc[mentions].str.findall(MOVE_RE)
+        grounded[mentions] = [grounded_count(value, refs) for value, refs in zip(inputs, references)]
+
+    ends_sentence = text.str.contains(r"[.!?)\"']$", regex=True)
+    starts_sentence = text.str.match(r"(?:[A-Z0-9\"'(]|[a-h][1-8x])")
+    fragment = ~ends_sentence | ~starts_sentence | (words < 4)
+
+    return pd.DataFrame({
+        "length": text.str.len().astype(np.int32).to_numpy(),
+        "words": words.to_numpy(),
+        "term_density": np.where(words > 0, terms / np.maximum(words, 1), 0.0).astype(np.float32),
+        "move_refs": move_refs.to_numpy(),
+        "grounded_refs": grounded,
+        "fragment": fragment.to_numpy(dtype=bool),
+        "text_hash": pd.util.hash_pandas_object(normalize_text(text), index=False).to_numpy(dtype=np.uint64),
+    })
+
+class FeatureCache:
+    """Features of every row scored so far, keyed by row hash and kept in a Parquet file across runs.
+
+    Only rows whose Input/Output changed are recomputed, so rescoring a table, or a new table that
+    mostly overlaps an old one, costs little more than reading it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.table = empty_features().set_index(pd.Index([], dtype=np.uint64, name="key"))
+        if path and os.path.exists(path):
+            self.table = pd.read_parquet(path).set_index("key")
+        self.new = []
+
+    def positions(self, keys):
+        """Row of each key in the cache, -1 where it is not cached."""
+        return self.table.index.get_indexer(keys)
+
+    def add(self, keys, features):
+        self.new.append(features.set_axis(pd.Index(keys, name="key")))
+
+    def save(self):
+        if not self.path or not self.new:
+            return
+        self.table = pd.concat([self.table, *self.new])
+        self.table = self.table[~self.table.index.duplicated(keep="last")]
+        self.new = []
+        tmp_path = temp_path(self.path)
+        write_table(self.table.reset_index(), tmp_path)
+        os.replace(tmp_path, self.path)
+
+def empty_features(rows=0):
+    return pd.DataFrame({column: np.zeros(rows, dtype=dtype) for column, dtype in FEATURE_DTYPES.items()})
+
+def batch_features(batch, cache=None):
+    """Features for a batch, taking cached rows from `cache` and computing (and caching) the rest."""
+    keys = row_keys(batch)
+    if cache is None:
+        return keys, compute_features(batch)
+    positions = cache.positions(keys)
+    found = positions >= 0
+    features = empty_features(len(batch))
+    if found.any():
+        cached = cache.table.iloc[positions[found]]
+        for column in FEATURE_COLUMNS:
+            features.loc[found, column] = cached[column].to_numpy()
+    if not found.all():
+        missing = ~found
+        computed = compute_features(batch[missing])
+        cache.add(keys[missing], computed)
+        for column in FEATURE_COLUMNS:
+            features.loc[missing, column] = computed[column].to_numpy()
+    return keys, features
+
+def score(features, weights=QUALITY_WEIGHTS):
+    """Quality score in [0, 1] per row from its features and the table-wide `duplicates` count."""
+    length = np.clip(np.log1p(features["length"]) / np.log1p(400), 0, 1)
+    terms = np.clip(features["term_density"] / 0.15, 0, 1)
+    refs = features["move_refs"]
+    # Rows without move references are neither rewarded nor penalised for grounding
+    grounding = np.where(refs > 0, features["grounded_refs"] / np.maximum(refs, 1), 0.5)
+    complete = 1.0 - features["fragment"].astype(float)
+    unique = 1.0 / np.maximum(features["duplicates"], 1)
+    components = {"length": length, "terms": terms, "grounding": grounding, "complete": complete, "unique": unique}
+    total = sum(weights.values())
+    return (sum(weights[name] * np.asarray(components[name], dtype=float) for name in weights) / total).astype(
+        np.float32)
+
+def scores_path(table_path):
+    """Where the scores of a table live: `<table>.quality.parquet` next to it."""
+    root, _ = os.path.splitext(table_path)
+    return f"{root}.quality.parquet"
+
+def score_table(input_file, scores_file=None, cache_file="quality_features.parquet", weights=QUALITY_WEIGHTS,
+                batch_size=50_000):
+    """Scores every row of a commentary table and writes the row-aligned scores file.
+
+    The scores file holds each row's key, features, duplicate count and score. Features come from
+    `cache_file` where the row was seen before; pass None to disable the cache.
+    """
+    scores_file = scores_file or scores_path(input_file)
+    cache = FeatureCache(cache_file) if cache_file else None
+    keys = []
+    frames = []
+    for batch in iter_batches(input_file, batch_size=batch_size, columns=["Input", "Output"]):
+        batch_keys, features = batch_features(batch, cache)
+        keys.append(batch_keys)
+        frames.append(features)
+    if cache is not None:
+        cache.save()
+
+    features = pd.concat(frames, ignore_index=True) if frames else empty_features()
+    # Duplicates are counted across the whole table, so they are never cached per row
+    _, inverse, counts = np.unique(features["text_hash"].to_numpy(dtype=np.uint64), return_inverse=True,
+                                   return_counts=True)
+    features["duplicates"] = counts[inverse].astype(np.int32)
+    features["score"] = score(features, weights)
+    features.insert(0, "key", np.concatenate(keys) if keys else np.array([], dtype=np.uint64))
+    write_table(features, scores_file)
+    print(f"Scored {len(features)} rows of {input_file}; scores saved to {scores_file}")
+    return features
+
+def print_score_summary(scores, thresholds=(0.3, 0.4, 0.5, 0.6, 0.7, 0.8)):
+    """How many rows each candidate cutoff would keep."""
+    values = scores["score"].to_numpy()
+    print(f"{'Min score':>10}{'Kept':>10}{'Share':>9}")
+    for threshold in thresholds:
+        kept = int((values >= threshold).sum())
+        share = kept / len(values) if len(values) else 0.0
+        print(f"{threshold:>10.2f}{kept:>10}{share:>9.1%}")
+
+class ScoreFilter:
+    """Keeps the rows scoring at least `min_score` while a table is streamed batch by batch.
+
+    Batches must arrive in table order. Their row keys are checked against the scores file, so a
+    table that changed after scoring fails loudly instead of being filtered with the wrong scores.
+    """
+
+    def __init__(self, input_file, min_score, scores_file=None):
+        scores_file = scores_file or scores_path(input_file)
+        if not os.path.exists(scores_file):
+            raise FileNotFoundError(f"No quality scores at {scores_file}; run quality.py on {input_file} first")
+        scores = pd.read_parquet(scores_file, columns=["key", "score"])
+        self.keys = scores["key"].to_numpy(dtype=np.uint64)
+        self.keep = scores["score"].to_numpy() >= min_score
+        self.min_score = min_score
+        self.offset = 0
+        self.kept = 0
+
+    def __call__(self, batch):
+        end = self.offset + len(batch)
+        if end > len(self.keys) or not np.array_equal(row_keys(batch), self.keys[self.offset:end]):
+            raise ValueError("Quality scores do not match the table; rescore it with quality.py")
+        keep = self.keep[self.offset:end]
+        self.offset = end
+        self.kept += int(keep.sum())
+        return batch[keep]
+
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("quality")
+    args = parser.parse_args()
+
+    weights = dict(QUALITY_WEIGHTS)
+    for item in args.weight:
+        name, _, value = item.partition("=")
+        if name not in weights:
+            parser.error(f"unknown weight {name!r}; choose from {', '.join(QUALITY_WEIGHTS)}")
+        weights[name] = float(value)
+    scores = score_table(args.input, args.scores, cache_file=None if args.no_cache else args.cache, weights=weights)
+    print_score_summary(scores)
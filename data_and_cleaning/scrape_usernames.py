@@ -1,15 +1,18 @@
-import requests
 from bs4 import BeautifulSoup
 import re
+from http_fetch import fetch_url
 
-def scrape_usernames(url, output_file):
+BLOG_URL = "https://lichess.org/@/CyberShredder/blog/cool-lichess-studies-list/UOPFWocV"
+
+def scrape_usernames(url, output_file, cache_dir="http_cache"):
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
     
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        print(f"Failed to fetch the webpage: {response.status_code}")
+    # Reruns revalidate the cached page and only download it again if it changed
+    response = fetch_url(url, headers=headers, cache_dir=cache_dir)
+    if not response.ok:
+        print(f"Failed to fetch the webpage: {response.status}")
         return
 
     soup = BeautifulSoup(response.content, "html.parser")
@@ -66,7 +69,8 @@ def scrape_usernames(url, output_file):
     print(f"Saved {len(usernames)} unique usernames to {output_file}.")
 
 if __name__ == "__main__":
-    BLOG_URL = "https://lichess.org/@/CyberShredder/blog/cool-lichess-studies-list/UOPFWocV"
-    OUTPUT_FILE = "study_authors.txt"
+    from stage_options import build_parser
+    parser = build_parser("scrape_usernames")
+    args = parser.parse_args()
 
-    scrape_usernames(BLOG_URL, OUTPUT_FILE)
\ No newline at end of file
+    scrape_usernames(args.url or BLOG_URL, args.output, cache_dir=args.http_cache)
\ No newline at end of file
@@ -1,36 +1,67 @@
-import pandas as pd
+from data_io import read_table, write_table
+from comment_rules import DEFAULT_RULES, PROBLEMATIC_NOTATIONS, CommentRules
+from instrumentation import Profiler
 
-def remove_problematic_rows(input_file, output_file):
+def problematic_mask(outputs, problematic_notations=PROBLEMATIC_NOTATIONS):
+    """Return a boolean mask of outputs containing any problematic notation."""
+    rules = DEFAULT_RULES if problematic_notations is PROBLEMATIC_NOTATIONS else \
+        CommentRules(problematic_notations=problematic_notations)
+    return rules.problematic_mask(outputs)
+
+def drop_problematic_notation(df, problematic_notations=PROBLEMATIC_NOTATIONS, column='Output'):
+    """Keep only rows whose `column` text has none of the problematic notations."""
+    return df[~problematic_mask(df[column], problematic_notations)]
+
+def remove_problematic_rows(input_file, output_file, memory_map=False, problematic_notations=PROBLEMATIC_NOTATIONS,
+                            profiler=None, report_file=None):
     """
     Removes rows from the dataset where the 'Output' column contains any of the
     problematic notations: '[csl', '[cal', '[gsl', '[eval', or '→'.
 
     Args:
-        input_file (str): Path to the input CSV file.
-        output_file (str): Path to save the filtered CSV file.
+        input_file (str): Path to the input Parquet, Arrow or CSV file.
+        output_file (str): Path to save the filtered data; a .csv path exports fully quoted CSV.
+        memory_map (bool): Memory-map the input instead of reading it into a buffer.
+        problematic_notations (list): Substrings that mark a row as problematic.
+        profiler (Profiler): Measures each step; a fresh one by default.
+        report_file (str): Where to save the JSON run report, if anywhere.
     """
+    profiler = profiler or Profiler("second_preprocess")
+
     # Load the dataset
-    df = pd.read_csv(input_file)
+    with profiler.stage("read") as stage:
+        df = read_table(input_file, memory_map=memory_map)
+        stage.rows_out = len(df)
     print(f"Initial row count: {len(df)}")
 
-    # List of problematic substrings to search for
-    problematic_notations = ['[%csl', '[%cal', '[%eval', '→']
+    with profiler.stage("problematic notation", rows_in=len(df)) as stage:
+        # Create a mask to detect rows containing any problematic notation
+        mask = problematic_mask(df['Output'], problematic_notations)
 
-    # Create a mask to detect rows containing any problematic notation
-    mask = df['Output'].apply(lambda x: any(notation in str(x) for notation in problematic_notations))
+        # Debug: Count how many rows are being removed
+        print(f"Rows containing problematic notations: {mask.sum()}")
 
-    # Debug: Count how many rows are being removed
-    print(f"Rows containing problematic notations: {mask.sum()}")
-
-    # Keep only rows that do not contain problematic notations
-    filtered_df = df[~mask].copy()
+        # Keep only rows that do not contain problematic notations
+        filtered_df = df[~mask].copy()
+        stage.rows_out = len(filtered_df)
 
     # Save the filtered dataset
-    filtered_df.to_csv(output_file, index=False, quoting=1)  # quoting=1 is csv.QUOTE_ALL
+    with profiler.stage("write", rows_in=len(filtered_df)):
+        write_table(filtered_df, output_file)
     print(f"Filtered dataset saved to {output_file}")
     print(f"Final row count: {len(filtered_df)}")
 
+    print()
+    profiler.print_report()
+    if report_file:
+        profiler.write_report(report_file)
+
 if __name__ == "__main__":
-    INPUT_FILE = "preprocessed_lichess_data.csv"  # Replace with your input file path
-    OUTPUT_FILE = "natural_commentary.csv"  # Replace with your desired output file path
-    remove_problematic_rows(INPUT_FILE, OUTPUT_FILE)
+    from stage_options import build_parser
+    parser = build_parser("second_preprocess")
+    args = parser.parse_args()
+
+    INPUT_FILE = "preprocessed_lichess_data.parquet"  # Replace with your input file path
+    OUTPUT_FILE = "natural_commentary.parquet"  # Replace with your desired output file path (.csv to export CSV)
+    remove_problematic_rows(INPUT_FILE, OUTPUT_FILE, profiler=Profiler("second_preprocess", profile=args.profile),
+                            report_file=args.report)
@@ -0,0 +1,150 @@
+import argparse
+import os
+
+# Command-line options of every stage script, by module name. This module imports nothing but argparse
+# and os, so natural-chess can parse a stage's arguments (and print its --help) before loading the stage
+# and its dependencies. Each script builds its own parser from here as well, so options live in one place.
+PARSERS = {}
+
+def options(module, description):
+    """Registers a function that adds `module`'s arguments to its parser."""
+    def register(add_arguments):
+        PARSERS[module] = (description, add_arguments)
+        return add_arguments
+    return register
+
+def build_parser(module):
+    """The argument parser of a stage script."""
+    description, add_arguments = PARSERS[module]
+    parser = argparse.ArgumentParser(description=description)
+    add_arguments(parser)
+    return parser
+
+def add_run_report(parser):
+    parser.add_argument("--report", default=None, help="save a JSON run report (per-stage time, memory, rows)")
+    parser.add_argument("--profile", action="store_true", help="run each stage under cProfile (stats in profiles/)")
+
+@options("scrape_usernames", "Collect the study authors listed in the Lichess blog post.")
+def scrape_options(parser):
+    parser.add_argument("output", nargs="?", default="study_authors.txt")
+    parser.add_argument("--url", default=None, help="blog post listing the studies (default: the Lichess list)")
+    parser.add_argument("--http-cache", default="http_cache", help="response cache directory")
+
+@options("extract_user_studies", "Download and parse Lichess studies for each author.")
+def extract_options(parser):
+    parser.add_argument("--stream", action="store_true", help="stream exports into the output table in chunks")
+    parser.add_argument("--workers", type=int, default=1, help="concurrent downloads (rate-limited)")
+    parser.add_argument("--resume", action="store_true",
+                        help="checkpointed crawl that only fetches new or changed studies")
+    parser.add_argument("--parse-workers", type=int, default=1,
+                        help="processes used to parse each export (games are split between them)")
+    parser.add_argument("--index", action="store_true",
+                        help="also build a position index (lookup of every row by Zobrist hash)")
+    add_run_report(parser)
+    parser.add_argument("--http-cache", default="http_cache",
+                        help="directory caching the exports; reruns only download what changed")
+    parser.add_argument("--no-http-cache", action="store_true", help="download every export again")
+    parser.add_argument("--cache-max-age", type=float, default=None,
+                        help="reuse cached exports checked less than this many seconds ago without asking the server")
+    parser.add_argument("--variations", action="store_true",
+                        help="also extract comments from sidelines, with their path and branch position")
+    parser.add_argument("--max-depth", type=int, default=None, help="skip sidelines nested deeper than this")
+
+@options("first_preprocess", "First preprocessing pass over the extracted studies.")
+def first_preprocess_options(parser):
+    add_run_report(parser)
+    parser.add_argument("--san-workers", type=int, default=1, help="processes converting moves to SAN")
+
+@options("second_preprocess", "Second preprocessing pass: drop rows with problematic notation.")
+def second_preprocess_options(parser):
+    add_run_report(parser)
+
+@options("fused_preprocess", "Run both preprocessing passes in one streaming pass.")
+def fused_preprocess_options(parser):
+    parser.add_argument("--no-dedup", action="store_true", help="keep duplicate (FEN, move, commentary) rows")
+    parser.add_argument("--near", action="store_true", help="also drop near-duplicate commentary (MinHash/LSH)")
+    add_run_report(parser)
+    parser.add_argument("--san-workers", type=int, default=1, help="processes converting moves to SAN")
+
+@options("dedup", "Remove duplicate positions/commentary from a table.")
+def dedup_options(parser):
+    parser.add_argument("input_file", nargs="?", default="natural_commentary.parquet")
+    parser.add_argument("output_file", nargs="?", default="natural_commentary_dedup.parquet")
+    parser.add_argument("--near", action="store_true", help="also drop near-duplicate commentary (MinHash/LSH)")
+
+@options("quality", "Score commentary quality for threshold-based export filtering.")
+def quality_options(parser):
+    parser.add_argument("input", nargs="?", default="natural_commentary.parquet")
+    parser.add_argument("--scores", default=None, help="scores file (default: <input>.quality.parquet)")
+    parser.add_argument("--cache", default="quality_features.parquet", help="feature cache shared across runs")
+    parser.add_argument("--no-cache", action="store_true", help="recompute every row's features")
+    parser.add_argument("--weight", action="append", default=[], metavar="NAME=VALUE",
+                        help="override a score weight (repeatable); the names are QUALITY_WEIGHTS in quality.py")
+
+@options("colab_preprocess", "Convert the commentary and literacy data to training JSONL.")
+def colab_preprocess_options(parser):
+    parser.add_argument("--min-score", type=float, default=None,
+                        help="only export commentary whose quality score (quality.py) is at least this")
+    parser.add_argument("--scores", default=None, help="quality scores file (default: <table>.quality.parquet)")
+    parser.add_argument("--shards", default=None, metavar="DIR",
+                        help="export the commentary as size-bounded shards with an index.json into DIR")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl", help="shard format")
+    parser.add_argument("--max-shard-mb", type=float, default=64, help="uncompressed size limit per shard")
+
+@options("token_dataset", "Pre-tokenize a JSONL dataset into memory-mapped token arrays.")
+def token_dataset_options(parser):
+    parser.add_argument("tokenizer", help="local tokenizer directory (loaded with local_files_only)")
+    parser.add_argument("input_path", nargs="?", default="natural_commentary.jsonl",
+                        help="JSONL file or shard directory with index.json")
+    parser.add_argument("output_dir", nargs="?", default="natural_commentary_tokens")
+    parser.add_argument("--pack", type=int, default=None, help="pack records into sequences of this many tokens")
+
+@options("move_service", "Validate FEN/move pairs and add SAN and move metadata to a table.")
+def move_service_options(parser):
+    parser.add_argument("input", nargs="?", default="lichess_studies.parquet")
+    parser.add_argument("output", nargs="?", default="lichess_studies_moves.parquet")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+
+@options("position_encoding", "Encode a table's positions into a compact binary array.")
+def position_encoding_options(parser):
+    parser.add_argument("table", nargs="?", default="natural_commentary.parquet")
+    parser.add_argument("output", nargs="?", default=None, help="defaults to <table>.positions.npy")
+
+@options("position_index", "Build a Zobrist-hash position index for a table.")
+def position_index_options(parser):
+    parser.add_argument("table", nargs="?", default="lichess_studies.parquet")
+    parser.add_argument("output", nargs="?", default=None, help="defaults to <table>.position_index")
+
+@options("pipeline", "Run the data pipeline, skipping stages whose outputs are up to date.")
+def pipeline_options(parser):
+    parser.add_argument("targets", nargs="*", help="stage names or output files to build (default: everything)")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                        help="rerun this stage even if cached (repeatable)")
+    parser.add_argument("--workers", type=int, default=1, help="run up to this many independent stages at once")
+    parser.add_argument("--dry-run", action="store_true", help="only show what would run")
+    parser.add_argument("--fused", action="store_true", help="use fused_preprocess.py instead of the two passes")
+    parser.add_argument("--min-length", type=int, default=63, help="minimum commentary length kept")
+    parser.add_argument("--san-workers", type=int, default=1, help="processes converting moves to SAN")
+    parser.add_argument("--token", default=os.environ.get("LICHESS_TOKEN", "PLACEHOLDER"),
+                        help="Lichess API token (defaults to $LICHESS_TOKEN)")
+    parser.add_argument("--min-score", type=float, default=None,
+                        help="score commentary quality and only export rows scoring at least this")
+
+@options("synthetic_corpus", "Write a deterministic synthetic Lichess study export.")
+def synthetic_corpus_options(parser):
+    parser.add_argument("output", nargs="?", default="synthetic_studies.pgn")
+    parser.add_argument("--nodes", type=int, default=100_000, help="number of moves to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--comment-rate", type=float, default=0.35, help="share of moves with a comment")
+
+@options("benchmark", "Benchmark the pipeline on a deterministic synthetic corpus.")
+def benchmark_options(parser):
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all); an unknown name lists them")
+    parser.add_argument("--nodes", type=int, default=10_000, help="moves in the synthetic export (1k to 10M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--micro", action="store_true", help="only micro benchmarks")
+    parser.add_argument("--language-rows", type=int, default=500, help="sample size for language detection")
+    parser.add_argument("--save", default=None, help="write the results as a baseline JSON file")
+    parser.add_argument("--compare", default=None, help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown counted as a regression")
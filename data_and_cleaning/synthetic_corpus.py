@@ -0,0 +1,201 @@
+import random
+
+import chess
+import chess.pgn
+import pandas as pd
+
+from comment_rules import RESULT_PHRASES
+
+# Building blocks for commentary that reads like study annotations
+OPENERS = [
+    "This move", "The knight", "White's last move", "Black", "The bishop pair", "This pawn break",
+    "The rook lift", "Castling here", "The queen trade", "The exchange sacrifice",
+]
+CLAIMS = [
+    "fights for control of the centre", "prepares a kingside attack", "weakens the light squares around the king",
+    "gives Black a comfortable position", "creates a passed pawn on the queenside",
+    "keeps the tension in the centre", "leaves the d5 square permanently weak", "activates the worst piece",
+    "is a typical idea in this pawn structure", "was the main point of the previous manoeuvre",
+]
+REASONS = [
+    "because the e-file is about to open", "since the king is still in the centre",
+    "as the isolated pawn will need constant protection", "which gives White a lasting positional advantage",
+    "and the tactical justification is Nxf7 next", "so the endgame should be a draw with accurate play",
+    "while the opponent's pieces are badly coordinated", "because the space advantage restricts every black piece",
+]
+FOREIGN = [
+    "Der Springer steht hier sehr gut und kontrolliert das Zentrum, Weiß hat leichten Vorteil.",
+    "Las negras tienen una posición sólida, pero el alfil de casillas blancas está muy pasivo.",
+    "Les blancs préparent une attaque sur l'aile roi, le fou est très actif sur la diagonale.",
+    "Белые готовят атаку на королевском фланге, и у чёрных большие проблемы.",
+]
+SHORT = ["Good move!", "Only move.", "Interesting.", "The main line.", "!?", "Novelty"]
+USERNAMES = ["ChessTeacher", "StudyAuthor", "OpeningLab", "EndgameFan", "TacticsTrainer", "Annotator42"]
+
+# Relative weight of each comment kind among commented nodes
+COMMENT_MIX = {
+    "natural": 0.55,
+    "eval_natural": 0.08,
+    "eval_only": 0.07,
+    "low_value": 0.06,
+    "arrow": 0.05,
+    "shapes": 0.04,
+    "result": 0.04,
+    "short": 0.06,
+    "foreign": 0.04,
+    "dvd": 0.01,
+}
+
+def natural_comment(rng):
+    """One or two sentences of plausible English annotation."""
+    sentences = []
+    for _ in range(rng.choice([1, 1, 2])):
+        sentences.append(f"{rng.choice(OPENERS)} {rng.choice(CLAIMS)} {rng.choice(REASONS)}.")
+    return " ".join(sentences)
+
+def eval_tag(rng):
+    return f"[%eval {rng.uniform(-3, 3):.2f}]"
+
+def make_comment(rng, kind, board, username):
+    """A comment of the given kind for the move about to be played from `board`."""
+    if kind == "natural":
+        return natural_comment(rng)
+    if kind == "eval_natural":
+        return f"{eval_tag(rng)} {natural_comment(rng)}"
+    if kind == "eval_only":
+        return eval_tag(rng)
+    if kind == "low_value":
+        best = board.san(rng.choice(list(board.legal_moves)))
+        label = rng.choice(["Inaccuracy", "Mistake", "Blunder"])
+        return f"{label}. {best} was best. {eval_tag(rng)}" if rng.random() < 0.5 else \
+            f"{eval_tag(rng)} {label}. {best} was best."
+    if kind == "arrow":
+        square = chess.square_name(rng.randrange(64))
+        return f"→ {square}" if rng.random() < 0.5 else f"Idea → {square} soon"
+    if kind == "shapes":
+        arrows = " ".join(f"G{chess.square_name(rng.randrange(64))}{chess.square_name(rng.randrange(64))}"
+                          for _ in range(rng.randint(1, 3)))
+        return f"[%cal {arrows}] [%csl R{chess.square_name(rng.randrange(64))}] {natural_comment(rng)}"
+    if kind == "result":
+        return rng.choice(RESULT_PHRASES).format(username=username)
+    if kind == "short":
+        return rng.choice(SHORT)
+    if kind == "foreign":
+        return rng.choice(FOREIGN)
+    return f"See the full explanation on my DVD. {natural_comment(rng)}"
+
+def comment_kinds(rng, mix=COMMENT_MIX):
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    while True:
+        yield rng.choices(kinds, weights)[0]
+
+def random_game(rng, plies):
+    """A random legal line of up to `plies` moves (fewer if the game ends), as a list of moves."""
+    board = chess.Board()
+    moves = []
+    for _ in range(plies):
+        legal = list(board.legal_moves)
+        if not legal:
+            break
+        move = rng.choice(legal)
+        moves.append(move)
+        board.push(move)
+    return moves
+
+def iter_pgn_games(nodes, seed=0, comment_rate=0.35, plies=(20, 120), chapters_per_study=8,
+                   mix=COMMENT_MIX, repeat_rate=0.1, repeat_pool=1000):
+    """Yields Lichess-style study chapters as PGN strings until `nodes` moves have been written.
+
+    Deterministic for a given seed and arguments. Roughly `comment_rate` of the moves carry a comment,
+    drawn from `mix`. `repeat_rate` of the chapters replay an earlier chapter's line, as studies
+    often do, so caches and deduplication see realistic repetition. Repeats are drawn from a uniform
+    reservoir sample of at most `repeat_pool` earlier lines, so memory stays flat at any corpus size.
+    """
+    rng = random.Random(seed)
+    kinds = comment_kinds(rng, mix)
+    written = 0
+    chapter = 0
+    lines = []
+    new_lines = 0
+    while written < nodes:
+        study_id = f"{rng.getrandbits(32):08x}"
+        username = rng.choice(USERNAMES)
+        for number in range(1, chapters_per_study + 1):
+            if written >= nodes:
+                break
+            if lines and rng.random() < repeat_rate:
+                moves = rng.choice(lines)
+            else:
+                moves = random_game(rng, rng.randint(*plies))
+                new_lines += 1
+                if len(lines) < repeat_pool:
+                    lines.append(moves)
+                else:
+                    # Reservoir sampling: every line so far is kept with equal probability
+                    slot = rng.randrange(new_lines)
+                    if slot < repeat_pool:
+                        lines[slot] = moves
+            moves = moves[:nodes - written]
+
+            game = chess.pgn.Game()
+            game.headers["Event"] = f"Study {study_id}: Chapter {number}"
+            game.headers["Site"] = f"https://lichess.org/study/{study_id}/{chapter:08x}"
+            game.headers["Annotator"] = f"https://lichess.org/@/{username}"
+            game.headers["Result"] = "*"
+            node = game
+            board = chess.Board()
+            for move in moves:
+                comment = make_comment(rng, next(kinds), board, username) if rng.random() < comment_rate else ""
+                node = node.add_variation(move, comment=comment)
+                board.push(move)
+            written += len(moves)
+            chapter += 1
+            yield str(game)
+
+def generate_pgn(nodes, seed=0, **options):
+    """The whole synthetic export as one string, games separated as in a Lichess export."""
+    return "\n\n\n".join(iter_pgn_games(nodes, seed, **options)) + "\n"
+
+def write_pgn(path, nodes, seed=0, **options):
+    """Streams a synthetic export to `path` without holding it in memory; returns the number of games."""
+    games = 0
+    with open(path, "w", encoding="utf-8") as file:
+        for game in iter_pgn_games(nodes, seed, **options):
+            file.write(game)
+            file.write("\n\n\n")
+            games += 1
+    return games
+
+def generate_positions(rows, seed=0, mix=COMMENT_MIX, pool_size=2000):
+    """An extraction-shaped table (Study_ID, FEN, Move, Commentary, Username) without writing PGN.
+
+    Positions come from a pool of random games, so FENs repeat like they do across real studies.
+    """
+    rng = random.Random(seed)
+    kinds = comment_kinds(rng, mix)
+    pool = []
+    while len(pool) < min(pool_size, rows):
+        board = chess.Board()
+        for move in random_game(rng, rng.randint(10, 80)):
+            pool.append((board.fen(), move))
+            board.push(move)
+    records = []
+    for _ in range(rows):
+        fen, move = rng.choice(pool)
+        username = rng.choice(USERNAMES)
+        records.append({
+            "Study_ID": f"{rng.getrandbits(16):04x}",
+            "FEN": fen,
+            "Move": move.uci(),
+            "Commentary": make_comment(rng, next(kinds), chess.Board(fen), username),
+            "Username": username,
+        })
+    return pd.DataFrame(records)
+
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("synthetic_corpus")
+    args = parser.parse_args()
+    games = write_pgn(args.output, args.nodes, args.seed, comment_rate=args.comment_rate)
+    print(f"Wrote {games} games ({args.nodes} moves) to {args.output}")
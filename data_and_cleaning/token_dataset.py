@@ -0,0 +1,175 @@
+import gzip
+import json
+import os
+
+import numpy as np
+
+FIELDS = ["instruction", "input", "response"]
+
+def load_tokenizer(name_or_path):
+    """Loads a Hugging Face tokenizer from a local directory without touching the network."""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(name_or_path, local_files_only=True)
+
+def open_text(path):
+    return gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, "r", encoding="utf-8")
+
+def iter_records(path):
+    """Yields instruction/input/response dicts from a JSONL file or a shard directory with an index.json.
+
+    Shard records only carry input and response, so their instruction is rebuilt from the index.
+    """
+    index_path = os.path.join(path, "index.json") if os.path.isdir(path) else None
+    if index_path is None:
+        with open_text(path) as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    with open(index_path, "r", encoding="utf-8") as file:
+        index = json.load(file)
+    for shard in index["shards"]:
+        shard_path = os.path.join(path, shard["file"])
+        if index["format"] == "parquet":
+            import pandas as pd
+            records = pd.read_parquet(shard_path).to_dict("records")
+        else:
+            with open_text(shard_path) as file:
+                records = [json.loads(line) for line in file if line.strip()]
+        for record in records:
+            record["instruction"] = index["instruction_template"].format(
+                instruction_prefix=index["instruction_prefix"], input=record["input"])
+            yield record
+
+def token_dtype(tokenizer):
+    """uint16 when every token id fits, halving the file size; uint32 otherwise."""
+    return np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+def pack_records(lengths, seq_len):
+    """Greedy in-order packing: returns (n_packs, 2) [first record, end record) ranges whose
+    token counts fit in `seq_len`. A record longer than `seq_len` gets a pack of its own."""
+    packs = []
+    start = 0
+    used = 0
+    for i, length in enumerate(lengths):
+        if i > start and used + length > seq_len:
+            packs.append((start, i))
+            start = i
+            used = 0
+        used += length
+    if start < len(lengths):
+        packs.append((start, len(lengths)))
+    return np.asarray(packs, dtype=np.int64).reshape(-1, 2)
+
+def build_token_dataset(input_path, output_dir, tokenizer, batch_size=1000, pack_length=None):
+    """Tokenizes every record once and writes a memory-mappable dataset to `output_dir`.
+
+    tokens.bin   - all token ids back to back (uint16/uint32)
+    offsets.npy  - (n_records, 4) token offsets: instruction, input and response starts, and record end
+    packs.npy    - with `pack_length`, (n_packs, 2) record ranges packed into sequences of that many tokens
+                   (each record plus an EOS token when the tokenizer has one)
+    meta.json    - tokenizer, dtype and counts
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    dtype = token_dtype(tokenizer)
+    tokens_path = os.path.join(output_dir, "tokens.bin")
+    offsets = []
+    position = 0
+
+    def flush(batch, tokens_file):
+        nonlocal position
+        # One batched call per field; fast tokenizers parallelise these internally
+        encoded = {field: tokenizer([str(record.get(field) or "") for record in batch],
+                                    add_special_tokens=False)["input_ids"] for field in FIELDS}
+        for i in range(len(batch)):
+            starts = []
+            for field in FIELDS:
+                ids = np.asarray(encoded[field][i], dtype=dtype)
+                starts.append(position)
+                tokens_file.write(ids.tobytes())
+                position += len(ids)
+            offsets.append(starts + [position])
+
+    with open(tokens_path, "wb") as tokens_file:
+        batch = []
+        for record in iter_records(input_path):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                flush(batch, tokens_file)
+                batch = []
+        if batch:
+            flush(batch, tokens_file)
+
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, len(FIELDS) + 1)
+    np.save(os.path.join(output_dir, "offsets.npy"), offsets)
+
+    eos_token_id = getattr(tokenizer, "eos_token_id", None)
+    meta = {
+        "tokenizer": getattr(tokenizer, "name_or_path", type(tokenizer).__name__),
+        "vocab_size": len(tokenizer),
+        "dtype": np.dtype(dtype).name,
+        "fields": FIELDS,
+        "records": len(offsets),
+        "tokens": int(position),
+        "eos_token_id": eos_token_id,
+        "pack_length": pack_length,
+    }
+    if pack_length:
+        lengths = offsets[:, -1] - offsets[:, 0] + (1 if eos_token_id is not None else 0)
+        packs = pack_records(lengths, pack_length)
+        np.save(os.path.join(output_dir, "packs.npy"), packs)
+        meta["packs"] = len(packs)
+
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file, indent=2)
+    print(f"Tokenized {meta['records']} records into {meta['tokens']} tokens in {output_dir}"
+          + (f" ({meta['packs']} packs of up to {pack_length} tokens)" if pack_length else ""))
+    return meta
+
+class TokenDataset:
+    """Read-only view over a built token dataset; records are slices of one memory-mapped array."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+            self.meta = json.load(file)
+        if self.meta["tokens"]:
+            self.tokens = np.memmap(os.path.join(path, "tokens.bin"), dtype=self.meta["dtype"], mode="r")
+        else:
+            # An empty file cannot be memory-mapped
+            self.tokens = np.zeros(0, dtype=self.meta["dtype"])
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        packs_path = os.path.join(path, "packs.npy")
+        self.packs = np.load(packs_path, mmap_mode="r") if os.path.exists(packs_path) else None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        """The record's fields as token-id views (no copy)."""
+        bounds = self.offsets[i]
+        return {field: self.tokens[bounds[j]:bounds[j + 1]] for j, field in enumerate(self.meta["fields"])}
+
+    def record_tokens(self, i):
+        """All of a record's tokens, instruction through response."""
+        return self.tokens[self.offsets[i][0]:self.offsets[i][-1]]
+
+    def pack(self, i):
+        """The records of pack i joined into one new array, each followed by EOS when available.
+
+        Unlike records, packs are copies; use `packs[i]` and `record_tokens` to read them without copying.
+        """
+        start, end = self.packs[i]
+        eos = self.meta["eos_token_id"]
+        parts = []
+        for record in range(start, end):
+            parts.append(self.record_tokens(record))
+            if eos is not None:
+                parts.append(np.asarray([eos], dtype=self.tokens.dtype))
+        return np.concatenate(parts)
+
+if __name__ == "__main__":
+    from stage_options import build_parser
+    parser = build_parser("token_dataset")
+    args = parser.parse_args()
+    build_token_dataset(args.input_path, args.output_dir, load_tokenizer(args.tokenizer), pack_length=args.pack)
@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The scripts import each other as sibling modules, so the tests run with their directory on the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data_and_cleaning"))
+
+class StandInServer:
+    """Local stand-in for the Lichess API.
+
+    Each path serves a scripted list of responses in turn, repeating the last one. A response is a
+    (status, headers, body) tuple, or a callable taking the request headers and returning one. A
+    Content-Length header longer than the body, with `Connection: close`, cuts the response short.
+    Every request is recorded as (path, headers).
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionError:
+                    # The client hung up mid-response, as an abandoned stream does
+                    pass
+
+            def do_GET(self):
+                stand_in.respond(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def route(self, path, *responses):
+        self.routes[path] = list(responses)
+
+    def requests_to(self, path):
+        return [headers for requested, headers in self.requests if requested == path]
+
+    def respond(self, request):
+        path = request.path.split("?")[0]
+        with self.lock:
+            self.requests.append((path, dict(request.headers)))
+            responses = self.routes.get(path) or [(404, {}, b"")]
+            response = responses.pop(0) if len(responses) > 1 else responses[0]
+        if callable(response):
+            response = response(request.headers)
+        status, headers, body = response
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        if "Content-Length" not in headers:
+            request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def server():
+    stand_in = StandInServer()
+    yield stand_in
+    stand_in.close()
@@ -0,0 +1,64 @@
+import time
+
+from downloader import TokenBucket, download_all, make_session, request_with_backoff
+
+def fast_bucket():
+    return TokenBucket(rate=1000, capacity=10)
+
+def test_server_errors_are_retried(server):
+    server.route("/export", (503, {}, ""), (502, {}, ""), (200, {}, "1. e4 *"))
+    with make_session() as session:
+        status, response = request_with_backoff(session, fast_bucket(), f"{server.url}/export", backoff_base=0.01)
+        assert status == 200
+        assert response.text == "1. e4 *"
+    assert len(server.requests_to("/export")) == 3
+
+def test_client_errors_are_not_retried(server):
+    server.route("/missing", (404, {}, "not found"))
+    with make_session() as session:
+        status, response = request_with_backoff(session, fast_bucket(), f"{server.url}/missing", backoff_base=0.01)
+    assert (status, response) == (404, None)
+    assert len(server.requests_to("/missing")) == 1
+
+def test_retries_are_exhausted(server):
+    server.route("/down", (500, {}, ""))
+    with make_session() as session:
+        status, response = request_with_backoff(session, fast_bucket(), f"{server.url}/down", max_retries=3,
+                                                backoff_base=0.01)
+    assert (status, response) == (500, None)
+    assert len(server.requests_to("/down")) == 3
+
+def test_429_pauses_for_retry_after_and_slows_the_bucket(server):
+    server.route("/limited", (429, {"Retry-After": "0.3"}, ""), (200, {}, "ok"))
+    bucket = fast_bucket()
+    start = time.monotonic()
+    with make_session() as session:
+        status, response = request_with_backoff(session, bucket, f"{server.url}/limited", backoff_base=0.01)
+        assert status == 200
+        response.close()
+    assert time.monotonic() - start >= 0.3
+    # Halved by the 429, only nudged back up by the one success since
+    assert bucket.rate < bucket.max_rate
+
+def test_token_bucket_limits_the_request_rate():
+    bucket = TokenBucket(rate=20, capacity=1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # The first token is in the bucket; the other four refill at 20 per second
+    assert time.monotonic() - start >= 0.15
+
+def test_exhausted_jobs_are_retried_in_a_later_round(server):
+    server.route("/a", (200, {}, "a"))
+    server.route("/b", (500, {}, ""), (200, {}, "b"))
+    jobs = [(name, f"{server.url}/{name}", None, None) for name in "ab"]
+    results = {key: (status, text) for key, status, text in
+               download_all(jobs, max_workers=2, rate=1000, max_retries=1, retry_rounds=1, backoff_base=0.01)}
+    assert results == {"a": (200, "a"), "b": (200, "b")}
+    assert len(server.requests_to("/b")) == 2
+
+def test_jobs_failing_every_round_are_reported(server):
+    server.route("/gone", (500, {}, ""))
+    jobs = [("gone", f"{server.url}/gone", None, None)]
+    results = list(download_all(jobs, rate=1000, max_retries=1, retry_rounds=1, backoff_base=0.01))
+    assert results == [("gone", None, None)]
@@ -0,0 +1,105 @@
+import gzip
+import os
+
+import pytest
+
+from downloader import TokenBucket
+from http_fetch import TRANSPORT_ERRORS, AsyncFetcher
+
+PGN = '[Event "Study: Chapter 1"]\n\n1. e4 { Controls the centre. } e5 *\n'
+
+def make_fetcher(cache_dir, **options):
+    return AsyncFetcher(str(cache_dir), concurrency=2, bucket=TokenBucket(rate=1000, capacity=10), **options)
+
+def conditional(etag):
+    """Answers 304 to a request carrying `etag` as its validator and 200 otherwise."""
+    def respond(headers):
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag, "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}, PGN
+    return respond
+
+def test_unchanged_response_is_revalidated_and_served_from_cache(server, tmp_path):
+    server.route("/export", conditional('"v1"'))
+    with make_fetcher(tmp_path) as fetcher:
+        first = fetcher.get(f"{server.url}/export")
+        second = fetcher.get(f"{server.url}/export")
+    assert (first.from_cache, first.text) == (False, PGN)
+    assert (second.status, second.from_cache, second.text) == (200, True, PGN)
+    requests = server.requests_to("/export")
+    assert "If-None-Match" not in requests[0]
+    assert requests[1]["If-None-Match"] == '"v1"'
+    assert requests[1]["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+
+def test_gzipped_response_is_cached_as_sent(server, tmp_path):
+    body = gzip.compress(PGN.encode("utf-8"))
+    server.route("/export", (200, {"Content-Encoding": "gzip"}, body))
+    with make_fetcher(tmp_path) as fetcher:
+        response = fetcher.get(f"{server.url}/export")
+    assert response.text == PGN
+    with open(response.path, "rb") as file:
+        assert file.read() == body
+
+def test_fresh_entries_skip_the_request(server, tmp_path):
+    server.route("/export", conditional('"v1"'))
+    with make_fetcher(tmp_path, max_age=3600) as fetcher:
+        fetcher.get(f"{server.url}/export")
+        response = fetcher.get(f"{server.url}/export")
+    assert (response.from_cache, response.text) == (True, PGN)
+    assert len(server.requests_to("/export")) == 1
+
+def test_failed_request_serves_the_stale_copy(server, tmp_path):
+    server.route("/export", (200, {}, PGN), (503, {}, ""))
+    with make_fetcher(tmp_path, max_retries=1) as fetcher:
+        fetcher.get(f"{server.url}/export")
+        response = fetcher.get(f"{server.url}/export")
+    assert (response.from_cache, response.text) == (True, PGN)
+
+def test_failure_without_a_cached_copy(server, tmp_path):
+    server.route("/missing", (404, {}, ""))
+    with make_fetcher(tmp_path) as fetcher:
+        response = fetcher.get(f"{server.url}/missing")
+    assert (response.status, response.ok) == (404, False)
+
+def test_streamed_body_fills_the_cache_entry(server, tmp_path):
+    server.route("/export", conditional('"v1"'))
+    with make_fetcher(tmp_path) as fetcher:
+        response = fetcher.get(f"{server.url}/export", stream=True)
+        key = fetcher.cache.key(f"{server.url}/export")
+        assert response.body is not None and fetcher.cache.get(key) is None
+        with response.open_text() as text:
+            assert text.read() == PGN
+        cached = fetcher.get(f"{server.url}/export", stream=True)
+        assert (cached.from_cache, cached.text) == (True, PGN)
+    assert server.requests_to("/export")[1]["If-None-Match"] == '"v1"'
+
+def test_abandoned_stream_leaves_no_entry(server, tmp_path):
+    server.route("/export", (200, {}, PGN * 1000))
+    with make_fetcher(tmp_path) as fetcher:
+        response = fetcher.get(f"{server.url}/export", stream=True)
+        with response.open_text() as text:
+            text.read(100)
+        assert fetcher.cache.get(fetcher.cache.key(f"{server.url}/export")) is None
+    assert os.listdir(tmp_path) == []
+
+def test_streamed_export_is_parsed_and_cached(server, tmp_path):
+    from extract_user_studies import iter_commented_positions, stream_user_studies
+    server.route("/study/by/alice/export.pgn", conditional('"v1"'))
+    with make_fetcher(tmp_path) as fetcher:
+        for _ in range(2):
+            with stream_user_studies("alice", "token", server.url, fetcher) as pgn:
+                positions = list(iter_commented_positions(pgn))
+            assert [(position["Move"], position["Commentary"]) for position in positions] == \
+                [("e2e4", "Controls the centre.")]
+    assert len(server.requests_to("/study/by/alice/export.pgn")) == 2
+
+def test_cut_off_export_fails_the_run_and_leaves_no_entry(server, tmp_path):
+    from extract_user_studies import extract_streaming
+    body = (PGN + "\n") * 200
+    headers = {"Content-Length": str(len(body) * 2), "Connection": "close"}
+    server.route("/study/by/alice/export.pgn", (200, headers, body))
+    output = tmp_path / "studies.parquet"
+    with make_fetcher(tmp_path / "cache") as fetcher:
+        with pytest.raises(TRANSPORT_ERRORS):
+            extract_streaming(["alice"], "token", str(output), fetcher=fetcher, base_url=server.url)
+    assert os.listdir(tmp_path / "cache") == []
@@ -0,0 +1,23 @@
+import chess
+
+from first_preprocess import convert_to_san
+from move_service import MoveService, analyze_pair
+
+AFTER_E4 = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+def test_legal_and_illegal_moves():
+    assert analyze_pair(chess.STARTING_FEN, "g1f3") == (True, True, "Nf3", "N", False, False, False, None, 20)
+    assert analyze_pair(chess.STARTING_FEN, "e2e5")[:3] == (True, False, None)
+    assert analyze_pair(chess.STARTING_FEN, "garbage")[:3] == (True, False, None)
+    assert analyze_pair("not a fen", "e2e4")[:3] == (False, False, None)
+
+def test_null_moves_are_kept_as_passes():
+    assert analyze_pair(AFTER_E4, "0000", details=False)[:3] == (True, True, "--")
+    assert convert_to_san(AFTER_E4, "0000") == "--"
+
+def test_first_pass_and_service_agree():
+    fens = [chess.STARTING_FEN, chess.STARTING_FEN, AFTER_E4, AFTER_E4, "bad"]
+    moves = ["e2e4", "e1e2", "0000", "e7e5", "e2e4"]
+    with MoveService(workers=1) as service:
+        assert service.to_san(fens, moves) == [convert_to_san(fen, move) for fen, move in zip(fens, moves)] == \
+            ["e4", None, "--", "e5", None]
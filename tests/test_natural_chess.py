@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from natural_chess import COMMANDS, SCRIPT_DIR, main
+from stage_options import PARSERS
+
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "chess", "requests", "langdetect", "tokenizers"]
+
+def test_every_command_has_its_options():
+    assert {module for module, _ in COMMANDS.values()} == set(PARSERS)
+
+@pytest.mark.parametrize("command", sorted(COMMANDS))
+def test_help_exits_before_loading_the_stage(command, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main([command, "--help"])
+    assert exit.value.code == 0
+    assert f"natural-chess {command}" in capsys.readouterr().out
+
+def test_help_and_bad_arguments_import_nothing_heavy():
+    # A fresh interpreter, since the test session has already imported the stages
+    script = (
+        "import sys\n"
+        f"sys.path.insert(0, {SCRIPT_DIR!r})\n"
+        "from natural_chess import COMMANDS, main\n"
+        "for command in COMMANDS:\n"
+        "    for args in (['--help'], ['--no-such-option']):\n"
+        "        try:\n"
+        "            main([command, *args])\n"
+        "        except SystemExit:\n"
+        "            pass\n"
+        f"print(sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=os.getcwd(),
+                            check=True)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
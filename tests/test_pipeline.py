@@ -0,0 +1,34 @@
+import pytest
+
+import pipeline
+from pipeline import PipelineStage, default_stages, module_closure
+
+@pytest.fixture
+def scripts(tmp_path, monkeypatch):
+    """A stand-in script directory; `write(name, source)` adds a module to it."""
+    monkeypatch.setattr(pipeline, "SCRIPT_DIR", str(tmp_path))
+    pipeline.local_imports.cache_clear()
+    yield lambda name, source: (tmp_path / f"{name}.py").write_text(source)
+    pipeline.local_imports.cache_clear()
+
+def test_closure_follows_local_imports_including_lazy_ones(scripts):
+    scripts("stage", "import os\nfrom helpers import clean\n\ndef run():\n    import rules\n")
+    scripts("helpers", "import numpy as np\nimport data_io\n")
+    scripts("rules", "")
+    scripts("data_io", "")
+    assert module_closure(["stage"]) == ["data_io", "helpers", "rules", "stage"]
+
+def test_editing_an_imported_module_changes_the_cache_key(scripts, tmp_path):
+    scripts("stage", "import data_io\n")
+    scripts("data_io", "CHUNK = 1\n")
+    stage = PipelineStage("stage", print, code=["stage"])
+    before = stage.cache_key({})
+    scripts("data_io", "CHUNK = 2\n")
+    assert stage.cache_key({}) != before
+
+def test_default_stages_cover_their_helpers():
+    stages = {stage.name: stage.code for stage in default_stages(fused=True, min_score=0.5)}
+    assert {"data_io", "language_cache", "instrumentation", "filter_engine", "comment_rules"} <= \
+        set(stages["preprocess"])
+    assert {"position_encoding", "data_io", "dedup", "move_service"} <= set(stages["quality"])
+    assert "data_io" in stages["commentary_jsonl"]
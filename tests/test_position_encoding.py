@@ -0,0 +1,95 @@
+import random
+
+import chess
+import numpy as np
+import pytest
+
+from position_encoding import (decode_board, decode_fen, decode_fens, decode_move, encode_board, encode_positions,
+                               material_balance, piece_counts, position_keys, split_input)
+
+def random_positions(games=30, seed=0):
+    """(FEN, move) pairs from random legal games, covering castling, en passant and promotions."""
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(games):
+        board = chess.Board()
+        for _ in range(rng.randint(20, 200)):
+            legal = list(board.legal_moves)
+            if not legal:
+                break
+            move = rng.choice(legal)
+            pairs.append((board.fen(), move))
+            board.push(move)
+    return pairs
+
+def test_fens_and_moves_round_trip():
+    pairs = random_positions()
+    fens = [fen for fen, _ in pairs]
+    positions, valid = encode_positions(fens, moves=[move.uci() for _, move in pairs])
+    assert valid.all()
+    assert decode_fens(positions) == fens
+    assert [decode_move(record) for record in positions] == [move for _, move in pairs]
+
+def test_san_input_round_trips():
+    board = chess.Board("r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    moves = list(board.legal_moves)
+    positions, valid = encode_positions([board.fen()] * len(moves), sans=[board.san(move) for move in moves])
+    assert valid.all()
+    assert [decode_move(record) for record in positions] == moves
+    assert decode_fen(positions[0]) == board.fen()
+
+def test_en_passant_square_is_kept():
+    fen = "rnbqkbnr/ppp1pppp/8/8/3pP3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 3"
+    record = encode_board(chess.Board(fen))
+    assert decode_fen(record) == fen
+    # The FEN-style en passant square survives even when no capture is possible
+    quiet = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
+    assert decode_fen(encode_board(chess.Board(quiet)), en_passant="fen") == quiet
+
+def test_null_move_decodes_as_null():
+    board = chess.Board()
+    record = encode_board(board, chess.Move.null())
+    move = decode_move(record)
+    assert move == chess.Move.null()
+    assert move.uci() == "0000"
+    positions, valid = encode_positions([board.fen()], moves=["0000"])
+    assert valid.all()
+    assert decode_move(positions[0]) == chess.Move.null()
+    assert decode_move(encode_board(board)) is None
+
+def test_chess960_castling_rights_are_rejected():
+    shredder = "bqnb1rkr/pp3ppp/3ppn2/2p5/5P2/P2P4/NPP1P1PP/BQ1BNRKR w HFhf - 2 9"
+    positions, valid = encode_positions([shredder, chess.STARTING_FEN], moves=["e2e4", "e2e4"])
+    assert valid.tolist() == [False, True]
+    assert positions[0].tobytes() == bytes(positions.dtype.itemsize)
+
+    with pytest.raises(ValueError):
+        encode_board(chess.Board.from_chess960_pos(0))
+
+def test_standard_rights_on_a_chess960_board_are_kept():
+    board = chess.Board(chess.STARTING_FEN, chess960=True)
+    assert decode_board(encode_board(board)).fen() == board.fen()
+
+def test_vectorized_features_match_python_chess():
+    pairs = random_positions(games=5, seed=1)
+    positions, _ = encode_positions([fen for fen, _ in pairs])
+    counts = piece_counts(positions)
+    values = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9, chess.KING: 0}
+    for (fen, _), count, balance in zip(pairs, counts, material_balance(positions)):
+        board = chess.Board(fen)
+        for color in chess.COLORS:
+            for piece_type in chess.PIECE_TYPES:
+                assert count[int(color)][piece_type - 1] == len(board.pieces(piece_type, color))
+        assert balance == sum(values[piece.piece_type] * (1 if piece.color else -1)
+                              for piece in board.piece_map().values())
+
+def test_position_keys_ignore_move_counters():
+    start = chess.Board()
+    later = chess.Board(start.fen().replace(" 0 1", " 8 5"))
+    positions, _ = encode_positions([start.fen(), later.fen()])
+    keys = position_keys(positions)
+    assert keys[0] == keys[1]
+    assert len(np.unique(position_keys(encode_positions([start.fen(), "8/8/8/8/8/8/8/K1k5 w - - 0 1"])[0]))) == 2
+
+def test_split_input():
+    assert split_input(f"{chess.STARTING_FEN} e4 ") == (chess.STARTING_FEN, "e4")
@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+from token_dataset import TokenDataset, build_token_dataset, pack_records
+
+class WordTokenizer:
+    """Offline stand-in for a Hugging Face tokenizer: one id per whitespace-separated word."""
+
+    name_or_path = "word-tokenizer"
+    eos_token_id = 1
+
+    def __init__(self):
+        self.vocab = {"<pad>": 0, "</s>": 1}
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def __call__(self, texts, add_special_tokens=False):
+        return {"input_ids": [[self.vocab.setdefault(word, len(self.vocab)) for word in text.split()]
+                              for text in texts]}
+
+RECORDS = [
+    {"instruction": "analyse this", "input": "fen one e4", "response": "a strong central move"},
+    {"instruction": "analyse this", "input": "fen two Nf3", "response": ""},
+    {"instruction": "analyse", "input": "fen three", "response": "white is better here because"},
+]
+
+def write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+
+def test_records_round_trip(tmp_path):
+    write_jsonl(tmp_path / "data.jsonl", RECORDS)
+    tokenizer = WordTokenizer()
+    meta = build_token_dataset(str(tmp_path / "data.jsonl"), str(tmp_path / "tokens"), tokenizer, batch_size=2)
+    assert meta["dtype"] == "uint16"
+
+    dataset = TokenDataset(str(tmp_path / "tokens"))
+    assert len(dataset) == len(RECORDS)
+    for i, record in enumerate(RECORDS):
+        fields = dataset[i]
+        for field in ("instruction", "input", "response"):
+            assert fields[field].tolist() == tokenizer([record[field]])["input_ids"][0]
+        # Records are views into the memory-mapped tokens, not copies
+        assert np.shares_memory(fields["input"], dataset.tokens)
+
+def test_packs_join_records_with_eos(tmp_path):
+    write_jsonl(tmp_path / "data.jsonl", RECORDS)
+    build_token_dataset(str(tmp_path / "data.jsonl"), str(tmp_path / "tokens"), WordTokenizer(), pack_length=12)
+    dataset = TokenDataset(str(tmp_path / "tokens"))
+
+    packed = [dataset.pack(i).tolist() for i in range(len(dataset.packs))]
+    expected = [token for i in range(len(dataset)) for token in dataset.record_tokens(i).tolist() + [1]]
+    assert [token for pack in packed for token in pack] == expected
+    # Only an oversized record may exceed the pack length, and then it is alone in its pack
+    for (start, end), pack in zip(dataset.packs, packed):
+        assert len(pack) <= 12 or end - start == 1
+
+def test_pack_records_is_greedy_and_in_order():
+    assert pack_records([4, 4, 4, 10, 1], 8).tolist() == [[0, 2], [2, 3], [3, 4], [4, 5]]
+    assert pack_records([], 8).shape == (0, 2)
+
+def test_empty_dataset(tmp_path):
+    write_jsonl(tmp_path / "empty.jsonl", [])
+    meta = build_token_dataset(str(tmp_path / "empty.jsonl"), str(tmp_path / "tokens"), WordTokenizer(),
+                               pack_length=16)
+    assert meta["records"] == meta["tokens"] == 0
+
+    dataset = TokenDataset(str(tmp_path / "tokens"))
+    assert len(dataset) == 0
+    assert len(dataset.tokens) == 0
+    assert len(dataset.packs) == 0
+
+def test_shard_directories_rebuild_the_instruction(tmp_path):
+    pd = pytest.importorskip("pandas")
+    from colab_preprocess import build_instruction, export_commentary_shards
+    from data_io import write_table
+
+    write_table(pd.DataFrame({"Input": ["fen one e4", "fen two d4"], "Output": ["a good move", "also good"],
+                              "SAN_Move": ["e4", "d4"]}), str(tmp_path / "commentary.parquet"))
+    export_commentary_shards(str(tmp_path / "commentary.parquet"), str(tmp_path / "shards"), max_shard_bytes=40)
+    tokenizer = WordTokenizer()
+    build_token_dataset(str(tmp_path / "shards"), str(tmp_path / "tokens"), tokenizer)
+
+    dataset = TokenDataset(str(tmp_path / "tokens"))
+    assert len(dataset) == 2
+    assert dataset[1]["instruction"].tolist() == tokenizer([build_instruction("fen two d4")])["input_ids"][0]